@@ -0,0 +1,278 @@
+import numpy as np
+from changelog import get_follower, fetch_in_chunks
+
+FORM_LENGTH = 5
+RECENT_MEETINGS = 10
+
+# Matches with a parseable date, two different teams and a result. The
+# parsed columns come from migration 0005.
+MATCH_QUERY = '''
+    SELECT id, CAST(julianday(date) - 2440587.5 AS INTEGER), home_team, away_team,
+           home_goals, away_goals, location
+    FROM match
+    WHERE home_goals IS NOT NULL AND away_team IS NOT NULL
+      AND home_team <> away_team AND julianday(date) IS NOT NULL
+'''
+
+
+class Names:
+    # Interns strings to small integer ids so the arrays only hold numbers.
+    def __init__(self, names=()):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+    def copy(self):
+        return Names(self.names)
+
+    def ids(self, values):
+        index = self.index
+        result = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            found = index.get(value)
+            if found is None:
+                found = index[value] = len(self.names)
+                self.names.append(value)
+            result[i] = found
+        return result
+
+
+def _points(goals_for, goals_against):
+    return np.where(goals_for > goals_against, 3, np.where(goals_for == goals_against, 1, 0))
+
+
+def _record(goals_for, goals_against):
+    return {
+        'played': int(len(goals_for)),
+        'won': int(np.count_nonzero(goals_for > goals_against)),
+        'drawn': int(np.count_nonzero(goals_for == goals_against)),
+        'lost': int(np.count_nonzero(goals_for < goals_against)),
+        'goals_for': int(goals_for.sum()),
+        'goals_against': int(goals_against.sum()),
+        'points': int(_points(goals_for, goals_against).sum()),
+    }
+
+
+class MatchArrays:
+    # Column-wise copy of the counted matches. Instances are never modified
+    # after construction, so a request can keep using one while a newer
+    # copy is built.
+    def __init__(self, teams, locations, ids, days, home, away,
+                 home_goals, away_goals, location):
+        self.teams = teams
+        self.locations = locations
+        self.ids = ids
+        self.days = days
+        self.home = home
+        self.away = away
+        self.home_goals = home_goals
+        self.away_goals = away_goals
+        self.location = location
+        self._summarize()
+
+    @classmethod
+    def from_rows(cls, rows, teams=None, locations=None):
+        teams = teams or Names()
+        locations = locations or Names()
+        if not rows:
+            empty = np.empty(0, dtype=np.int32)
+            return cls(teams, locations, empty.astype(np.int64), empty, empty, empty,
+                       empty.astype(np.int16), empty.astype(np.int16), empty)
+        ids, days, home, away, home_goals, away_goals, location = zip(*rows)
+        return cls(teams, locations,
+                   np.array(ids, dtype=np.int64),
+                   np.array(days, dtype=np.int32),
+                   teams.ids(home), teams.ids(away),
+                   np.array(home_goals, dtype=np.int16),
+                   np.array(away_goals, dtype=np.int16),
+                   locations.ids([value or '' for value in location]))
+
+    @classmethod
+    def load(cls, con):
+        rows = con.execute(f'{MATCH_QUERY} /* full-scan: analytics load every match */')
+        return cls.from_rows(rows.fetchall())
+
+    def patch(self, con, match_ids):
+        return self.replace(match_ids, fetch_in_chunks(
+            con, MATCH_QUERY + ' AND id IN ({marks})', match_ids))
+
+    def replace(self, match_ids, rows):
+        # New copy without match_ids and with their current rows appended;
+        # deleted or no longer counted matches simply have no row.
+        keep = ~np.isin(self.ids, np.fromiter(match_ids, dtype=np.int64))
+        added = MatchArrays.from_rows(rows, self.teams.copy(), self.locations.copy())
+        return MatchArrays(
+            added.teams, added.locations,
+            *(np.concatenate([getattr(self, name)[keep], getattr(added, name)])
+              for name in ('ids', 'days', 'home', 'away', 'home_goals',
+                           'away_goals', 'location')))
+
+    def _summarize(self):
+        # Home and away totals for every team at once.
+        n = len(self.teams.names)
+        hg = self.home_goals.astype(np.int64)
+        ag = self.away_goals.astype(np.int64)
+        self.split = {}
+        for side, team, gf, ga in (('home', self.home, hg, ag), ('away', self.away, ag, hg)):
+            self.split[side] = {
+                'played': np.bincount(team, minlength=n),
+                'won': np.bincount(team, weights=gf > ga, minlength=n),
+                'drawn': np.bincount(team, weights=gf == ga, minlength=n),
+                'lost': np.bincount(team, weights=gf < ga, minlength=n),
+                'goals_for': np.bincount(team, weights=gf, minlength=n),
+                'goals_against': np.bincount(team, weights=ga, minlength=n),
+                'points': np.bincount(team, weights=_points(gf, ga), minlength=n),
+            }
+
+        # Per team and calendar year, for the trend table.
+        years = self.days.astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64) + 1970
+        self.first_year = int(years.min()) if len(years) else 0
+        seasons = int(years.max()) - self.first_year + 1 if len(years) else 0
+        self.seasons = seasons
+        season = years - self.first_year
+        size = n * seasons
+        self.trend = {'played': np.zeros(size), 'goals_for': np.zeros(size),
+                      'goals_against': np.zeros(size), 'points': np.zeros(size)}
+        for team, gf, ga in ((self.home, hg, ag), (self.away, ag, hg)):
+            cell = team.astype(np.int64) * seasons + season
+            self.trend['played'] += np.bincount(cell, minlength=size)
+            self.trend['goals_for'] += np.bincount(cell, weights=gf, minlength=size)
+            self.trend['goals_against'] += np.bincount(cell, weights=ga, minlength=size)
+            self.trend['points'] += np.bincount(cell, weights=_points(gf, ga), minlength=size)
+        for key in self.trend:
+            self.trend[key] = self.trend[key].reshape(n, seasons) if n else self.trend[key]
+
+    def team_id(self, name):
+        team = self.teams.index.get(name)
+        if team is None or team >= len(self.split['home']['played']):
+            return None
+        if not self.split['home']['played'][team] and not self.split['away']['played'][team]:
+            return None
+        return team
+
+    def _team_view(self, team):
+        # Every match of the team in date order, from the team's side.
+        at_home = self.home == team
+        mask = at_home | (self.away == team)
+        order = np.lexsort((self.ids[mask], self.days[mask]))
+        home = at_home[mask][order]
+        hg = self.home_goals[mask][order].astype(np.int64)
+        ag = self.away_goals[mask][order].astype(np.int64)
+        return {
+            'ids': self.ids[mask][order],
+            'days': self.days[mask][order],
+            'home': home,
+            'goals_for': np.where(home, hg, ag),
+            'goals_against': np.where(home, ag, hg),
+            'opponent': np.where(home, self.away[mask][order], self.home[mask][order]),
+            'location': self.location[mask][order],
+        }
+
+    def team_report(self, name, form_length=FORM_LENGTH):
+        team = self.team_id(name)
+        if team is None:
+            return None
+        view = self._team_view(team)
+        gf, ga = view['goals_for'], view['goals_against']
+        points = _points(gf, ga)
+
+        splits = {}
+        for side in ('home', 'away'):
+            splits[side] = {key: int(values[team]) for key, values in self.split[side].items()}
+        total = {key: splits['home'][key] + splits['away'][key] for key in splits['home']}
+
+        recent = slice(max(len(points) - form_length, 0), None)
+        form = [{'match_id': int(match_id), 'date': str(np.datetime64(int(day), 'D')),
+                 'opponent': self.teams.names[opponent], 'home': bool(home),
+                 'goals_for': int(f), 'goals_against': int(a),
+                 'outcome': 'V' if f > a else 'T' if f == a else 'H'}
+                for match_id, day, opponent, home, f, a in zip(
+                    view['ids'][recent], view['days'][recent], view['opponent'][recent],
+                    view['home'][recent], gf[recent], ga[recent])]
+        form.reverse()
+        window = min(form_length, len(points))
+        rolling = np.convolve(points, np.ones(window) / window, 'valid') if window else points
+
+        trends = []
+        played = self.trend['played'][team]
+        for season in np.flatnonzero(played):
+            count = played[season]
+            trends.append({
+                'season': self.first_year + int(season),
+                'played': int(count),
+                'goals_for': self.trend['goals_for'][team][season] / count,
+                'goals_against': self.trend['goals_against'][team][season] / count,
+                'points': self.trend['points'][team][season] / count,
+            })
+
+        venues = []
+        locations = view['location']
+        venue_played = np.bincount(locations, minlength=len(self.locations.names))
+        venue_won = np.bincount(locations, weights=gf > ga, minlength=len(venue_played))
+        venue_drawn = np.bincount(locations, weights=gf == ga, minlength=len(venue_played))
+        for location in np.argsort(-venue_played, kind='stable'):
+            count = venue_played[location]
+            if not count:
+                break
+            if not self.locations.names[location]:
+                continue
+            venues.append({'location': self.locations.names[location], 'played': int(count),
+                           'win': venue_won[location] / count,
+                           'draw': venue_drawn[location] / count,
+                           'loss': 1 - (venue_won[location] + venue_drawn[location]) / count})
+
+        opponents = []
+        opponent = view['opponent']
+        n = len(self.teams.names)
+        opp_played = np.bincount(opponent, minlength=n)
+        opp_won = np.bincount(opponent, weights=gf > ga, minlength=n)
+        opp_drawn = np.bincount(opponent, weights=gf == ga, minlength=n)
+        for other in np.argsort(-opp_played, kind='stable'):
+            count = opp_played[other]
+            if not count:
+                break
+            opponents.append({'team': self.teams.names[other], 'played': int(count),
+                              'won': int(opp_won[other]), 'drawn': int(opp_drawn[other]),
+                              'lost': int(count - opp_won[other] - opp_drawn[other])})
+
+        return {
+            'team': name,
+            'total': total,
+            'splits': splits,
+            'form': form,
+            'form_points': float(rolling[-1]) if len(rolling) else 0.0,
+            'rolling': [float(value) for value in rolling[-50:]],
+            'trends': trends,
+            'venues': venues,
+            'opponents': opponents,
+        }
+
+    def head_to_head(self, name, other_name, recent=RECENT_MEETINGS):
+        team, other = self.team_id(name), self.team_id(other_name)
+        if team is None or other is None or team == other:
+            return None
+        team_home = (self.home == team) & (self.away == other)
+        other_home = (self.home == other) & (self.away == team)
+        hg = self.home_goals.astype(np.int64)
+        ag = self.away_goals.astype(np.int64)
+
+        venues = {
+            'home': _record(hg[team_home], ag[team_home]),
+            'away': _record(ag[other_home], hg[other_home]),
+        }
+        total = {key: venues['home'][key] + venues['away'][key] for key in venues['home']}
+
+        mask = team_home | other_home
+        order = np.lexsort((self.ids[mask], self.days[mask]))[::-1][:recent]
+        meetings = [{'match_id': int(match_id), 'date': str(np.datetime64(int(day), 'D')),
+                     'home_team': self.teams.names[home], 'away_team': self.teams.names[away],
+                     'home_goals': int(h), 'away_goals': int(a)}
+                    for match_id, day, home, away, h, a in zip(
+                        self.ids[mask][order], self.days[mask][order],
+                        self.home[mask][order], self.away[mask][order],
+                        self.home_goals[mask][order], self.away_goals[mask][order])]
+        return {'team': name, 'other': other_name, 'total': total,
+                'venues': venues, 'meetings': meetings}
+
+
+def get_analytics(database):
+    return get_follower(database, 'analytics', MatchArrays.load, MatchArrays.patch)
@@ -0,0 +1,231 @@
+import hashlib
+import json
+from flask import Blueprint, Response, request
+from pagination import encode_cursor, decode_cursor
+from counters import get_counter
+from cache import tag_versions
+from facets import parse_filters, filter_sql
+from archive import get_archives, seek_archives, find_match, qualify, by_source
+
+MAX_IDS = 100
+MAX_ID = 2**63 - 1
+MAX_LIMIT = 100
+
+# Field name -> SQL expression. categories is filled in separately.
+MATCH_FIELDS = {
+    'id': 'match.id',
+    'title': 'match.title',
+    'description': 'match.description',
+    'date': 'match.date',
+    'opponent': 'match.opponent',
+    'result': 'match.result',
+    'location': 'match.location',
+    'owner_id': 'match.owner_id',
+    'username': 'user.username',
+    'home_team': 'match.home_team',
+    'away_team': 'match.away_team',
+    'home_goals': 'match.home_goals',
+    'away_goals': 'match.away_goals',
+    'season': 'match.season',
+    'comments': '''(SELECT value FROM counter WHERE scope = 'match_comment'
+                    AND key = match.id)''',
+    'categories': None,
+}
+DEFAULT_FIELDS = ('id', 'title', 'date', 'opponent', 'result', 'location',
+                  'owner_id', 'username')
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _json(data, status=200):
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return Response(body, status=status, mimetype='application/json')
+
+
+def _fields():
+    value = request.args.get('fields')
+    if not value:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in MATCH_FIELDS]
+    if unknown:
+        raise ApiError(400, f'unknown fields: {", ".join(unknown)}')
+    return fields
+
+
+def _ids(value):
+    try:
+        ids = list(dict.fromkeys(int(part) for part in value.split(',') if part.strip()))
+    except ValueError as error:
+        raise ApiError(400, 'ids must be integers') from error
+    if not ids or len(ids) > MAX_IDS:
+        raise ApiError(400, f'give 1-{MAX_IDS} ids')
+    if any(not -MAX_ID <= match_id <= MAX_ID for match_id in ids):
+        # SQLite integers are 64-bit; larger values cannot be bound.
+        raise ApiError(400, 'ids out of range')
+    return ids
+
+
+def _select(fields):
+    # id and date are always read, the cursor and categories need them.
+    columns = dict.fromkeys(('id', 'date', *fields))
+    columns.pop('categories', None)
+    return 'SELECT ' + ', '.join(f'{MATCH_FIELDS[name]} AS {name}' for name in columns) + '''
+        FROM match
+        JOIN user ON match.owner_id = user.id
+    '''
+
+
+def _serialize(db, rows, fields):
+    # rows may come from the main database and from archives, see
+    # archive.by_source().
+    categories = {}
+    if 'categories' in fields:
+        for source, ids in by_source(rows).items():
+            marks = ', '.join('?' * len(ids))
+            for match_id, name in db.execute(qualify(f'''
+                SELECT match_category.match_id, category.name
+                FROM match_category
+                JOIN category ON category.id = match_category.category_id
+                WHERE match_category.match_id IN ({marks})
+            ''', source), ids):
+                categories.setdefault(match_id, []).append(name)
+        for names in categories.values():
+            names.sort()
+    items = []
+    for row in rows:
+        item = {}
+        for name in fields:
+            if name == 'categories':
+                item[name] = categories.get(row['id'], [])
+            elif name == 'comments':
+                item[name] = row[name] or 0
+            else:
+                item[name] = row[name]
+        items.append(item)
+    return items
+
+
+def init_api(app, get_db):
+    # Read-only JSON for integrations. Responses carry an ETag built from
+    # the cache tag versions (migrations/0007_cache_tags.sql) the data
+    # depends on, so an unchanged resource is answered with 304 Not
+    # Modified after a single indexed lookup.
+    api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+    def conditional(tags, build):
+        db = get_db(readonly=True)
+        versions = tag_versions(db, tags)
+        key = json.dumps([request.full_path, sorted(versions.items())])
+        etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = build(db)
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
+
+    @api.errorhandler(ApiError)
+    def api_error(error):
+        return _json({'error': error.message}, error.status)
+
+    @api.route('/matches')
+    def matches():
+        fields = _fields()
+        if request.args.get('ids') is not None:
+            ids = _ids(request.args['ids'])
+
+            def build(db):
+                marks = ', '.join('?' * len(ids))
+                rows = db.execute(f'{_select(fields)} WHERE match.id IN ({marks})',
+                                  ids).fetchall()
+                found = {row['id']: row for row in rows}
+                # Ids not in the main database may be archived.
+                archives = get_archives(db)
+                archived = {}
+                for match_id in ids:
+                    if match_id not in found:
+                        schema = find_match(db, archives, match_id)
+                        if schema:
+                            archived.setdefault(schema, []).append(match_id)
+                for schema, schema_ids in archived.items():
+                    marks = ', '.join('?' * len(schema_ids))
+                    for row in db.execute(qualify(f'{_select(fields)} WHERE match.id IN ({marks})',
+                                                  schema), schema_ids):
+                        found[row['id']] = dict(row, archive=schema)
+                items = _serialize(db, [found[i] for i in ids if i in found], fields)
+                return _json({'matches': items,
+                              'missing': [i for i in ids if i not in found]})
+            return conditional([f'match:{i}' for i in ids], build)
+
+        limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_LIMIT)
+        cursor = decode_cursor(request.args.get('cursor'))
+        if request.args.get('cursor') and cursor is None:
+            raise ApiError(400, 'invalid cursor')
+        filters = parse_filters(request.args)
+        where, params = filter_sql(filters)
+        page, key = cursor or (1, None)
+
+        dates = (filters.get('date_from'), filters.get('date_to'))
+
+        def page_rows(db, select):
+            return seek_archives(db, get_archives(db), select, where, params,
+                                 ('match.date', 'match.id'), key, nullable=True,
+                                 limit=limit, dates=dates)
+
+        def build(db):
+            rows, more = page_rows(db, _select(fields))
+            next_cursor = None
+            if more:
+                next_cursor = encode_cursor(page + 1, [rows[-1]['date'], rows[-1]['id']])
+            return _json({'matches': _serialize(db, rows, fields),
+                          'next_cursor': next_cursor})
+
+        tags = ['listing']
+        if 'comments' in fields or 'categories' in fields:
+            # Comments and category links bump only the tag of their match,
+            # so the ETag also covers every match on the page.
+            rows, _ = page_rows(get_db(readonly=True), _select(()))
+            tags += [f"match:{row['id']}" for row in rows]
+        return conditional(tags, build)
+
+    @api.route('/matches/<int:match_id>')
+    def match(match_id):
+        fields = _fields()
+
+        def build(db):
+            row = db.execute(f'{_select(fields)} WHERE match.id = ?', (match_id,)).fetchone()
+            if row is None:
+                schema = find_match(db, get_archives(db), match_id)
+                if schema:
+                    row = db.execute(qualify(f'{_select(fields)} WHERE match.id = ?', schema),
+                                     (match_id,)).fetchone()
+                    row = dict(row, archive=schema)
+            if row is None:
+                raise ApiError(404, 'match not found')
+            return _json(_serialize(db, [row], fields)[0])
+        return conditional([f'match:{match_id}'], build)
+
+    @api.route('/users/<int:user_id>')
+    def user(user_id):
+        def build(db):
+            row = db.execute('SELECT id, username FROM user WHERE id = ?',
+                             (user_id,)).fetchone()
+            if row is None:
+                raise ApiError(404, 'user not found')
+            stats = {scope: get_counter(db, scope, user_id)
+                     for scope in ('user_match', 'user_comment', 'user_home_win',
+                                   'user_draw', 'user_away_win')}
+            return _json({'id': row['id'], 'username': row['username'],
+                          'matches': stats['user_match'], 'comments': stats['user_comment'],
+                          'home_wins': stats['user_home_win'], 'draws': stats['user_draw'],
+                          'away_wins': stats['user_away_win']})
+        return conditional([f'user:{user_id}'], build)
+
+    app.register_blueprint(api)
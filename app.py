@@ -1,54 +1,304 @@
 import sys
 import os
-import sqlite3
+import time
+import argparse
 import secrets
-from flask import Flask, session, g
+from flask import Flask, request, session
 import config
+import db as database
 from routes import init_routes
+from api import init_api
+from metrics import init_metrics
+from slowlog import init_slow_log, report as slow_query_report
+from search import rebuild_search_index
+from counters import (check_counters, repair_counters, check_standings, repair_standings,
+                      check_user_teams, repair_user_teams)
+from migrations import migrate, schema_version
+from importer import run_import, detect_format, CHUNK_SIZE
+from exporter import export
+from warmup import init_bytecode_cache, warm
+from archive import get_archives, attach, archive_seasons, BATCH_SIZE
+from facets import DATE_RE
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = getattr(
-    config, 'SECRET_KEY', os.environ.get('SECRET_KEY', 'dev-secret-key'))
-app.config['DATABASE'] = getattr(
-    config, 'DATABASE', os.environ.get('DATABASE', 'database.db'))
 
+def get_db(readonly=False):
+    return database.get_connection(readonly)
 
-def get_db():
-    if 'db' not in g:
-        g.db = sqlite3.connect(app.config['DATABASE'])
-        g.db.row_factory = sqlite3.Row
-    return g.db
 
+def close_db(error=None):
+    database.release_connections(error)
 
-@app.teardown_appcontext
-def close_db(error=None):  # pylint: disable=unused-argument
-    db = g.pop('db', None)
-    if db is not None:
-        db.close()
 
-
-@app.before_request
 def csrf_protect():
+    # The API is read-only and has no session.
+    if request.blueprint == 'api_v1':
+        return
     if 'csrf_token' not in session:
         session['csrf_token'] = secrets.token_hex(16)
 
 
-init_routes(app, get_db)
+def create_app(overrides=None, warm_up=None):
+    # Builds the app from config.py and overrides. Servers should create
+    # their app with this in every worker (gunicorn 'app:create_app()'),
+    # so the worker is warmed up before it takes its first request.
+    started = time.perf_counter()
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = getattr(
+        config, 'SECRET_KEY', os.environ.get('SECRET_KEY', 'dev-secret-key'))
+    app.config['DATABASE'] = getattr(
+        config, 'DATABASE', os.environ.get('DATABASE', 'database.db'))
+    app.config['SQLITE_PRAGMAS'] = getattr(config, 'SQLITE_PRAGMAS', None)
+    app.config['DB_READ_POOL_SIZE'] = getattr(config, 'DB_READ_POOL_SIZE', 8)
+    app.config['DB_WRITE_POOL_SIZE'] = getattr(config, 'DB_WRITE_POOL_SIZE', 4)
+    app.config['DB_POOL_TIMEOUT'] = getattr(config, 'DB_POOL_TIMEOUT', 10)
+    app.config['DB_POOL_MAX_AGE'] = getattr(config, 'DB_POOL_MAX_AGE', 600)
+    app.config['DB_POOL_HEALTH_CHECK'] = getattr(config, 'DB_POOL_HEALTH_CHECK', 30)
+    app.config['CACHE_ENABLED'] = getattr(config, 'CACHE_ENABLED', True)
+    app.config['CACHE_MAX_BYTES'] = getattr(config, 'CACHE_MAX_BYTES', 32 * 1024 * 1024)
+    app.config['CACHE_BACKEND'] = getattr(config, 'CACHE_BACKEND', None)
+    app.config['CACHE_PATH'] = getattr(config, 'CACHE_PATH', 'cache.db')
+    app.config['COMMENT_POLL_DELAY'] = getattr(config, 'COMMENT_POLL_DELAY', 5)
+    app.config['COMMENT_POLL_MAX_WAIT'] = getattr(config, 'COMMENT_POLL_MAX_WAIT', 0)
+    app.config['COMMENT_POLL_INTERVAL'] = getattr(config, 'COMMENT_POLL_INTERVAL', 1)
+    app.config['WRITE_QUEUE_ENABLED'] = getattr(config, 'WRITE_QUEUE_ENABLED', False)
+    app.config['WRITE_QUEUE_MODE'] = getattr(config, 'WRITE_QUEUE_MODE', 'wait')
+    app.config['WRITE_QUEUE_MAX_BATCH'] = getattr(config, 'WRITE_QUEUE_MAX_BATCH', 200)
+    app.config['WRITE_QUEUE_MAX_DELAY'] = getattr(config, 'WRITE_QUEUE_MAX_DELAY', 0.002)
+    app.config['WRITE_QUEUE_TIMEOUT'] = getattr(config, 'WRITE_QUEUE_TIMEOUT', 10)
+    app.config['PASSWORD_HASH_METHOD'] = getattr(config, 'PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    app.config['PASSWORD_HASH_WORKERS'] = getattr(config, 'PASSWORD_HASH_WORKERS', 2)
+    app.config['PASSWORD_HASH_QUEUE'] = getattr(config, 'PASSWORD_HASH_QUEUE', 16)
+    app.config['PASSWORD_HASH_TIMEOUT'] = getattr(config, 'PASSWORD_HASH_TIMEOUT', 5)
+    app.config['LOGIN_ATTEMPTS_PER_USER'] = getattr(config, 'LOGIN_ATTEMPTS_PER_USER', 10)
+    app.config['LOGIN_ATTEMPTS_PER_IP'] = getattr(config, 'LOGIN_ATTEMPTS_PER_IP', 50)
+    app.config['LOGIN_ATTEMPT_WINDOW'] = getattr(config, 'LOGIN_ATTEMPT_WINDOW', 300)
+    app.config['LISTING_INDEX_ENABLED'] = getattr(config, 'LISTING_INDEX_ENABLED', False)
+    app.config['METRICS_ENABLED'] = getattr(config, 'METRICS_ENABLED', True)
+    app.config['SLOW_QUERY_LOG'] = getattr(config, 'SLOW_QUERY_LOG', None)
+    app.config['SLOW_QUERY_THRESHOLD'] = getattr(config, 'SLOW_QUERY_THRESHOLD', 0.1)
+    app.config['SLOW_QUERY_SAMPLE'] = getattr(config, 'SLOW_QUERY_SAMPLE', 1.0)
+    app.config['SLOW_QUERY_MAX_PER_MINUTE'] = getattr(config, 'SLOW_QUERY_MAX_PER_MINUTE', 60)
+    app.config['WARM_UP'] = getattr(config, 'WARM_UP', True)
+    app.config['WARM_UP_PATHS'] = getattr(config, 'WARM_UP_PATHS', ('/matches', '/standings',
+                                                                    '/login', '/register'))
+    app.config['JINJA_CACHE_DIR'] = getattr(config, 'JINJA_CACHE_DIR', '.jinja_cache')
+    app.config['ARCHIVE_DIR'] = getattr(config, 'ARCHIVE_DIR', 'archive')
+
+    app.config.update(overrides or {})
+
+    app.teardown_appcontext(close_db)
+    app.before_request(csrf_protect)
+    init_bytecode_cache(app)
+    init_metrics(app)
+    init_slow_log(app)
+    init_routes(app, get_db)
+    init_api(app, get_db)
 
+    report = {}
+    if app.config['WARM_UP'] if warm_up is None else warm_up:
+        report = warm(app)
+    report['startup_seconds'] = round(time.perf_counter() - started, 4)
+    app.extensions['startup'] = report
+    return app
 
-def init_db():
+
+def init_db(app):
     with app.app_context():
         db = get_db()
         with open('schema.sql', encoding='utf-8') as f:
             db.executescript(f.read())
         db.commit()
+        migrate(db)
     print('Database initialized (created tables)')
 
 
-if __name__ == '__main__':
+def migrate_db(app):
+    with app.app_context():
+        db = get_db()
+        for version, name in migrate(db):
+            print(f'Applied migration {version:04d} {name}')
+        print(f'Database schema is at version {schema_version(db)}')
+
+
+def rebuild_search(app):
+    with app.app_context():
+        db = get_db()
+        migrate(db)
+        rebuild_search_index(db)
+    print('Search index rebuilt')
+
+
+def check_db_counters(app, repair=False):
+    with app.app_context():
+        db = get_db()
+        # Archived matches still count, so their archives are checked too.
+        schemas = [attach(db, archive, readonly=False) for archive in get_archives(db)]
+        problems = check_counters(db, schemas)
+        for scope, key, stored, expected in problems:
+            print(f'{scope}[{key}]: stored {stored}, expected {expected}')
+        standings = check_standings(db, schemas)
+        for key, stored, expected in standings:
+            print(f'standing{list(key)}: stored {stored}, expected {expected}')
+        user_teams = check_user_teams(db, schemas)
+        for key, stored, expected in user_teams:
+            print(f'user_team{list(key)}: stored {stored}, expected {expected}')
+        if problems and repair:
+            repair_counters(db, schemas)
+            print(f'Repaired {len(problems)} counters')
+        if standings and repair:
+            repair_standings(db, schemas)
+            print(f'Repaired {len(standings)} standings rows')
+        if user_teams and repair:
+            repair_user_teams(db, schemas)
+            print(f'Repaired {len(user_teams)} user team rows')
+        if not problems and not standings and not user_teams:
+            print('Counters and standings are consistent')
+    return not (problems or standings or user_teams) or repair
+
+
+def import_file(app, argv):
+    parser = argparse.ArgumentParser(prog='app.py import')
+    parser.add_argument('file')
+    parser.add_argument('--owner', required=True, help='username of the owner')
+    parser.add_argument('--format', choices=('csv', 'ndjson'))
+    parser.add_argument('--job', help='resume key, defaults to the file name')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--restart', action='store_true')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        db = get_db()
+        owner = db.execute('SELECT id FROM user WHERE username = ?',
+                           (args.owner,)).fetchone()
+        if not owner:
+            print(f'Unknown user: {args.owner}')
+            return False
+        job = args.job or os.path.abspath(args.file)
+        fmt = args.format or detect_format(args.file)
+        with open(args.file, newline='', encoding='utf-8-sig') as f:
+            try:
+                for stats in run_import(db, f, fmt, owner['id'], job,
+                                        chunk_size=args.chunk_size,
+                                        restart=args.restart):
+                    print(f'  {stats}')
+            except ValueError as e:
+                print(e)
+                return False
+    if stats.resumed_from:
+        print(f'Resumed after row {stats.resumed_from}')
+    for line, error in stats.errors:
+        print(f'  row {line}: {error}')
+    print(f'Import finished in {stats.elapsed:.1f}s: {stats}')
+    return True
+
+
+def export_file(app, argv):
+    parser = argparse.ArgumentParser(prog='app.py export')
+    parser.add_argument('--format', choices=('csv', 'ndjson'), default='ndjson')
+    parser.add_argument('--q', default='', help='same search as /matches?q=')
+    parser.add_argument('--comments', action='store_true')
+    parser.add_argument('-o', '--output', help='file to write, defaults to stdout')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        chunks = export(get_db(readonly=True), args.format, args.q, args.comments)
+        if args.output:
+            with open(args.output, 'w', newline='', encoding='utf-8') as f:
+                f.writelines(chunks)
+        else:
+            sys.stdout.writelines(chunks)
+
+
+def slow_queries(app, argv):
+    parser = argparse.ArgumentParser(prog='app.py slow-queries')
+    parser.add_argument('--log', default=app.config['SLOW_QUERY_LOG'] or 'slow_queries.log')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--plans', action='store_true', help='show the query plans')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.log):
+        print(f'{args.log} not found')
+        return
+    print(f'{"count":>7} {"total s":>9} {"p95 ms":>9} {"max ms":>9}  query')
+    for row in slow_query_report(args.log, args.top):
+        print(f'{row["count"]:>7} {row["total"]:>9.2f} {row["p95"] * 1000:>9.1f} '
+              f'{row["max"] * 1000:>9.1f}  [{row["fingerprint"]}] {row["sql"][:200]}')
+        if row['routes']:
+            print(f'{"":>38}  routes: {", ".join(row["routes"])}')
+        if args.plans and row['plan']:
+            for detail in row['plan']:
+                print(f'{"":>38}  {detail}')
+
+
+def archive_matches(app, argv):
+    parser = argparse.ArgumentParser(prog='app.py archive')
+    parser.add_argument('--before', required=True,
+                        help='archive the matches dated before this day (YYYY-MM-DD)')
+    parser.add_argument('--dir', default=app.config['ARCHIVE_DIR'],
+                        help='directory of the season archives')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--vacuum', action='store_true',
+                        help='shrink the database file afterwards')
+    args = parser.parse_args(argv)
+    if not DATE_RE.match(args.before):
+        print(f'Not a date: {args.before}')
+        return False
+
+    started = time.perf_counter()
+    with app.app_context():
+        db = get_db()
+        migrate(db)
+        moved = 0
+        for season, matches, path in archive_seasons(db, app.config['DATABASE'], args.before,
+                                                     args.dir, args.batch_size):
+            print(f'{season}: moved {matches} matches to {path}')
+            moved += matches
+        if moved:
+            db.execute('ANALYZE')
+            db.commit()
+        if args.vacuum:
+            db.execute('VACUUM')
+    print(f'Archived {moved} matches in {time.perf_counter() - started:.1f}s')
+    return True
+
+
+def warm_up_report():
+    # Builds and warms up an app like a server worker would.
+    started = time.perf_counter()
+    report = create_app(warm_up=True).extensions['startup']
+    for name, value in report.items():
+        print(f'{name:<20} {value}')
+    print(f'{"total_seconds":<20} {time.perf_counter() - started:.4f}')
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'warm-up':
+        warm_up_report()
+        return
+    # The app of this file's other commands. It is not warmed up, since
+    # most commands never serve a request.
+    app = create_app(warm_up=False)
     if len(sys.argv) > 1 and sys.argv[1] in ('init-db', 'initdb'):
-        init_db()
+        init_db(app)
+    elif len(sys.argv) > 1 and sys.argv[1] == 'migrate':
+        migrate_db(app)
+    elif len(sys.argv) > 1 and sys.argv[1] in ('rebuild-search', 'rebuildsearch'):
+        rebuild_search(app)
+    elif len(sys.argv) > 1 and sys.argv[1] in ('check-counters', 'checkcounters'):
+        sys.exit(0 if check_db_counters(app, repair='--repair' in sys.argv[2:]) else 1)
+    elif len(sys.argv) > 1 and sys.argv[1] == 'import':
+        sys.exit(0 if import_file(app, sys.argv[2:]) else 1)
+    elif len(sys.argv) > 1 and sys.argv[1] == 'export':
+        export_file(app, sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'slow-queries':
+        slow_queries(app, sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'archive':
+        sys.exit(0 if archive_matches(app, sys.argv[2:]) else 1)
     elif len(sys.argv) > 1 and sys.argv[1] in ('seed-db', 'seeddb'):
         from seed import seed_db
-        seed_db()
+        seed_db(app)
         sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+import os
+import re
+import sqlite3
+from functools import lru_cache
+from urllib.parse import quote
+from pagination import seek as seek_page
+
+ARCHIVE_SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive.sql')
+ISO_DATE = '[0-9][0-9][0-9][0-9]-*'
+BATCH_SIZE = 2000
+MATCH_COLUMNS = '''id, title, date, opponent, result, location, description, custom_category,
+                   owner_id, home_team, away_team, home_goals, away_goals, season'''
+COMMENT_COLUMNS = 'id, match_id, user_id, content, created_at'
+# The tables and views an archive file has, where a statement reads them.
+TABLE_RE = re.compile(r'\b(FROM|JOIN)\s+(match|match_category|comment|match_fts|match_side'
+                      r'|match_team)\b(?!\s*\.)(\s+AS\s+\w+)?', re.IGNORECASE)
+COUNTER_SCOPES = ('user_match', 'user_home_win', 'user_draw', 'user_away_win')
+# Counts from archives, which only change when "app.py archive" runs.
+MAX_COUNTS = 10_000
+
+_counts = {}
+
+
+@lru_cache(maxsize=512)
+def qualify(sql, schema):
+    # sql reading the archive attached as schema instead of the main
+    # database. Every table keeps its name as alias, so column references
+    # stay valid; user and category still come from the main database.
+    if schema is None:
+        return sql
+    return TABLE_RE.sub(
+        lambda found: f'{found[1]} {schema}.{found[2]}{found[3] or " AS " + found[2]}', sql)
+
+
+def get_archives(db):
+    return db.execute('''
+        SELECT season, path, matches, comments, min_id, max_id, min_date, max_date,
+               archived_at
+        FROM archive /* full-scan: one row per archived season */
+        ORDER BY season
+    ''').fetchall()
+
+
+def schema_name(archive):
+    return f"archive_{archive['season']}"
+
+
+def attach(con, archive, readonly=True):
+    # Attaches the archive to a pooled connection once and returns its
+    # schema name. Read-only attaching needs a connection opened with
+    # uri=True, like the read pool's. Past SQLite's limit on attached
+    # databases the least recently used archive is detached.
+    schema = schema_name(archive)
+    attached = con.attached
+    if schema in attached:
+        attached[schema] = attached.pop(schema)
+        return schema
+    while attached and len(attached) >= con.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED):
+        oldest = next(iter(attached))
+        con.execute(f'DETACH DATABASE {oldest}')
+        del attached[oldest]
+    main = con.execute('PRAGMA database_list').fetchone()[2]
+    path = os.path.join(os.path.dirname(main), archive['path'])
+    if readonly:
+        path = f'file:{quote(path)}?mode=ro'
+    con.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+    attached[schema] = True
+    return schema
+
+
+def _overlaps(archive, dates):
+    date_from, date_to = dates or (None, None)
+    return ((date_from is None or archive['max_date'] >= date_from)
+            and (date_to is None or archive['min_date'] <= date_to))
+
+
+def _reachable(archives, columns, key, scan_desc, dates):
+    # The archives that can hold rows past key. Archives only hold ISO
+    # dates, so in date order they end before the NULL dates.
+    found = [archive for archive in archives if _overlaps(archive, dates)]
+    if columns[0] != 'match.date' or key is None:
+        return found
+    date = key[0]
+    if date is None:
+        return [] if scan_desc else found
+    if not isinstance(date, str):
+        return found
+    if scan_desc:
+        return [archive for archive in found if archive['min_date'] <= date]
+    return [archive for archive in found if archive['max_date'] >= date]
+
+
+def _sort_key(fields):
+    # SQLite's order: NULLs before everything else.
+    return lambda row: tuple((row[field] is not None, row[field]) for field in fields)
+
+
+def seek_archives(db, archives, select, where, params, columns, key=None, backwards=False,
+                  descending=True, nullable=False, limit=20, offset=0, dates=None):
+    # pagination.seek() over the main database and the archived seasons the
+    # page can reach; dates is the (from, to) range the request is limited
+    # to. The same page, and the row after it, is read from every source
+    # and the results merged. In date order the archives are read newest
+    # first, and only as long as they can still reach the page. Rows from
+    # an archive are dicts with the schema name under 'archive'.
+    scan_desc = descending != backwards
+    reachable = _reachable(archives, columns, key, scan_desc, dates)
+    if not reachable:
+        return seek_page(db, select, where, params, columns, key, backwards,
+                         descending, nullable, limit, offset)
+    wanted = limit + (0 if key else offset)
+    fields = [column.split('.')[1] for column in columns]
+    order = _sort_key(fields)
+    rows, more = seek_page(db, select, where, params, columns, key, backwards,
+                           descending, nullable, wanted + 1, 0)
+    seen = {row['id'] for row in rows}
+    by_date = fields[0] == 'date'
+    if by_date:
+        reachable.sort(key=lambda archive: archive['max_date' if scan_desc else 'min_date'],
+                       reverse=scan_desc)
+    for archive in reachable:
+        if by_date and len(rows) > wanted:
+            rows.sort(key=order, reverse=scan_desc)
+            date = rows[wanted]['date']
+            if (date is not None and date > archive['max_date'] if scan_desc
+                    else date is None or date < archive['min_date']):
+                break
+        schema = attach(db, archive)
+        found, found_more = seek_page(db, qualify(select, schema), qualify(where, schema),
+                                      params, columns, key, backwards, descending,
+                                      nullable, wanted + 1, 0)
+        rows += [dict(row, archive=schema) for row in found if row['id'] not in seen]
+        more = more or found_more
+    rows.sort(key=order, reverse=scan_desc)
+    more = more or len(rows) > wanted
+    rows = rows[wanted - limit:wanted]
+    if backwards:
+        rows.reverse()
+    return rows, more
+
+
+def by_source(rows):
+    # The ids of rows returned by seek() per schema, None for the main
+    # database.
+    sources = {}
+    for row in rows:
+        schema = row.get('archive') if isinstance(row, dict) else None
+        sources.setdefault(schema, []).append(row['id'])
+    return sources
+
+
+def count(db, archives, sql, params, dates=None):
+    # A COUNT(*) statement summed over the archives within dates. Each
+    # archive's count is kept until the archive changes.
+    total = 0
+    for archive in archives:
+        if not _overlaps(archive, dates):
+            continue
+        key = (tuple(archive), sql, tuple(params))
+        value = _counts.get(key)
+        if value is None:
+            value = db.execute(qualify(sql, attach(db, archive)), params).fetchone()[0]
+            if len(_counts) >= MAX_COUNTS:
+                _counts.clear()
+            _counts[key] = value
+        total += value
+    return total
+
+
+def newer_than_archives(archives, rows, key, backwards, limit):
+    # Whether a page of the newest-first listing read from the main
+    # database alone is complete: no archived match sorts into it or
+    # between it and key.
+    if not archives:
+        return True
+    newest = max(archive['max_date'] for archive in archives)
+    if backwards:
+        return key is not None and isinstance(key[0], str) and key[0] > newest
+    return len(rows) == limit and rows[-1]['date'] is not None and rows[-1]['date'] > newest
+
+
+def find_match(db, archives, match_id):
+    # Schema name of the archive holding match_id, or None.
+    for archive in archives:
+        if archive['min_id'] <= match_id <= archive['max_id']:
+            schema = attach(db, archive)
+            if db.execute(f'SELECT id FROM {schema}.match WHERE id = ?',
+                          (match_id,)).fetchone():
+                return schema
+    return None
+
+
+def _copy_batch(archive_con, ids):
+    # Replaces the archived copies of ids with the rows in the main
+    # database, attached as hot, and commits.
+    archive_con.execute('BEGIN')
+    try:
+        archive_con.execute('DELETE FROM temp.archive_batch')
+        archive_con.executemany('INSERT INTO temp.archive_batch (id) VALUES (?)',
+                                [(match_id,) for match_id in ids])
+        batch = 'SELECT id FROM temp.archive_batch'
+        archive_con.execute(f'DELETE FROM comment WHERE match_id IN ({batch})')
+        archive_con.execute(f'DELETE FROM match_category WHERE match_id IN ({batch})')
+        archive_con.execute(f'DELETE FROM match WHERE id IN ({batch})')
+        archive_con.execute(f'''INSERT INTO match ({MATCH_COLUMNS})
+                                SELECT {MATCH_COLUMNS} FROM hot.match WHERE id IN ({batch})''')
+        archive_con.execute(f'''INSERT INTO match_category (match_id, category_id)
+                                SELECT match_id, category_id FROM hot.match_category
+                                WHERE match_id IN ({batch})''')
+        archive_con.execute(f'''INSERT INTO comment ({COMMENT_COLUMNS})
+                                SELECT {COMMENT_COLUMNS} FROM hot.comment
+                                WHERE match_id IN ({batch})''')
+        archive_con.execute('COMMIT')
+    except BaseException:
+        archive_con.execute('ROLLBACK')
+        raise
+    return archive_con.execute('''
+        SELECT (SELECT COUNT(*) FROM match), (SELECT COUNT(*) FROM comment),
+               MIN(id), MAX(id), MIN(date), MAX(date)
+        FROM match
+    ''').fetchone()
+
+
+def _delete_batch(db, ids, season, path, stats):
+    # Deletes the archived matches from the main database in the open
+    # transaction. The delete triggers would take them out of the
+    # counters, standings and team statistics, so the rows they touch are
+    # saved first and put back afterwards.
+    db.execute('CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)')
+    db.execute('DELETE FROM temp.archive_batch')
+    db.executemany('INSERT INTO temp.archive_batch (id) VALUES (?)',
+                   [(match_id,) for match_id in ids])
+    batch = 'SELECT id FROM temp.archive_batch'
+    owners = f'SELECT owner_id FROM match WHERE id IN ({batch})'
+    scopes = ', '.join(f"'{scope}'" for scope in COUNTER_SCOPES)
+    for table in ('saved_counter', 'saved_standing', 'saved_user_team'):
+        db.execute(f'DROP TABLE IF EXISTS temp.{table}')
+    db.execute(f'''
+        CREATE TEMP TABLE saved_counter AS
+        SELECT scope, key, value FROM counter
+        WHERE (scope = 'match' AND key = 0) OR scope = 'category_match'
+           OR (scope IN ({scopes}) AND key IN ({owners}))
+           OR (scope = 'user_comment' AND key IN (
+               SELECT user_id FROM comment WHERE match_id IN ({batch})))
+           OR (scope = 'match_comment' AND key IN ({batch}))
+    ''')
+    db.execute('CREATE TEMP TABLE saved_standing AS SELECT * FROM standing WHERE season = ?',
+               (season,))
+    db.execute(f'''CREATE TEMP TABLE saved_user_team AS
+                   SELECT * FROM user_team WHERE user_id IN ({owners})''')
+    db.execute(f'''CREATE TEMP TABLE saved_owner AS
+                   SELECT DISTINCT owner_id FROM match WHERE id IN ({batch})''')
+
+    db.execute(f'DELETE FROM match WHERE id IN ({batch})')
+
+    db.execute('''INSERT OR REPLACE INTO counter (scope, key, value)
+                  SELECT scope, key, value FROM temp.saved_counter''')
+    db.execute('DELETE FROM standing WHERE season = ?', (season,))
+    db.execute('INSERT INTO standing SELECT * FROM temp.saved_standing')
+    db.execute('DELETE FROM user_team WHERE user_id IN (SELECT owner_id FROM temp.saved_owner)')
+    db.execute('INSERT INTO user_team SELECT * FROM temp.saved_user_team')
+    for table in ('saved_counter', 'saved_standing', 'saved_user_team', 'saved_owner'):
+        db.execute(f'DROP TABLE temp.{table}')
+
+    matches, comments, min_id, max_id, min_date, max_date = stats
+    db.execute('''
+        INSERT INTO archive (season, path, matches, comments, min_id, max_id,
+                             min_date, max_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (season) DO UPDATE SET
+            path = excluded.path, matches = excluded.matches,
+            comments = excluded.comments, min_id = excluded.min_id,
+            max_id = excluded.max_id, min_date = excluded.min_date,
+            max_date = excluded.max_date, archived_at = CURRENT_TIMESTAMP
+    ''', (season, path, matches, comments, min_id, max_id, min_date, max_date))
+
+
+def _open_archive(path, database):
+    new = not os.path.exists(path)
+    con = sqlite3.connect(f'file:{quote(os.path.abspath(path))}', uri=True,
+                          isolation_level=None)
+    if new:
+        with open(ARCHIVE_SCHEMA, encoding='utf-8') as f:
+            con.executescript(f.read())
+    con.execute('CREATE TEMP TABLE archive_batch (id INTEGER PRIMARY KEY)')
+    con.execute('ATTACH DATABASE ? AS hot',
+                (f'file:{quote(os.path.abspath(database))}?mode=ro',))
+    return con
+
+
+def archive_seasons(db, database, before, directory, batch_size=BATCH_SIZE):
+    # Moves the matches dated before `before`, with their category links
+    # and comments, from the main database into one file per season in
+    # directory, batch_size matches at a time, and yields (season, moved
+    # matches, path) for each season. db is a write connection to the main
+    # database. For each batch db first takes the write lock, so nothing
+    # changes while a second connection copies the batch into the
+    # archive and commits; only then is the batch deleted here. A crash in
+    # between leaves the batch in both files, which the next run repairs.
+    # Only ISO dates are archived.
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.dirname(os.path.abspath(database))
+    seasons = [row[0] for row in db.execute('''
+        SELECT DISTINCT substr(date, 1, 4) FROM match
+        WHERE date < ? AND date GLOB ? ORDER BY 1
+    ''', (before, ISO_DATE))]
+    for season in seasons:
+        path = os.path.join(directory, f'season-{season}.db')
+        relative = os.path.relpath(os.path.abspath(path), base)
+        bounds = (season, min(before, f'{int(season) + 1:04d}'), ISO_DATE)
+        archive_con = _open_archive(path, database)
+        moved = 0
+        try:
+            while True:
+                db.execute('BEGIN IMMEDIATE')
+                try:
+                    ids = [row[0] for row in db.execute('''
+                        SELECT id FROM match WHERE date >= ? AND date < ? AND date GLOB ?
+                        ORDER BY date, id LIMIT ?
+                    ''', (*bounds, batch_size))]
+                    if not ids:
+                        db.rollback()
+                        break
+                    stats = _copy_batch(archive_con, ids)
+                    _delete_batch(db, ids, season, relative, stats)
+                    db.commit()
+                except BaseException:
+                    db.rollback()
+                    raise
+                moved += len(ids)
+            archive_con.execute('ANALYZE main')
+        finally:
+            archive_con.close()
+        yield season, moved, path
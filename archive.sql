@@ -0,0 +1,99 @@
+-- Schema of a season archive file (archive.py). It holds the archived
+-- matches with their category links and comments, and the indexes and
+-- search index the routes read them through. Users and categories stay in
+-- the main database, so there are no foreign keys.
+
+CREATE TABLE IF NOT EXISTS match (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    date TEXT,
+    opponent TEXT,
+    result TEXT,
+    location TEXT,
+    description TEXT,
+    custom_category TEXT,
+    owner_id INTEGER NOT NULL,
+    home_team TEXT,
+    away_team TEXT,
+    home_goals INTEGER,
+    away_goals INTEGER,
+    season TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_match_date_id ON match(date, id);
+CREATE INDEX IF NOT EXISTS idx_match_owner_date_id ON match(owner_id, date, id);
+CREATE INDEX IF NOT EXISTS idx_match_opponent_date_id ON match(opponent, date, id);
+CREATE INDEX IF NOT EXISTS idx_match_location_date_id ON match(location, date, id);
+CREATE INDEX IF NOT EXISTS idx_match_result_date_id ON match(result, date, id);
+
+CREATE TABLE IF NOT EXISTS match_category (
+    match_id INTEGER NOT NULL,
+    category_id INTEGER NOT NULL,
+    PRIMARY KEY (match_id, category_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_match_category_category
+ON match_category(category_id, match_id);
+
+CREATE TABLE IF NOT EXISTS comment (
+    id INTEGER PRIMARY KEY,
+    match_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    created_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_comment_match_id ON comment(match_id, id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS match_fts USING fts5(
+    title, description, opponent, location,
+    content='match', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+
+INSERT INTO match_fts(match_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 5.0, 2.0)');
+
+CREATE TRIGGER IF NOT EXISTS match_fts_insert AFTER INSERT ON match BEGIN
+    INSERT INTO match_fts(rowid, title, description, opponent, location)
+    VALUES (new.id, new.title, new.description, new.opponent, new.location);
+END;
+
+CREATE TRIGGER IF NOT EXISTS match_fts_delete AFTER DELETE ON match BEGIN
+    INSERT INTO match_fts(match_fts, rowid, title, description, opponent, location)
+    VALUES ('delete', old.id, old.title, old.description, old.opponent, old.location);
+END;
+
+-- The views of migrations 0005 and 0009, for app.py check-counters.
+CREATE VIEW IF NOT EXISTS match_side AS
+SELECT id AS match_id, season, home_team AS team,
+       home_goals AS goals_for, away_goals AS goals_against,
+       home_goals > away_goals AS won, home_goals = away_goals AS drawn,
+       home_goals < away_goals AS lost,
+       CASE WHEN home_goals > away_goals THEN 3
+            WHEN home_goals = away_goals THEN 1 ELSE 0 END AS points
+FROM match
+WHERE season IS NOT NULL AND home_goals IS NOT NULL
+  AND away_team IS NOT NULL AND home_team <> away_team
+UNION ALL
+SELECT id, season, away_team, away_goals, home_goals,
+       away_goals > home_goals, away_goals = home_goals, away_goals < home_goals,
+       CASE WHEN away_goals > home_goals THEN 3
+            WHEN away_goals = home_goals THEN 1 ELSE 0 END
+FROM match
+WHERE season IS NOT NULL AND home_goals IS NOT NULL
+  AND away_team IS NOT NULL AND home_team <> away_team;
+
+CREATE VIEW IF NOT EXISTS match_team AS
+SELECT id AS match_id, owner_id, home_team AS team,
+       coalesce(home_goals > away_goals, 0) AS won,
+       coalesce(home_goals = away_goals, 0) AS drawn,
+       coalesce(home_goals < away_goals, 0) AS lost
+FROM match
+WHERE home_team <> ''
+UNION ALL
+SELECT id, owner_id, away_team,
+       coalesce(away_goals > home_goals, 0), coalesce(away_goals = home_goals, 0),
+       coalesce(away_goals < home_goals, 0)
+FROM match
+WHERE away_team <> '' AND away_team IS NOT home_team;
@@ -0,0 +1,499 @@
+"""
+Benchmark suite.
+Builds fixture databases at fixed scales, times every route through the
+Flask test client and the raw SQL behind them, and compares result files
+so regressions between two runs are easy to spot.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from app import create_app, get_db
+from generate import generate_database, PASSWORD
+from listing import ListingIndex, MAX_BYTES_PER_MATCH
+from pagination import encode_cursor, seek
+from search import fts_query
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+FIXTURE_DIR = 'bench'
+# The directory of app.py, which the startup processes import it from.
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+# Budgets of a warmed-up worker, in seconds.
+MAX_CREATE_APP = 1.0
+MAX_FIRST_REQUEST = 0.025
+
+
+def fixture_path(scale):
+    return os.path.join(FIXTURE_DIR, f'fixture-{scale}.db')
+
+
+def build_fixture(scale, force=False, seed=1):
+    path = fixture_path(scale)
+    if os.path.exists(path) and not force:
+        print(f'{path} already exists')
+        return path
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)
+    print(f'Building {path}...')
+    generate_database(path, SCALES[scale], seed=seed)
+    return path
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(durations):
+    durations = sorted(durations)
+    total = sum(durations)
+    return {
+        'n': len(durations),
+        'mean_ms': total / len(durations) * 1000,
+        'p50_ms': percentile(durations, 50) * 1000,
+        'p95_ms': percentile(durations, 95) * 1000,
+        'p99_ms': percentile(durations, 99) * 1000,
+        'max_ms': durations[-1] * 1000,
+        'ops_per_sec': len(durations) / total if total else 0.0,
+    }
+
+
+def measure(func, iterations, warmup):
+    for i in range(warmup):
+        func(i)
+    durations = []
+    for i in range(warmup, warmup + iterations):
+        started = time.perf_counter()
+        func(i)
+        durations.append(time.perf_counter() - started)
+    return summarize(durations)
+
+
+def sql_scenarios(db):
+    total = db.execute('SELECT COUNT(*) FROM match').fetchone()[0]
+    deep = db.execute('SELECT date, id FROM match ORDER BY date DESC, id DESC LIMIT 1 OFFSET ?',
+                      (total // 2,)).fetchone()
+    match_id = db.execute('SELECT id FROM match ORDER BY id LIMIT 1 OFFSET ?',
+                          (total // 2,)).fetchone()[0]
+    listing = '''
+        SELECT match.id, match.title, match.description, match.date,
+               match.opponent, match.result, match.location,
+               match.owner_id, user.username
+        FROM match
+        JOIN user ON match.owner_id = user.id
+    '''
+    return [
+        ('listing first page', listing + ' ORDER BY match.date DESC, match.id DESC LIMIT 21', ()),
+        ('listing page 26 (offset)',
+         listing + ' ORDER BY match.date DESC, match.id DESC LIMIT 21 OFFSET 500', ()),
+        ('listing middle page (keyset)',
+         listing + ''' WHERE (match.date, match.id) < (?, ?)
+                       ORDER BY match.date DESC, match.id DESC LIMIT 21''',
+         (deep['date'], deep['id'])),
+        ('search', '''
+            SELECT match.id, match.title, match_fts.rank FROM match_fts
+            JOIN match ON match.id = match_fts.rowid
+            WHERE match_fts MATCH ? ORDER BY match_fts.rank, match.id LIMIT 21
+         ''', (fts_query('hjk'),)),
+        ('search count', 'SELECT COUNT(*) FROM match_fts WHERE match_fts MATCH ?',
+         (fts_query('hjk'),)),
+        ('match count', "SELECT value FROM counter WHERE scope = 'match' AND key = 0", ()),
+        ('match detail', listing + ' WHERE match.id = ?', (match_id,)),
+        ('match comments', '''
+            SELECT comment.id, comment.content, comment.created_at, user.username
+            FROM comment JOIN user ON comment.user_id = user.id
+            WHERE comment.match_id = ? ORDER BY comment.id DESC LIMIT 51
+         ''', (match_id,)),
+        ('new comments', '''
+            SELECT comment.id, comment.content, comment.created_at, user.username
+            FROM comment JOIN user ON comment.user_id = user.id
+            WHERE comment.match_id = ? AND comment.id > ? ORDER BY comment.id LIMIT 101
+         ''', (match_id, 0)),
+        ('standings', '''
+            SELECT team, played, won, drawn, lost, goals_for, goals_against, points
+            FROM standing WHERE season = ? AND category_id = 0
+            ORDER BY points DESC, goals_for - goals_against DESC, goals_for DESC, team
+         ''', ('2025',)),
+        ('profile matches', '''
+            SELECT id, title, date FROM match WHERE owner_id = ?
+            ORDER BY date DESC, id DESC LIMIT 21
+         ''', (1,)),
+    ]
+
+
+def disposable_matches(db, count):
+    cursor = db.execute("SELECT IFNULL(MAX(id), 0) FROM match")
+    first = cursor.fetchone()[0] + 1
+    db.executemany('''INSERT INTO match (id, title, date, owner_id)
+                      VALUES (?, 'HJK - KuPS', '2000-01-01', 1)''',
+                   [(match_id,) for match_id in range(first, first + count)])
+    db.commit()
+    return list(range(first, first + count))
+
+
+def route_scenarios(db, writer, iterations, warmup):
+    total = db.execute('SELECT COUNT(*) FROM match').fetchone()[0]
+    deep = db.execute('SELECT date, id FROM match ORDER BY date DESC, id DESC LIMIT 1 OFFSET ?',
+                      (total // 2,)).fetchone()
+    match_id = db.execute('SELECT id FROM match ORDER BY id LIMIT 1 OFFSET ?',
+                          (total // 2,)).fetchone()[0]
+    owned = disposable_matches(writer, iterations + warmup + 1)
+    deep_cursor = encode_cursor(total // 40, [deep['date'], deep['id']])
+    form = {'csrf_token': 'bench', 'title': 'HJK - KuPS', 'date': '2025-05-05',
+            'opponent': 'KuPS', 'result': '2-1', 'location': 'Bolt Arena',
+            'description': 'Benchmark', 'categories': ['1']}
+    login = {'csrf_token': 'bench', 'username': 'user1', 'password': PASSWORD}
+
+    return [
+        ('GET /matches', 'get', lambda i: '/matches', None),
+        ('GET /matches?page=26', 'get', lambda i: '/matches?page=26', None),
+        ('GET /matches?after=<middle>', 'get', lambda i: f'/matches?after={deep_cursor}', None),
+        ('GET /matches?q=hjk', 'get', lambda i: '/matches?q=hjk', None),
+        ('GET /matches/<id>', 'get', lambda i: f'/matches/{match_id}', None),
+        ('GET /api/v1/matches', 'get', lambda i: '/api/v1/matches', None),
+        ('GET /api/v1/matches?ids=', 'get',
+         lambda i: f'/api/v1/matches?ids={",".join(str(match_id + n) for n in range(50))}', None),
+        ('GET /api/v1/matches/<id>', 'get', lambda i: f'/api/v1/matches/{match_id}', None),
+        ('GET /matches/<id>/comments', 'get',
+         lambda i: f'/matches/{match_id}/comments?after=0', None),
+        ('GET /user/<id>', 'get', lambda i: '/user/1', None),
+        ('GET /standings', 'get', lambda i: '/standings', None),
+        ('GET /teams/<name>', 'get', lambda i: '/teams/HJK', None),
+        ('GET /teams/<a>/vs/<b>', 'get', lambda i: '/teams/HJK/vs/KuPS', None),
+        ('GET /suggest', 'get', lambda i: '/suggest?field=opponent&prefix=ku', None),
+        ('GET /matches/new', 'get', lambda i: '/matches/new', None),
+        ('GET /matches/<id>/edit', 'get', lambda i: f'/matches/{owned[0]}/edit', None),
+        ('GET /login', 'get', lambda i: '/login', None),
+        ('GET /register', 'get', lambda i: '/register', None),
+        ('POST /matches/new', 'post', lambda i: '/matches/new', lambda i: form),
+        ('POST /matches/<id>/edit', 'post', lambda i: f'/matches/{owned[0]}/edit',
+         lambda i: form),
+        ('POST /matches/<id>/comment', 'post', lambda i: f'/matches/{match_id}/comment',
+         lambda i: {'csrf_token': 'bench', 'content': f'Kommentti {i}'}),
+        ('POST /matches/<id>/delete', 'post', lambda i: f'/matches/{owned[i + 1]}/delete',
+         lambda i: {'csrf_token': 'bench'}),
+        ('POST /login', 'post', lambda i: '/login', lambda i: login),
+        ('POST /register', 'post', lambda i: '/register',
+         lambda i: {'csrf_token': 'bench', 'username': f'bench{i}_{time.time_ns()}',
+                    'password': PASSWORD, 'password2': PASSWORD}),
+    ]
+
+
+def run(scale, iterations, warmup, only=None):
+    source = fixture_path(scale)
+    if not os.path.exists(source):
+        build_fixture(scale)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # Write routes change the data, so every run works on a copy.
+        path = os.path.join(tmp, 'bench.db')
+        shutil.copyfile(source, path)
+        app = create_app({'DATABASE': path}, warm_up=False)
+
+        with app.app_context():
+            db = get_db(readonly=True)
+            for name, sql, params in sql_scenarios(db):
+                if only and only not in name:
+                    continue
+                results[f'sql: {name}'] = measure(
+                    lambda i, sql=sql, params=params: db.execute(sql, params).fetchall(),
+                    iterations, warmup)
+                print_result(f'sql: {name}', results[f'sql: {name}'])
+            scenarios = route_scenarios(db, get_db(), iterations, warmup)
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['username'] = 'user0'
+            sess['csrf_token'] = 'bench'
+        for name, method, path_for, data_for in scenarios:
+            if only and only not in name:
+                continue
+
+            def request(i, method=method, path_for=path_for, data_for=data_for):
+                if method == 'get':
+                    response = client.get(path_for(i))
+                else:
+                    response = client.post(path_for(i), data=data_for(i))
+                if response.status_code >= 400:
+                    raise RuntimeError(f'{name} returned {response.status_code}')
+                response.close()
+
+            results[name] = measure(request, iterations, warmup)
+            print_result(name, results[name])
+
+    return {
+        'meta': {
+            'scale': scale,
+            'matches': SCALES[scale],
+            'iterations': iterations,
+            'warmup': warmup,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def check_listing(scale, iterations, max_bytes):
+    # Loads the listing index of a fixture, reports its memory per match
+    # and checks that its pages and patches agree with the SQL listing and
+    # that it stays within max_bytes per match, so CI can run it as a test.
+    source = fixture_path(scale)
+    if not os.path.exists(source):
+        build_fixture(scale)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        shutil.copyfile(source, path)
+        con = sqlite3.connect(path)
+        con.row_factory = sqlite3.Row
+        started = time.perf_counter()
+        index = ListingIndex.load(con)
+        load_time = time.perf_counter() - started
+        arrays, text = index.nbytes()
+        count = max(len(index), 1)
+        print(f'{len(index)} matches loaded in {load_time:.2f}s')
+        print(f'arrays {arrays / count:.1f} bytes/match, text {text / count:.1f} bytes/match, '
+              f'total {(arrays + text) / 2**20:.1f} MiB')
+        if (arrays + text) / count > max_bytes:
+            print(f'listing index uses more than {max_bytes} bytes/match')
+            con.close()
+            return False
+
+        def sql_page(key=None, backwards=False, offset=0):
+            return seek(con, '''
+                SELECT match.id, match.title, match.description, match.date,
+                       match.opponent, match.result, match.location,
+                       match.owner_id, user.username
+                FROM match JOIN user ON match.owner_id = user.id
+            ''', '', (), ('match.date', 'match.id'), key, backwards,
+                nullable=True, offset=offset)
+
+        def same(index, key=None, backwards=False, offset=0):
+            rows, more = index.page(key, backwards, offset=offset)
+            expected, expected_more = sql_page(key, backwards, offset)
+            fields = ('id', 'title', 'description', 'date', 'owner_id', 'username')
+            if more != expected_more or [[row[f] for f in fields] for row in rows] != \
+                    [[row[f] for f in fields] for row in expected]:
+                raise RuntimeError(f'listing page differs: key={key} backwards={backwards} '
+                                   f'offset={offset}')
+            return rows
+
+        def check_pages(index):
+            middle = same(index, offset=len(index) // 2)
+            for row in (middle[0], middle[-1]):
+                same(index, [row.date, row.id])
+                same(index, [row.date, row.id], backwards=True)
+            same(index, offset=max(len(index) - 5, 0))
+            same(index, [None, 0], backwards=True)
+            # ?page=N past the last page.
+            for offset in (len(index), len(index) + 20, 2 * len(index) + 7):
+                same(index, offset=offset)
+
+        check_pages(index)
+        changed = [row[0] for row in con.execute(
+            'SELECT id FROM match ORDER BY id DESC LIMIT 100').fetchall()]
+        con.execute(f"UPDATE match SET date = '2001-02-03', title = title || ' (muutettu)' "
+                    f"WHERE id IN ({', '.join('?' * 50)})", changed[:50])
+        con.execute(f"DELETE FROM match WHERE id IN ({', '.join('?' * 50)})", changed[50:])
+        con.commit()
+        started = time.perf_counter()
+        index = index.patch(con, changed)
+        print(f'patched 100 matches in {(time.perf_counter() - started) * 1000:.1f}ms')
+        check_pages(index)
+        same(index, ['2001-02-03', changed[0]])
+
+        middle = index.page(offset=len(index) // 2)[0]
+        key = [middle[0].date, middle[0].id] if middle else None
+        result = measure(lambda i: index.page(key), iterations, 0)
+        print_result('listing index page', result)
+        result = measure(lambda i: sql_page(key), iterations, 0)
+        print_result('SQL listing page', result)
+        con.close()
+    print('listing index agrees with SQL')
+    return True
+
+
+STARTUP_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+worker = app.create_app({'DATABASE': sys.argv[1], 'JINJA_CACHE_DIR': sys.argv[2] or None},
+                        warm_up=sys.argv[3] == '1')
+created = time.perf_counter()
+client = worker.test_client()
+timings = {'import': imported - started, 'create_app': created - imported}
+for path in sys.argv[4:]:
+    before = time.perf_counter()
+    client.get(path).close()
+    timings[path] = time.perf_counter() - before
+timings['total'] = time.perf_counter() - started
+print(json.dumps(timings))
+'''
+
+
+def startup_timings(path, paths, runs, cache_dir='', warm_up=True):
+    # Median timings of runs fresh processes importing app.py, building
+    # the app on the database at path and requesting paths.
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT, path, cache_dir, '1' if warm_up else '0',
+             *paths],
+            capture_output=True, text=True, check=True, cwd=REPO_DIR).stdout
+        samples.append(json.loads(output.splitlines()[-1]))
+    return {key: sorted(sample[key] for sample in samples)[runs // 2] for key in samples[0]}
+
+
+def startup_paths(path):
+    con = sqlite3.connect(path)
+    match_id = con.execute('SELECT MAX(id) FROM match').fetchone()[0]
+    con.close()
+    return ['/matches', f'/matches/{match_id}', '/standings']
+
+
+def over_startup_budget(timings, paths, max_create_app=MAX_CREATE_APP,
+                        max_request=MAX_FIRST_REQUEST):
+    # (name, budget) of every warmed-up timing over its budget.
+    budgets = [('create_app', max_create_app)] + [(path, max_request) for path in paths]
+    return [(key, budget) for key, budget in budgets if timings[key] > budget]
+
+
+def check_startup(scale, runs, max_create_app, max_request):
+    # Starts fresh processes and times the import of app.py, create_app()
+    # and the first requests, with and without the bytecode cache and the
+    # warm-up. The result is the median of runs processes. A warmed-up
+    # worker must build its app within max_create_app seconds and answer
+    # each first request within max_request seconds.
+    source = fixture_path(scale)
+    if not os.path.exists(source):
+        build_fixture(scale)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = os.path.join(tmp, 'jinja')
+        path = os.path.join(tmp, 'bench.db')
+        shutil.copyfile(source, path)
+        paths = startup_paths(path)
+        setups = [('no cache, no warm-up', '', False),
+                  ('bytecode cache, no warm-up', cache_dir, False),
+                  ('bytecode cache, warm-up', cache_dir, True)]
+        results = {name: startup_timings(path, paths, runs, cache, warm)
+                   for name, cache, warm in setups}
+    keys = list(next(iter(results.values())))
+    print(f"{'':<28}" + ''.join(f'{key[:14]:>16}' for key in keys))
+    for name, timings in results.items():
+        print(f'{name:<28}' + ''.join(f'{timings[key] * 1000:>14.1f}ms' for key in keys))
+    warmed = results['bytecode cache, warm-up']
+    over = over_startup_budget(warmed, paths, max_create_app, max_request)
+    for key, budget in over:
+        print(f'{key} took {warmed[key] * 1000:.1f}ms after warm-up, '
+              f'budget {budget * 1000:.0f}ms')
+    return not over
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(name, result):
+    print(f"{name:<36} p50 {result['p50_ms']:8.2f}ms  p95 {result['p95_ms']:8.2f}ms  "
+          f"p99 {result['p99_ms']:8.2f}ms  {result['ops_per_sec']:9.1f} ops/s")
+
+
+def compare(base_file, new_file, threshold):
+    with open(base_file, encoding='utf-8') as f:
+        base = json.load(f)['results']
+    with open(new_file, encoding='utf-8') as f:
+        new = json.load(f)['results']
+
+    regressions = []
+    for name in sorted(base.keys() & new.keys()):
+        before, after = base[name], new[name]
+        changes = {metric: (after[metric] - before[metric]) / before[metric]
+                   for metric in ('p50_ms', 'p95_ms') if before[metric]}
+        worst = max(changes.values(), default=0.0)
+        flag = 'REGRESSION' if worst > threshold else ''
+        if flag:
+            regressions.append(name)
+        print(f"{name:<36} p50 {before['p50_ms']:8.2f} -> {after['p50_ms']:8.2f}ms  "
+              f"p95 {before['p95_ms']:8.2f} -> {after['p95_ms']:8.2f}ms  "
+              f"{worst:+7.1%} {flag}")
+    for name in sorted(base.keys() - new.keys()):
+        print(f'{name:<36} missing from {new_file}')
+    print(f'\n{len(regressions)} regressions above {threshold:.0%}')
+    return not regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='build a fixture database')
+    build.add_argument('--scale', choices=SCALES, default='10k')
+    build.add_argument('--force', action='store_true')
+    build.add_argument('--seed', type=int, default=1)
+
+    bench = commands.add_parser('run', help='time routes and SQL')
+    bench.add_argument('--scale', choices=SCALES, default='10k')
+    bench.add_argument('--iterations', type=int, default=200)
+    bench.add_argument('--warmup', type=int, default=20)
+    bench.add_argument('--only', help='only run scenarios whose name contains this')
+    bench.add_argument('-o', '--output', help='write results as JSON')
+
+    listing = commands.add_parser('listing', help='check the in-memory listing index')
+    listing.add_argument('--scale', choices=SCALES, default='10k')
+    listing.add_argument('--iterations', type=int, default=200)
+    listing.add_argument('--max-bytes', type=float, default=MAX_BYTES_PER_MATCH,
+                         help='memory budget of the index per match')
+
+    startup = commands.add_parser('startup', help='time process startup and first requests')
+    startup.add_argument('--scale', choices=SCALES, default='10k')
+    startup.add_argument('--runs', type=int, default=5)
+    startup.add_argument('--max-create-app-ms', type=float, default=MAX_CREATE_APP * 1000,
+                         help='budget of create_app() with warm-up')
+    startup.add_argument('--max-request-ms', type=float, default=MAX_FIRST_REQUEST * 1000,
+                         help='budget of each first request after warm-up')
+
+    diff = commands.add_parser('compare', help='compare two result files')
+    diff.add_argument('base')
+    diff.add_argument('new')
+    diff.add_argument('--threshold', type=float, default=0.10,
+                      help='relative p50/p95 slowdown that counts as a regression')
+
+    args = parser.parse_args(argv)
+    if args.command == 'build':
+        build_fixture(args.scale, args.force, args.seed)
+    elif args.command == 'run':
+        results = run(args.scale, args.iterations, args.warmup, args.only)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+            print(f'\nResults written to {args.output}')
+    elif args.command == 'startup':
+        return check_startup(args.scale, args.runs, args.max_create_app_ms / 1000,
+                             args.max_request_ms / 1000)
+    elif args.command == 'listing':
+        return check_listing(args.scale, args.iterations, args.max_bytes)
+    else:
+        return compare(args.base, args.new, args.threshold)
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main(sys.argv[1:]) else 1)
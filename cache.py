@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from flask import current_app, request, session, Response
+from markupsafe import Markup
+
+# tags maps every tag the body depends on to the version it was rendered
+# with, see migrations/0007_cache_tags.sql.
+CacheEntry = namedtuple('CacheEntry', 'body etag last_modified tags')
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class LRUCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old.body)
+            self._entries[key] = entry
+            self.size += len(entry.body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry.body)
+
+
+class SQLiteBackend:
+    # Shared by every process on the host through one SQLite file. Any
+    # object with the same get/set/delete methods can be used instead,
+    # e.g. a wrapper around Redis or memcached.
+    def __init__(self, path, max_entries=20000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        con = getattr(self._local, 'con', None)
+        if con is None or self._local.pid != os.getpid():
+            con = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            con.execute('PRAGMA journal_mode = WAL')
+            con.execute('PRAGMA synchronous = OFF')
+            con.execute('''CREATE TABLE IF NOT EXISTS cache_entry (
+                               key TEXT PRIMARY KEY,
+                               body BLOB NOT NULL,
+                               etag TEXT NOT NULL,
+                               last_modified REAL NOT NULL,
+                               tags TEXT NOT NULL,
+                               stored_at REAL NOT NULL)''')
+            con.execute('''CREATE INDEX IF NOT EXISTS idx_cache_entry_stored
+                           ON cache_entry(stored_at)''')
+            self._local.con = con
+            self._local.pid = os.getpid()
+        return con
+
+    def get(self, key):
+        try:
+            row = self._connection().execute(
+                'SELECT body, etag, last_modified, tags FROM cache_entry WHERE key = ?',
+                (key,)).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        return CacheEntry(row[0], row[1], row[2], json.loads(row[3]))
+
+    def set(self, key, entry):
+        try:
+            con = self._connection()
+            con.execute('''INSERT OR REPLACE INTO cache_entry
+                           (key, body, etag, last_modified, tags, stored_at)
+                           VALUES (?, ?, ?, ?, ?, ?)''',
+                        (key, entry.body, entry.etag, entry.last_modified,
+                         json.dumps(entry.tags), time.time()))
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                con.execute('''DELETE FROM cache_entry WHERE stored_at <= (
+                                   SELECT stored_at FROM cache_entry
+                                   ORDER BY stored_at DESC LIMIT 1 OFFSET ?)''',
+                            (self.max_entries,))
+        except sqlite3.Error:
+            pass
+
+    def delete(self, key):
+        try:
+            self._connection().execute('DELETE FROM cache_entry WHERE key = ?', (key,))
+        except sqlite3.Error:
+            pass
+
+
+class ResponseCache:
+    # An in-process LRU in front of an optional shared backend. Entries are
+    # never invalidated directly; they are checked against the current tag
+    # versions on every read.
+    def __init__(self, max_bytes, backend=None):
+        self.local = LRUCache(max_bytes)
+        self.backend = backend
+
+    def get(self, db, key):
+        entry = self.local.get(key)
+        if entry is None and self.backend is not None:
+            entry = self.backend.get(key)
+            if entry is not None:
+                self.local.set(key, entry)
+        if entry is None:
+            return None
+        if tag_versions(db, entry.tags) != entry.tags:
+            self.local.delete(key)
+            return None
+        return entry
+
+    def set(self, key, body, versions, shared=True):
+        entry = CacheEntry(body, hashlib.sha1(body).hexdigest(), int(time.time()), versions)
+        self.local.set(key, entry)
+        if shared and self.backend is not None:
+            self.backend.set(key, entry)
+        return entry
+
+
+def tag_versions(db, tags):
+    tags = list(tags)
+    versions = dict.fromkeys(tags, 0)
+    if tags:
+        marks = ', '.join('?' * len(tags))
+        versions.update(db.execute(
+            f'SELECT tag, version FROM cache_tag WHERE tag IN ({marks})', tags).fetchall())
+    return versions
+
+
+def get_cache():
+    config = current_app.config
+    if not config.get('CACHE_ENABLED', True):
+        return None
+    key = config.get('DATABASE', 'database.db')
+    cache = _caches.get(key)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(key)
+            if cache is None:
+                backend = None
+                if config.get('CACHE_BACKEND') == 'sqlite':
+                    backend = SQLiteBackend(config.get('CACHE_PATH', 'cache.db'))
+                elif config.get('CACHE_BACKEND'):
+                    backend = config['CACHE_BACKEND']
+                cache = ResponseCache(config.get('CACHE_MAX_BYTES', 32 * 1024 * 1024),
+                                      backend)
+                _caches[key] = cache
+    return cache
+
+
+def cacheable():
+    # Pages differ for logged in users, and rendering a page with pending
+    # flash messages consumes them.
+    return (request.method == 'GET' and 'user_id' not in session
+            and '_flashes' not in session)
+
+
+def cached_page(get_db, tags):
+    # tags(**view_args) lists what the page depends on. Cached pages are
+    # served with an ETag and Last-Modified, so a revalidating client gets
+    # 304 Not Modified without the view running at all.
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            if cache is None or not cacheable():
+                return func(*args, **kwargs)
+            db = get_db(readonly=True)
+            key = f'page:{request.full_path}'
+            entry = cache.get(db, key)
+            if entry is None:
+                # Versions are read before rendering, so a write that lands
+                # during the render leaves the new entry already stale.
+                versions = tag_versions(db, tags(**kwargs))
+                response = current_app.make_response(func(*args, **kwargs))
+                if response.status_code != 200 or '_flashes' in session:
+                    return response
+                entry = cache.set(key, response.get_data(), versions)
+            response = Response(entry.body, mimetype='text/html')
+            response.set_etag(entry.etag)
+            response.last_modified = entry.last_modified
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+def render_fragments(db, template, items, key, tags, **context):
+    # Renders one fragment per item, reusing cached ones. key(item) and
+    # tags(item) give the cache key and tags of each fragment, and the tag
+    # versions of all items are fetched with a single query. Fragments are
+    # cheap to rebuild, so they stay in the local LRU only.
+    cache = get_cache()
+    env = current_app.jinja_env
+    if cache is None:
+        return [Markup(env.get_template(template).render(item=item, **context))
+                for item in items]
+    all_tags = {tag for item in items for tag in tags(item)}
+    current = tag_versions(db, all_tags)
+    fragments = []
+    for item in items:
+        versions = {tag: current[tag] for tag in tags(item)}
+        entry = cache.local.get(key(item))
+        if entry is None or entry.tags != versions:
+            body = env.get_template(template).render(item=item, **context).encode('utf-8')
+            entry = cache.set(key(item), body, versions, shared=False)
+        fragments.append(Markup(entry.body.decode('utf-8')))
+    return fragments
@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import threading
+
+# Past this many logged changes a full reload is cheaper than patching.
+RELOAD_AFTER = 50_000
+CHUNK = 500
+
+_followers = {}
+_followers_lock = threading.Lock()
+
+
+def fetch_in_chunks(con, sql, ids):
+    # sql contains {marks}, e.g. 'SELECT ... WHERE id IN ({marks})'.
+    rows = []
+    for start in range(0, len(ids), CHUNK):
+        chunk = ids[start:start + CHUNK]
+        rows.extend(con.execute(sql.format(marks=', '.join('?' * len(chunk))), chunk))
+    return rows
+
+
+class ChangeFollower:
+    # Keeps an in-memory copy of match data up to date. load(con) builds a
+    # new copy and patch(copy, con, match_ids) returns one with the given
+    # matches re-read. A private read-only connection is used so PRAGMA
+    # data_version, which only changes when some other connection commits,
+    # tells when to look at the match_change log (migration 0006).
+    def __init__(self, database, load, patch):
+        self.database = database
+        self.load = load
+        self.patch = patch
+        self._lock = threading.Lock()
+        self._con = None
+        self._pid = None
+        self.data_version = None
+        self.last_seq = 0
+        self.data = None
+
+    def _connection(self):
+        if self._con is None or self._pid != os.getpid():
+            path = os.path.abspath(self.database)
+            self._con = sqlite3.connect(f'file:{path}?mode=ro', uri=True,
+                                        check_same_thread=False)
+            self._pid = os.getpid()
+            self.data = None
+            self.data_version = None
+        return self._con
+
+    def current(self):
+        with self._lock:
+            con = self._connection()
+            version = con.execute('PRAGMA data_version').fetchone()[0]
+            if self.data is None or version != self.data_version:
+                con.execute('BEGIN')
+                try:
+                    self._refresh(con)
+                finally:
+                    con.rollback()
+                self.data_version = version
+            return self.data
+
+    def _refresh(self, con):
+        low, high = con.execute('SELECT MIN(seq), MAX(seq) FROM match_change').fetchone()
+        high = high or 0
+        if (self.data is None or high - self.last_seq > RELOAD_AFTER
+                or (low is not None and low > self.last_seq + 1)):
+            self.data = self.load(con)
+        elif high > self.last_seq:
+            changed = sorted({row[0] for row in con.execute(
+                'SELECT match_id FROM match_change WHERE seq > ?', (self.last_seq,))})
+            self.data = self.patch(self.data, con, changed)
+        self.last_seq = high
+
+    def close(self):
+        with self._lock:
+            if self._con is not None and self._pid == os.getpid():
+                self._con.close()
+            self._con = None
+            self.data = None
+
+
+def get_follower(database, name, load, patch):
+    key = (os.path.abspath(database), name)
+    follower = _followers.get(key)
+    if follower is None:
+        with _followers_lock:
+            follower = _followers.setdefault(key, ChangeFollower(database, load, patch))
+    return follower
@@ -1 +1,96 @@
 SECRET_KEY = 'tosisalainenavain'
+
+# SQLite connection pool. Every worker process keeps its own pool of
+# read-only and writer connections, and the PRAGMAs below are applied to
+# each connection when it is opened.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'foreign_keys': 'ON',
+    'busy_timeout': 5000,
+    'cache_size': -16000,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+DB_READ_POOL_SIZE = 8
+DB_WRITE_POOL_SIZE = 4
+DB_POOL_TIMEOUT = 10
+DB_POOL_MAX_AGE = 600
+DB_POOL_HEALTH_CHECK = 30
+
+# Rendered-page cache. Pages for visitors who are not logged in are kept
+# in a per-process LRU of CACHE_MAX_BYTES. CACHE_BACKEND = 'sqlite' adds a
+# cache file (CACHE_PATH) shared by all processes on the host.
+CACHE_ENABLED = True
+CACHE_MAX_BYTES = 32 * 1024 * 1024
+CACHE_BACKEND = None
+CACHE_PATH = 'cache.db'
+
+# The match page asks /matches/<id>/comments?after=<id> for new comments
+# every COMMENT_POLL_DELAY seconds. With COMMENT_POLL_MAX_WAIT above 0 it
+# long-polls instead: the request is held open for at most that many
+# seconds, checking every COMMENT_POLL_INTERVAL. A held request ties up
+# its worker, so only turn this on with a threaded or async server
+# (e.g. gunicorn --threads or gevent workers).
+COMMENT_POLL_DELAY = 5
+COMMENT_POLL_MAX_WAIT = 0
+COMMENT_POLL_INTERVAL = 1
+
+# Comments and match deletions can go through a single writer thread that
+# commits them in groups of up to WRITE_QUEUE_MAX_BATCH, waiting at most
+# WRITE_QUEUE_MAX_DELAY seconds for a group to fill. WRITE_QUEUE_MODE =
+# 'wait' answers the request once the write is committed, 'async' right
+# away (a crash can then lose the last writes). Queue depth and flush
+# times are shown at /status.
+WRITE_QUEUE_ENABLED = False
+WRITE_QUEUE_MODE = 'wait'
+WRITE_QUEUE_MAX_BATCH = 200
+WRITE_QUEUE_MAX_DELAY = 0.002
+WRITE_QUEUE_TIMEOUT = 10
+
+# Password hashing. PASSWORD_HASH_METHOD is passed to werkzeug's
+# generate_password_hash; older hashes are replaced on the next login.
+# Hashing runs in PASSWORD_HASH_WORKERS processes (0 = in the request
+# thread) and at most PASSWORD_HASH_QUEUE hashes may be waiting, after
+# which login and registration answer 503 straight away. Failed logins are
+# limited per username and per address within LOGIN_ATTEMPT_WINDOW
+# seconds (429).
+PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+PASSWORD_HASH_WORKERS = 2
+PASSWORD_HASH_QUEUE = 16
+PASSWORD_HASH_TIMEOUT = 5
+LOGIN_ATTEMPTS_PER_USER = 10
+LOGIN_ATTEMPTS_PER_IP = 50
+LOGIN_ATTEMPT_WINDOW = 300
+
+# Serve the unfiltered /matches listing from an in-memory copy of its
+# columns (listing.py, about 40 bytes per match plus the title and
+# description text) instead of SQLite. The copy follows writes through the
+# match_change log.
+LISTING_INDEX_ENABLED = False
+
+# Request latency, SQL statement counts and times, rows fetched and
+# template render time per route, in Prometheus text format at /metrics.
+METRICS_ENABLED = True
+
+# Statements slower than SLOW_QUERY_THRESHOLD seconds are written to
+# SLOW_QUERY_LOG (None = off) with their query plan. SLOW_QUERY_SAMPLE is
+# the share of slow statements logged and SLOW_QUERY_MAX_PER_MINUTE caps
+# the lines per process. Summary: python3 app.py slow-queries
+SLOW_QUERY_LOG = None
+SLOW_QUERY_THRESHOLD = 0.1
+SLOW_QUERY_SAMPLE = 1.0
+SLOW_QUERY_MAX_PER_MINUTE = 60
+
+# create_app() warms a new worker up before its first request: it compiles
+# every template, requests WARM_UP_PATHS once and opens the pooled
+# connections with the statements of those pages prepared. Compiled
+# templates are shared by all workers in JINJA_CACHE_DIR (None = off).
+# The timings are shown at /status and by python3 app.py warm-up
+WARM_UP = True
+WARM_UP_PATHS = ('/matches', '/standings', '/login', '/register')
+JINJA_CACHE_DIR = '.jinja_cache'
+
+# Where python3 app.py archive --before YYYY-MM-DD puts the season archives
+# it moves old matches to. The app finds them through the archive table.
+ARCHIVE_DIR = 'archive'
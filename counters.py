@@ -0,0 +1,114 @@
+from archive import qualify
+
+COUNTER_QUERIES = {
+    'match': 'SELECT 0, COUNT(*) FROM match',
+    'user_match': 'SELECT owner_id, COUNT(*) FROM match GROUP BY owner_id',
+    'match_comment': 'SELECT match_id, COUNT(*) FROM comment GROUP BY match_id',
+    'category_match': '''SELECT category_id, COUNT(*) FROM match_category
+                         GROUP BY category_id''',
+    'user_comment': 'SELECT user_id, COUNT(*) FROM comment GROUP BY user_id',
+    'user_home_win': '''SELECT owner_id, COUNT(*) FROM match
+                        WHERE home_goals > away_goals GROUP BY owner_id''',
+    'user_draw': '''SELECT owner_id, COUNT(*) FROM match
+                    WHERE home_goals = away_goals GROUP BY owner_id''',
+    'user_away_win': '''SELECT owner_id, COUNT(*) FROM match
+                        WHERE home_goals < away_goals GROUP BY owner_id''',
+}
+
+
+def get_counter(db, scope, key=0):
+    row = db.execute('SELECT value FROM counter WHERE scope = ? AND key = ?',
+                     (scope, key)).fetchone()
+    return row[0] if row else 0
+
+
+def _totals(db, sql, schemas, width):
+    # Rows of sql keyed by their first width columns, with the other
+    # columns summed over the main database and the archives attached as
+    # schemas (see archive.py).
+    totals = {}
+    for schema in (None, *schemas):
+        for row in db.execute(qualify(sql, schema)):
+            key, values = tuple(row[:width]), tuple(row[width:])
+            if key in totals:
+                values = tuple(a + b for a, b in zip(totals[key], values))
+            totals[key] = values
+    return totals
+
+
+def check_counters(db, schemas=()):
+    problems = []
+    for scope, sql in COUNTER_QUERIES.items():
+        expected = {key: value for (key,), (value,) in _totals(db, sql, schemas, 1).items()}
+        stored = {key: value for key, value in db.execute(
+            'SELECT key, value FROM counter WHERE scope = ?', (scope,))}
+        for key in sorted(expected.keys() | stored.keys()):
+            if expected.get(key, 0) != stored.get(key, 0):
+                problems.append((scope, key, stored.get(key, 0), expected.get(key, 0)))
+    return problems
+
+
+def repair_counters(db, schemas=()):
+    db.execute('DELETE FROM counter')
+    for scope, sql in COUNTER_QUERIES.items():
+        db.executemany('INSERT INTO counter (scope, key, value) VALUES (?, ?, ?)',
+                       [(scope, *key, *value)
+                        for key, value in _totals(db, sql, schemas, 1).items()])
+    db.commit()
+
+
+STANDINGS_QUERY = '''
+    SELECT side.season, c.category_id, side.team, COUNT(*), SUM(side.won),
+           SUM(side.drawn), SUM(side.lost), SUM(side.goals_for),
+           SUM(side.goals_against), SUM(side.points)
+    FROM match_side AS side
+    JOIN (SELECT id AS match_id, 0 AS category_id FROM match
+          UNION ALL SELECT match_id, category_id FROM match_category) AS c
+      ON c.match_id = side.match_id
+    GROUP BY side.season, c.category_id, side.team
+'''
+
+
+def check_standings(db, schemas=()):
+    expected = _totals(db, STANDINGS_QUERY, schemas, 3)
+    stored = {tuple(row[:3]): tuple(row[3:]) for row in db.execute(
+        '''SELECT season, category_id, team, played, won, drawn, lost,
+                  goals_for, goals_against, points FROM standing''')}
+    return [(key, stored.get(key), expected.get(key))
+            for key in sorted(expected.keys() | stored.keys())
+            if expected.get(key) != stored.get(key)]
+
+
+def repair_standings(db, schemas=()):
+    db.execute('DELETE FROM standing')
+    db.executemany('''INSERT INTO standing (season, category_id, team, played, won, drawn,
+                      lost, goals_for, goals_against, points)
+                      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                   [(*key, *values) for key, values in
+                    _totals(db, STANDINGS_QUERY, schemas, 3).items()])
+    db.commit()
+
+
+USER_TEAM_QUERY = '''
+    SELECT owner_id, team, COUNT(*), SUM(won), SUM(drawn), SUM(lost)
+    FROM match_team
+    GROUP BY owner_id, team
+'''
+
+
+def check_user_teams(db, schemas=()):
+    expected = _totals(db, USER_TEAM_QUERY, schemas, 2)
+    stored = {tuple(row[:2]): tuple(row[2:]) for row in db.execute(
+        'SELECT user_id, team, matches, won, drawn, lost FROM user_team')}
+    return [(key, stored.get(key), expected.get(key))
+            for key in sorted(expected.keys() | stored.keys())
+            if expected.get(key) != stored.get(key)]
+
+
+def repair_user_teams(db, schemas=()):
+    db.execute('DELETE FROM user_team')
+    db.executemany('''INSERT INTO user_team (user_id, team, matches, won, drawn, lost)
+                      VALUES (?, ?, ?, ?, ?, ?)''',
+                   [(*key, *values) for key, values in
+                    _totals(db, USER_TEAM_QUERY, schemas, 2).items()])
+    db.commit()
@@ -1,13 +1,178 @@
+import os
 import sqlite3
+import threading
+import time
+from queue import LifoQueue, Empty
 from flask import g, current_app
 
-def get_connection():
-    database = current_app.config.get('DATABASE', 'database.db')
-    con = sqlite3.connect(database)
-    con.execute("PRAGMA foreign_keys = ON")
-    con.row_factory = sqlite3.Row
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'foreign_keys': 'ON',
+    'busy_timeout': 5000,
+}
+
+# journal_mode is a property of the database file and can only be
+# changed through a connection that is allowed to write.
+WRITE_ONLY_PRAGMAS = ('journal_mode',)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Callables run on every new connection, e.g. to install trace callbacks.
+connect_hooks = []
+# Cursor class for execute() and executemany() on pooled connections, e.g.
+# one that times every statement (see metrics.py).
+cursor_class = None
+
+
+class PooledConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.pid = os.getpid()
+        # Schema names of the season archives attached to this connection,
+        # least recently used first (see archive.py).
+        self.attached = {}
+
+    def execute(self, sql, parameters=(), /):
+        if cursor_class is None:
+            return super().execute(sql, parameters)
+        return self.cursor(cursor_class).execute(sql, parameters)
+
+    def executemany(self, sql, parameters, /):
+        if cursor_class is None:
+            return super().executemany(sql, parameters)
+        return self.cursor(cursor_class).executemany(sql, parameters)
+
+
+class ConnectionPool:
+    def __init__(self, database, readonly=False, size=8, pragmas=None,
+                 max_age=600, health_check=30, timeout=10):
+        self.database = database
+        self.readonly = readonly
+        self.size = size
+        self.pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+        self.max_age = max_age
+        self.health_check = health_check
+        self.timeout = timeout
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self._idle = LifoQueue(maxsize=self.size)
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def _connect(self):
+        if self.readonly:
+            path = os.path.abspath(self.database)
+            con = sqlite3.connect(f'file:{path}?mode=ro', uri=True,
+                                  check_same_thread=False,
+                                  factory=PooledConnection)
+        else:
+            con = sqlite3.connect(self.database, check_same_thread=False,
+                                  isolation_level='IMMEDIATE',
+                                  factory=PooledConnection)
+        con.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            if self.readonly and name in WRITE_ONLY_PRAGMAS:
+                continue
+            con.execute(f'PRAGMA {name} = {value}')
+        for hook in connect_hooks:
+            hook(con)
+        return con
+
+    def _usable(self, con):
+        now = time.monotonic()
+        if now - con.created_at > self.max_age:
+            return False
+        if now - con.last_used > self.health_check:
+            try:
+                con.execute('SELECT 1').fetchone()
+            except sqlite3.Error:
+                return False
+        return True
+
+    def acquire(self):
+        if self.pid != os.getpid():
+            # Connections inherited over fork() must not be used or closed
+            # by the child; start over with an empty pool.
+            self._reset()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError('connection pool exhausted')
+        try:
+            while True:
+                try:
+                    con = self._idle.get_nowait()
+                except Empty:
+                    return self._connect()
+                if self._usable(con):
+                    return con
+                con.close()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, con):
+        if con.pid != self.pid:
+            return
+        try:
+            if con.in_transaction:
+                con.rollback()
+            if time.monotonic() - con.created_at > self.max_age:
+                con.close()
+            else:
+                con.last_used = time.monotonic()
+                self._idle.put_nowait(con)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
+
+
+def get_pool(readonly=False):
+    config = current_app.config
+    database = config.get('DATABASE', 'database.db')
+    key = (database, readonly)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                size_key = 'DB_READ_POOL_SIZE' if readonly else 'DB_WRITE_POOL_SIZE'
+                pool = ConnectionPool(
+                    database, readonly=readonly,
+                    size=config.get(size_key, 8 if readonly else 4),
+                    pragmas=config.get('SQLITE_PRAGMAS'),
+                    max_age=config.get('DB_POOL_MAX_AGE', 600),
+                    health_check=config.get('DB_POOL_HEALTH_CHECK', 30),
+                    timeout=config.get('DB_POOL_TIMEOUT', 10))
+                _pools[key] = pool
+    return pool
+
+
+def get_connection(readonly=False):
+    name = 'db_readonly' if readonly else 'db'
+    con = g.get(name)
+    if con is None:
+        con = get_pool(readonly).acquire()
+        setattr(g, name, con)
     return con
 
+
+def release_connections(error=None):  # pylint: disable=unused-argument
+    for name, readonly in (('db', False), ('db_readonly', True)):
+        con = g.pop(name, None)
+        if con is not None:
+            get_pool(readonly).release(con)
+
+
 def execute(sql, params=None):
     if params is None:
         params = []
@@ -15,7 +180,6 @@ def execute(sql, params=None):
     cur = con.execute(sql, params)
     con.commit()
     g.last_insert_id = cur.lastrowid
-    con.close()
     return cur
 
 def last_insert_id():
@@ -24,8 +188,5 @@ def last_insert_id():
 def query(sql, params=None):
     if params is None:
         params = []
-    con = get_connection()
-    cur = con.execute(sql, params)
-    rows = cur.fetchall()
-    con.close()
-    return rows
+    con = get_connection(readonly=True)
+    return con.execute(sql, params).fetchall()
@@ -0,0 +1,129 @@
+import csv
+import json
+from search import fts_query
+from archive import get_archives, attach, qualify
+
+BATCH_SIZE = 500
+FLUSH_SIZE = 64 * 1024
+FIELDS = ('id', 'title', 'date', 'opponent', 'result', 'location', 'description',
+          'custom_category', 'owner_id', 'owner', 'categories')
+
+
+class _Buffer:
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+
+    def drain(self):
+        text = ''.join(self.parts)
+        self.parts = []
+        self.size = 0
+        return text
+
+
+def _comments_for(db, match_ids, schema=None):
+    marks = ', '.join('?' * len(match_ids))
+    comments = {}
+    for row in db.execute(qualify(f'''
+        SELECT comment.match_id, comment.id, user.username, comment.content,
+               comment.created_at
+        FROM comment
+        JOIN user ON comment.user_id = user.id
+        WHERE comment.match_id IN ({marks})
+        ORDER BY comment.match_id, comment.id
+    ''', schema), match_ids):
+        comments.setdefault(row['match_id'], []).append({
+            'id': row['id'], 'username': row['username'],
+            'content': row['content'], 'created_at': row['created_at']})
+    return comments
+
+
+def _source_rows(db, schema, where, params, comments):
+    # The matches of the main database (schema None) or of one attached
+    # archive, read from one snapshot.
+    db.execute('BEGIN')
+    try:
+        cursor = db.execute(qualify(f'''
+            /* full-scan: an export reads every match */
+            SELECT match.id, match.title, match.date, match.opponent, match.result,
+                   match.location, match.description, match.custom_category,
+                   match.owner_id, user.username AS owner,
+                   (SELECT group_concat(category.name, ';')
+                    FROM match_category
+                    JOIN category ON category.id = match_category.category_id
+                    WHERE match_category.match_id = match.id) AS categories
+            FROM match
+            JOIN user ON match.owner_id = user.id
+            {where}
+            ORDER BY match.id
+        ''', schema), params)
+        while True:
+            batch = cursor.fetchmany(BATCH_SIZE)
+            if not batch:
+                break
+            by_match = (_comments_for(db, [row['id'] for row in batch], schema)
+                        if comments else {})
+            for row in batch:
+                item = {field: row[field] for field in FIELDS}
+                item['categories'] = row['categories'].split(';') if row['categories'] else []
+                if comments:
+                    item['comments'] = by_match.get(row['id'], [])
+                yield item
+    finally:
+        db.rollback()
+
+
+def export_rows(db, q='', comments=False):
+    # Rows come straight off the cursor in batches, so memory use depends
+    # on BATCH_SIZE and not on the size of the result. The main database
+    # comes first, then the archived seasons oldest first, each in id
+    # order. Archives are attached in between, since that cannot be done
+    # inside a transaction; a match archived while an export runs may be
+    # listed twice.
+    where = ''
+    params = ()
+    fts = fts_query(q)
+    if fts:
+        where = 'WHERE match.id IN (SELECT rowid FROM match_fts WHERE match_fts MATCH ?)'
+        params = (fts,)
+
+    yield from _source_rows(db, None, where, params, comments)
+    for archive in get_archives(db):
+        yield from _source_rows(db, attach(db, archive), where, params, comments)
+
+
+def export_csv(rows, comments=False):
+    buffer = _Buffer()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS + (('comments',) if comments else ()))
+    yield buffer.drain()
+    for item in rows:
+        line = [item[field] for field in FIELDS]
+        line[FIELDS.index('categories')] = ';'.join(item['categories'])
+        if comments:
+            line.append(json.dumps(item['comments'], ensure_ascii=False))
+        writer.writerow(line)
+        if buffer.size >= FLUSH_SIZE:
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def export_ndjson(rows):
+    buffer = _Buffer()
+    for item in rows:
+        buffer.write(json.dumps(item, ensure_ascii=False, separators=(',', ':')))
+        buffer.write('\n')
+        if buffer.size >= FLUSH_SIZE:
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def export(db, fmt, q='', comments=False):
+    rows = export_rows(db, q, comments)
+    if fmt == 'csv':
+        return export_csv(rows, comments)
+    return export_ndjson(rows)
@@ -0,0 +1,212 @@
+import datetime
+import re
+import numpy as np
+from analytics import Names
+from changelog import get_follower, fetch_in_chunks
+
+FACETS = ('category', 'opponent', 'location', 'result', 'season')
+OPTIONS_SHOWN = 12
+# Counts for a search are only computed when it has at most this many hits.
+SEARCH_LIMIT = 100_000
+DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+MATCH_QUERY = '''
+    SELECT id, CAST(julianday(date) - 2440587.5 AS INTEGER), opponent, location, result
+    FROM match
+'''
+LINK_QUERY = 'SELECT match_id, category_id FROM match_category'
+
+
+def parse_filters(args):
+    # The filters given in the query string, in the form url_for() takes.
+    filters = {}
+    category = args.get('category', type=int)
+    if category:
+        filters['category'] = category
+    for name in ('opponent', 'location', 'result'):
+        value = args.get(name, '').strip()
+        if value:
+            filters[name] = value
+    for name in ('date_from', 'date_to'):
+        value = args.get(name, '').strip()
+        if _valid_date(value):
+            filters[name] = value
+    return filters
+
+
+def _valid_date(value):
+    # YYYY-MM-DD naming a real day; 2024-02-30 is dropped like any typo.
+    if not DATE_RE.match(value):
+        return False
+    try:
+        datetime.date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def filter_sql(filters):
+    # WHERE clause and parameters for the listing. Dates compare as text,
+    # so both bounds are always given to leave out non-ISO values.
+    conditions, params = [], []
+    if 'category' in filters:
+        conditions.append('''EXISTS (SELECT 1 FROM match_category
+                                     WHERE match_category.match_id = match.id
+                                       AND match_category.category_id = ?)''')
+        params.append(filters['category'])
+    for name in ('opponent', 'location', 'result'):
+        if name in filters:
+            conditions.append(f'match.{name} = ?')
+            params.append(filters[name])
+    if 'date_from' in filters or 'date_to' in filters:
+        conditions.append('match.date >= ? AND match.date <= ?')
+        params.extend([filters.get('date_from', '0000-00-00'),
+                       filters.get('date_to', '9999-99-99')])
+    return ' AND '.join(conditions), tuple(params)
+
+
+def _day(value):
+    return int(np.datetime64(value, 'D').astype(np.int64))
+
+
+class FacetArrays:
+    # Column-wise copy of the filterable match fields, sorted by id, plus the
+    # category links. Never modified after construction.
+    def __init__(self, names, ids, days, values, link_match, link_category):
+        self.names = names
+        self.ids = ids
+        self.days = days
+        self.values = values
+        self.link_match = link_match
+        self.link_category = link_category
+        self.link_pos = np.searchsorted(ids, link_match)
+        known = days != np.iinfo(np.int32).min
+        years = days.astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64) + 1970
+        self.years = np.where(known, years, 0)
+        self.unfiltered = self._count(np.ones(len(ids), dtype=bool), {})
+
+    @classmethod
+    def from_rows(cls, rows, links, names=None):
+        names = names or {name: Names(['']) for name in ('opponent', 'location', 'result')}
+        missing = np.iinfo(np.int32).min
+        rows = sorted(rows)
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        days = np.array([missing if row[1] is None else row[1] for row in rows],
+                        dtype=np.int32)
+        values = {name: names[name].ids([row[i] or '' for row in rows])
+                  for i, name in enumerate(('opponent', 'location', 'result'), start=2)}
+        link_match = np.array([link[0] for link in links], dtype=np.int64)
+        link_category = np.array([link[1] for link in links], dtype=np.int32)
+        return cls(names, ids, days, values, link_match, link_category)
+
+    @classmethod
+    def load(cls, con):
+        rows = con.execute(f'{MATCH_QUERY} /* full-scan: facets load every match */')
+        links = con.execute(f'{LINK_QUERY} /* full-scan: facets load every link */')
+        return cls.from_rows(rows.fetchall(), links.fetchall())
+
+    def patch(self, con, match_ids):
+        changed = np.array(match_ids, dtype=np.int64)
+        rows = fetch_in_chunks(con, MATCH_QUERY + ' WHERE id IN ({marks})', match_ids)
+        links = fetch_in_chunks(con, LINK_QUERY + ' WHERE match_id IN ({marks})', match_ids)
+        names = {name: values.copy() for name, values in self.names.items()}
+        added = FacetArrays.from_rows(rows, links, names)
+
+        keep = ~np.isin(self.ids, changed)
+        ids = np.concatenate([self.ids[keep], added.ids])
+        order = np.argsort(ids, kind='stable')
+        keep_links = ~np.isin(self.link_match, changed)
+        return FacetArrays(
+            names, ids[order],
+            np.concatenate([self.days[keep], added.days])[order],
+            {name: np.concatenate([self.values[name][keep], added.values[name]])[order]
+             for name in self.values},
+            np.concatenate([self.link_match[keep_links], added.link_match]),
+            np.concatenate([self.link_category[keep_links], added.link_category]))
+
+    def _masks(self, filters):
+        masks = {}
+        if 'category' in filters:
+            mask = np.zeros(len(self.ids), dtype=bool)
+            mask[self.link_pos[self.link_category == filters['category']]] = True
+            masks['category'] = mask
+        for name in ('opponent', 'location', 'result'):
+            if name in filters:
+                value = self.names[name].index.get(filters[name])
+                masks[name] = (self.values[name] == value if value is not None
+                               else np.zeros(len(self.ids), dtype=bool))
+        if 'date_from' in filters or 'date_to' in filters:
+            # The season facet narrows the date range, so it is the facet
+            # the date filter is left out of.
+            low = _day(filters.get('date_from', '0001-01-01'))
+            high = _day(filters.get('date_to', '9999-12-31'))
+            masks['season'] = (self.days >= low) & (self.days <= high)
+        return masks
+
+    def _count(self, base, masks):
+        # For each facet, the counts with every filter except its own, so
+        # each option shows how many matches choosing it would give.
+        counts = {}
+        for facet in FACETS:
+            mask = base.copy()
+            for name, other in masks.items():
+                if name != facet:
+                    mask &= other
+            if facet == 'category':
+                values = self.link_category[mask[self.link_pos]]
+            elif facet == 'season':
+                values = self.years[mask & (self.years > 0)]
+            else:
+                values = self.values[facet][mask]
+            found = np.bincount(values) if len(values) else np.zeros(0, dtype=np.int64)
+            nonzero = np.flatnonzero(found)
+            counts[facet] = dict(zip(nonzero.tolist(), found[nonzero].tolist()))
+        total = base.copy()
+        for other in masks.values():
+            total &= other
+        counts['total'] = int(np.count_nonzero(total))
+        return counts
+
+    def counts(self, filters, match_ids=None):
+        # match_ids limits the counts to e.g. the hits of a search.
+        masks = self._masks(filters)
+        if match_ids is None:
+            if not masks:
+                return self.unfiltered
+            base = np.ones(len(self.ids), dtype=bool)
+        else:
+            hits = np.sort(np.array(match_ids, dtype=np.int64))
+            pos = np.searchsorted(hits, self.ids).clip(max=max(len(hits) - 1, 0))
+            base = hits[pos] == self.ids if len(hits) else np.zeros(len(self.ids), dtype=bool)
+        return self._count(base, masks)
+
+    def options(self, counts, filters, categories):
+        # Most common values of every facet as (value, label, count), always
+        # including the selected one.
+        result = {}
+        for facet in FACETS:
+            found = counts[facet]
+            if facet == 'category':
+                labels = {key: categories[key] for key in found if key in categories}
+                selected = filters.get('category')
+            elif facet == 'season':
+                labels = {key: str(key) for key in found}
+                selected = None
+                if 'date_from' in filters:
+                    selected = int(filters['date_from'][:4])
+            else:
+                names = self.names[facet].names
+                labels = {key: names[key] for key in found if names[key]}
+                selected = self.names[facet].index.get(filters.get(facet))
+            shown = sorted(labels, key=lambda key: (-found[key], labels[key]))[:OPTIONS_SHOWN]
+            if facet == 'season':
+                shown.sort(reverse=True)
+            if selected is not None and selected in labels and selected not in shown:
+                shown.append(selected)
+            value_of = (lambda key: key) if facet == 'category' else (lambda key: labels[key])
+            result[facet] = [(value_of(key), labels[key], found[key]) for key in shown]
+        return result
+
+
+def get_facets(database):
+    return get_follower(database, 'facets', FacetArrays.load, FacetArrays.patch)
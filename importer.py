@@ -0,0 +1,191 @@
+import csv
+import datetime
+import json
+import re
+import time
+from itertools import islice
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 20
+RESULT_RE = re.compile(r'^(\d+)\s*[-–]\s*(\d+)$')
+CATEGORY_SEPARATORS = re.compile(r'[;|]')
+TEXT_FIELDS = ('title', 'date', 'opponent', 'result', 'location',
+               'description', 'custom_category')
+
+
+class ImportProgress:
+    def __init__(self, resumed_from=0):
+        self.started = time.monotonic()
+        self.resumed_from = resumed_from
+        self.rows_read = 0
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self):
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f'{self.imported} imported, {self.skipped} skipped '
+                f'({self.rate:.0f} rows/s)')
+
+
+def detect_format(filename):
+    if filename.lower().endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    return 'csv'
+
+
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    elif fmt == 'ndjson':
+        for line in stream:
+            if line.strip():
+                yield line
+    else:
+        raise ValueError(f'unknown format: {fmt}')
+
+
+def clean_row(raw):
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'invalid JSON: {e.msg}') from e
+    if not isinstance(raw, dict):
+        raise ValueError('row is not an object')
+
+    row = {}
+    for field in TEXT_FIELDS:
+        value = raw.get(field)
+        row[field] = '' if value is None else str(value).strip()
+    if not row['title']:
+        raise ValueError('title is required')
+    if row['date']:
+        try:
+            row['date'] = datetime.date.fromisoformat(row['date']).isoformat()
+        except ValueError as e:
+            raise ValueError(f"invalid date: {row['date']}") from e
+    if row['result']:
+        found = RESULT_RE.match(row['result'])
+        if not found:
+            raise ValueError(f"invalid result: {row['result']}")
+        row['result'] = f'{found.group(1)}-{found.group(2)}'
+
+    categories = raw.get('categories') or []
+    if isinstance(categories, str):
+        categories = CATEGORY_SEPARATORS.split(categories)
+    row['categories'] = [str(name).strip() for name in categories if str(name).strip()]
+    return row
+
+
+class CategoryCache:
+    def __init__(self, db):
+        self.db = db
+        self.ids = {row[1]: row[0] for row in db.execute('SELECT id, name FROM category')}
+
+    def resolve(self, name):
+        category_id = self.ids.get(name)
+        if category_id is None:
+            self.db.execute('INSERT OR IGNORE INTO category (name) VALUES (?)', (name,))
+            category_id = self.db.execute(
+                'SELECT id FROM category WHERE name = ?', (name,)).fetchone()[0]
+            self.ids[name] = category_id
+        return category_id
+
+
+def job_state(db, job):
+    row = db.execute('SELECT rows_done, finished FROM import_job WHERE name = ?',
+                     (job,)).fetchone()
+    return (row[0], bool(row[1])) if row else (0, False)
+
+
+def _next_match_id(db):
+    # Rows get explicit ids so their category links can be written with
+    # executemany too. Taking sqlite_sequence into account keeps the
+    # AUTOINCREMENT promise of never reusing the id of a deleted match.
+    row = db.execute('''
+        SELECT MAX(IFNULL((SELECT MAX(id) FROM match), 0),
+                   IFNULL((SELECT seq FROM sqlite_sequence WHERE name = 'match'), 0))
+    ''').fetchone()
+    return row[0] + 1
+
+
+def _write_chunk(db, rows, owner_id, categories, job, rows_done):
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        first_id = _next_match_id(db)
+        matches = []
+        links = []
+        for match_id, row in enumerate(rows, start=first_id):
+            matches.append((match_id, row['title'], row['description'], row['date'],
+                            row['opponent'], row['result'], row['location'],
+                            row['custom_category'], owner_id))
+            for name in row['categories']:
+                links.append((match_id, categories.resolve(name)))
+        db.executemany(
+            '''INSERT INTO match (id, title, description, date, opponent, result,
+               location, custom_category, owner_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            matches)
+        db.executemany(
+            'INSERT OR IGNORE INTO match_category (match_id, category_id) VALUES (?, ?)',
+            links)
+        db.execute('''
+            INSERT INTO import_job (name, rows_done, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (name) DO UPDATE SET rows_done = excluded.rows_done,
+                                             finished = 0,
+                                             updated_at = excluded.updated_at
+        ''', (job, rows_done))
+        db.commit()
+    except BaseException:
+        db.rollback()
+        # The category ids cached during this chunk were rolled back too.
+        categories.ids = {row[1]: row[0] for row in db.execute('SELECT id, name FROM category')}
+        raise
+
+
+def run_import(db, stream, fmt, owner_id, job, chunk_size=CHUNK_SIZE, restart=False):
+    # Yields the running progress after every committed chunk.
+    rows_done, finished = job_state(db, job)
+    if restart:
+        rows_done = 0
+    elif finished:
+        raise ValueError(f'import {job} has already finished')
+
+    stats = ImportProgress(resumed_from=rows_done)
+    categories = CategoryCache(db)
+    numbered = enumerate(read_rows(stream, fmt), start=1)
+    pending = ((line, raw) for line, raw in numbered if line > rows_done)
+
+    while True:
+        chunk = list(islice(pending, chunk_size))
+        if not chunk:
+            break
+        valid = []
+        for line, raw in chunk:
+            try:
+                valid.append(clean_row(raw))
+            except ValueError as e:
+                stats.skipped += 1
+                if len(stats.errors) < MAX_REPORTED_ERRORS:
+                    stats.errors.append((line, str(e)))
+        _write_chunk(db, valid, owner_id, categories, job, chunk[-1][0])
+        stats.rows_read += len(chunk)
+        stats.imported += len(valid)
+        yield stats
+
+    db.execute('''
+        INSERT INTO import_job (name, rows_done, finished, updated_at)
+        VALUES (?, ?, 1, CURRENT_TIMESTAMP)
+        ON CONFLICT (name) DO UPDATE SET finished = 1, updated_at = excluded.updated_at
+    ''', (job, rows_done + stats.rows_read))
+    db.commit()
+    if not stats.rows_read:
+        yield stats
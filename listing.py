@@ -0,0 +1,242 @@
+from bisect import bisect_left, bisect_right
+import numpy as np
+from analytics import Names
+from changelog import get_follower, fetch_in_chunks
+
+# Columns of the /matches listing. Title and description come as UTF-8
+# bytes, which is how they are kept; usernames are read separately.
+LISTING_QUERY = '''
+    SELECT id, date, owner_id, ifnull(CAST(title AS BLOB), X''),
+           ifnull(CAST(description AS BLOB), X''), opponent, result, location
+    FROM match
+'''
+# A key is (date rank + 1) << ID_BITS | id, so ids must stay below 2**40.
+ID_BITS = 40
+ID_MASK = (1 << ID_BITS) - 1
+# Patches append their text as a new segment; past this many segments, or
+# when over half of the text belongs to changed or deleted matches, the
+# text is packed into one segment again.
+MAX_SEGMENTS = 64
+# The index of 1M matches must fit in 96 MiB, so at any size it may use
+# this many bytes per match (arrays and text together).
+MAX_BYTES_PER_MATCH = 96 * 2**20 / 1_000_000
+
+
+class ListingRow:
+    # One match of a listing page. Rows are only built for the page shown;
+    # row['id'] works too, so a row can stand in for a sqlite3.Row.
+    __slots__ = ('id', 'title', 'description', 'date', 'opponent', 'result',
+                 'location', 'owner_id', 'username', 'categories')
+
+    def __init__(self, match_id, title, description, date, opponent, result,
+                 location, owner_id, username):
+        self.id = match_id
+        self.title = title
+        self.description = description
+        self.date = date
+        self.opponent = opponent
+        self.result = result
+        self.location = location
+        self.owner_id = owner_id
+        self.username = username
+        self.categories = None
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+class ListingIndex:
+    # Every match in (date, id) order, as a few flat arrays: the sort key,
+    # the owner and interned opponent, result and location ids, and where
+    # the UTF-8 title and description start in the text segments. About
+    # 40 bytes per match plus its text. Like the analytics arrays an
+    # instance is never modified; patch() returns a new one that shares
+    # the unchanged text.
+    def __init__(self, dates, names, usernames, keys, owners, opponents, results,
+                 locations, starts, title_lengths, description_lengths,
+                 segments, garbage=0):
+        self.dates = dates
+        self.names = names
+        self.usernames = usernames
+        self.keys = keys
+        self.owners = owners
+        self.opponents = opponents
+        self.results = results
+        self.locations = locations
+        self.starts = starts
+        self.title_lengths = title_lengths
+        self.description_lengths = description_lengths
+        self.segments = segments
+        self.bounds = [0]
+        for segment in segments:
+            self.bounds.append(self.bounds[-1] + len(segment))
+        self.garbage = garbage
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_rows(cls, rows, dates=(), names=None, offset=0):
+        # Arrays for rows, sorted by key, and their text starting at
+        # offset. Dates missing from dates are added to the returned,
+        # sorted date list.
+        names = names or Names([''])
+        if not rows:
+            empty = np.empty(0, dtype=np.int64)
+            return list(dates), names, [empty] * 8, b''
+        ids, row_dates, owners, titles, descriptions, opponents, results, locations = zip(*rows)
+        dates = sorted({*dates, *row_dates} - {None})
+        rank = {date: i + 1 for i, date in enumerate(dates)}
+        keys = np.array([rank.get(date, 0) for date in row_dates], dtype=np.int64) << ID_BITS
+        keys |= np.array(ids, dtype=np.int64)
+        title_lengths = np.fromiter(map(len, titles), dtype=np.int32, count=len(rows))
+        description_lengths = np.fromiter(map(len, descriptions), dtype=np.int32,
+                                          count=len(rows))
+        lengths = title_lengths.astype(np.int64) + description_lengths
+        starts = offset + np.cumsum(lengths) - lengths
+        text = bytearray()
+        for title, description in zip(titles, descriptions):
+            text += title
+            text += description
+        order = np.argsort(keys, kind='stable')
+        columns = [keys, np.array(owners, dtype=np.int32),
+                   names.ids([value or '' for value in opponents]),
+                   names.ids([value or '' for value in results]),
+                   names.ids([value or '' for value in locations]),
+                   starts, title_lengths, description_lengths]
+        return dates, names, [column[order] for column in columns], bytes(text)
+
+    @classmethod
+    def load(cls, con):
+        rows = con.execute(f'{LISTING_QUERY} /* full-scan: listing index load */').fetchall()
+        dates, names, columns, text = cls.from_rows(rows)
+        del rows
+        usernames = dict(con.execute(
+            'SELECT id, username FROM user /* full-scan: listing index load */'))
+        return cls(dates, names, usernames, *columns, [text])
+
+    def patch(self, con, match_ids):
+        return self.replace(con, match_ids, fetch_in_chunks(
+            con, LISTING_QUERY + ' WHERE id IN ({marks})', match_ids))
+
+    def replace(self, con, match_ids, rows):
+        # New index without match_ids and with their current rows merged
+        # in; deleted matches simply have no row. Usernames of new owners
+        # are read through con.
+        keep = ~np.isin(self.keys & ID_MASK, np.fromiter(match_ids, dtype=np.int64))
+        garbage = self.garbage + int((self.title_lengths[~keep].sum()
+                                      + self.description_lengths[~keep].sum()))
+        dates, names, added, text = ListingIndex.from_rows(
+            rows, self.dates, self.names.copy(), self.bounds[-1])
+        usernames = self.usernames
+        missing = sorted({row[2] for row in rows} - usernames.keys())
+        if missing:
+            usernames = {**usernames, **dict(fetch_in_chunks(
+                con, 'SELECT id, username FROM user WHERE id IN ({marks})', missing))}
+        columns = [column[keep] for column in (
+            self.keys, self.owners, self.opponents, self.results, self.locations,
+            self.starts, self.title_lengths, self.description_lengths)]
+        if len(dates) != len(self.dates):
+            # New dates shift the ranks of the later ones; the order of
+            # the kept keys stays the same.
+            rank = {date: i + 1 for i, date in enumerate(dates)}
+            remap = np.array([0] + [rank[date] for date in self.dates], dtype=np.int64)
+            columns[0] = remap[columns[0] >> ID_BITS] << ID_BITS | (columns[0] & ID_MASK)
+        positions = np.searchsorted(columns[0], added[0])
+        columns = [np.insert(column, positions, values)
+                   for column, values in zip(columns, added)]
+        segments = self.segments + [text] if text else self.segments
+        index = ListingIndex(dates, names, usernames, *columns, segments, garbage)
+        if len(segments) > MAX_SEGMENTS or garbage > index.bounds[-1] // 2:
+            index = index.compact()
+        return index
+
+    def compact(self):
+        # Copies the text of the current matches into a single segment.
+        text = bytearray()
+        starts = []
+        for start, length in zip(self.starts.tolist(),
+                                 (self.title_lengths + self.description_lengths).tolist()):
+            starts.append(len(text))
+            text += self._text(start, length)
+        starts = np.array(starts, dtype=np.int64)
+        return ListingIndex(self.dates, self.names, self.usernames, self.keys, self.owners,
+                            self.opponents, self.results, self.locations, starts,
+                            self.title_lengths, self.description_lengths, [bytes(text)])
+
+    def _text(self, start, length):
+        if not length:
+            return b''
+        segment = bisect_right(self.bounds, start) - 1
+        start -= self.bounds[segment]
+        return self.segments[segment][start:start + length]
+
+    def _rows(self, start, end):
+        # Rows start..end-1, newest first. The page is sliced out of the
+        # arrays first, so only plain ints are handled per row.
+        page = slice(start, end)
+        names = self.names.names
+        rows = []
+        for key, owner_id, opponent, result, location, text_start, title_length, \
+                description_length in zip(*(column[page].tolist() for column in (
+                    self.keys, self.owners, self.opponents, self.results, self.locations,
+                    self.starts, self.title_lengths, self.description_lengths))):
+            rank = key >> ID_BITS
+            text = self._text(text_start, title_length + description_length)
+            rows.append(ListingRow(key & ID_MASK, text[:title_length].decode('utf-8'),
+                                   text[title_length:].decode('utf-8'),
+                                   self.dates[rank - 1] if rank else None,
+                                   names[opponent] or None, names[result] or None,
+                                   names[location] or None, owner_id,
+                                   self.usernames[owner_id]))
+        rows.reverse()
+        return rows
+
+    def _boundary(self, date, match_id, after):
+        # Position of the first match after (date, id) in ascending order
+        # when after, else of the first one not before it. A date no
+        # longer in the index falls between two ranks.
+        if date is None:
+            rank, exact = 0, True
+        else:
+            found = bisect_left(self.dates, date)
+            exact = found < len(self.dates) and self.dates[found] == date
+            rank = found + 1
+        if not exact:
+            return int(np.searchsorted(self.keys, rank << ID_BITS))
+        return int(np.searchsorted(self.keys, rank << ID_BITS | match_id,
+                                   side='right' if after else 'left'))
+
+    @staticmethod
+    def accepts(key):
+        # Cursors page() can seek to; any other key is left to seek().
+        return key is None or (isinstance(key[0], (str, type(None)))
+                               and isinstance(key[1], int))
+
+    def page(self, key=None, backwards=False, limit=20, offset=0):
+        # Newest first, like seek(db, ..., ('match.date', 'match.id'),
+        # nullable=True): returns up to limit rows in display order and
+        # whether another page follows in the direction of travel.
+        total = len(self.keys)
+        if key is None:
+            end = max(total - offset, 0)
+            if not end:
+                return [], False
+        elif backwards:
+            start = self._boundary(key[0], key[1], after=True)
+            end = min(start + limit, total)
+            return self._rows(start, end), start + limit < total
+        else:
+            end = self._boundary(key[0], key[1], after=False)
+        start = max(end - limit, 0)
+        return self._rows(start, end), start > 0
+
+    def nbytes(self):
+        arrays = sum(column.nbytes for column in (
+            self.keys, self.owners, self.opponents, self.results, self.locations,
+            self.starts, self.title_lengths, self.description_lengths))
+        return arrays, sum(len(segment) for segment in self.segments)
+
+
+def get_listing(database):
+    return get_follower(database, 'listing', ListingIndex.load, ListingIndex.patch)
@@ -0,0 +1,434 @@
+"""
+Load test.
+Serves the app from several worker processes sharing one listening socket
+and drives a weighted mix of browsing, searching, match pages, logins,
+comments and edits from a growing number of concurrent virtual users.
+Every step reports throughput, latency percentiles, errors and "database
+is locked" answers per action, so the point where a configuration
+saturates is easy to see.
+"""
+import argparse
+import ast
+import http.client
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+from werkzeug.serving import make_server, WSGIRequestHandler
+from app import create_app
+from benchmark import fixture_path, build_fixture, percentile, SCALES
+from generate import PASSWORD
+from warmup import warm
+
+DEFAULT_MIX = 'browse=45,search=15,detail=25,login=3,comment=8,edit=4'
+ACTIONS = ('browse', 'search', 'detail', 'login', 'comment', 'edit')
+SEARCH_TERMS = ['HJK', 'KuPS', 'Inter', 'Ilves', 'Lahti', 'derby', 'Tampere', 'cup']
+CSRF_RE = re.compile(r'name="csrf_token" value="([^"]+)"')
+# Settings of the served app, passed to the worker processes.
+SETTINGS_ENV = 'MATCHTRACK_LOADTEST'
+LOCKED_HEADER = 'X-Database-Locked'
+
+
+class QuietHandler(WSGIRequestHandler):
+    # Keep-alive like a real front end, and no access log on stderr.
+    protocol_version = 'HTTP/1.1'
+
+    def log_request(self, code='-', size='-'):
+        pass
+
+
+def make_app():
+    # The app as configured by the load test. Also usable with gunicorn as
+    # 'loadtest:make_app()'.
+    settings = json.loads(os.environ[SETTINGS_ENV])
+    app = create_app(dict(settings['config'], DATABASE=settings['database']), warm_up=False)
+
+    @app.errorhandler(sqlite3.OperationalError)
+    def database_error(error):
+        # Lock timeouts are counted apart from other server errors.
+        if 'locked' in str(error) or 'busy' in str(error):
+            return 'database is locked', 503, {LOCKED_HEADER: '1'}
+        return 'Internal Server Error', 500
+
+    # Warmed up only now, as no handler can be added after a request.
+    if app.config['WARM_UP']:
+        app.extensions['startup'] = warm(app)
+    return app
+
+
+def serve(fd, threaded):
+    server = make_server('127.0.0.1', 0, make_app(), threaded=threaded,
+                         request_handler=QuietHandler, fd=fd)
+    # Stopping on SIGTERM through shutdown() lets the worker exit normally,
+    # which also ends its password hashing processes.
+    signal.signal(signal.SIGTERM,
+                  lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+    server.serve_forever()
+
+
+def parse_overrides(values):
+    config = {}
+    for value in values or ():
+        name, _, raw = value.partition('=')
+        try:
+            config[name] = ast.literal_eval(raw)
+        except (ValueError, SyntaxError):
+            config[name] = raw
+    return config
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ACTIONS:
+            raise ValueError(f'unknown action {name!r}, expected one of {", ".join(ACTIONS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Servers:
+    # The app under test: 'werkzeug' starts workers processes that all
+    # accept on one socket opened here, 'gunicorn' uses gunicorn's own
+    # pre-fork workers if it is installed.
+    def __init__(self, database, workers, threaded, server, config):
+        self.processes = []
+        env = dict(os.environ)
+        env[SETTINGS_ENV] = json.dumps({'database': database, 'config': config})
+        if server == 'gunicorn':
+            if shutil.which('gunicorn') is None:
+                raise RuntimeError('gunicorn is not installed')
+            with socket.socket() as probe:
+                probe.bind(('127.0.0.1', 0))
+                self.port = probe.getsockname()[1]
+            self.processes.append(subprocess.Popen(
+                ['gunicorn', '-w', str(workers), '--threads', '8' if threaded else '1',
+                 '-b', f'127.0.0.1:{self.port}', '--log-level', 'warning',
+                 'loadtest:make_app()'], env=env))
+        else:
+            self.socket = socket.create_server(('127.0.0.1', 0), backlog=1024)
+            self.socket.set_inheritable(True)
+            self.port = self.socket.getsockname()[1]
+            fd = self.socket.fileno()
+            for _ in range(workers):
+                self.processes.append(subprocess.Popen(
+                    [sys.executable, __file__, 'serve', '--fd', str(fd),
+                     *(['--threaded'] if threaded else [])], env=env, pass_fds=[fd]))
+        self._wait_ready()
+
+    def _wait_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                con = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+                con.request('GET', '/login')
+                if con.getresponse().status == 200:
+                    con.close()
+                    return
+            except OSError:
+                pass
+            if any(process.poll() is not None for process in self.processes):
+                raise RuntimeError('a server process exited during startup')
+            time.sleep(0.2)
+        raise RuntimeError('the server did not start')
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if getattr(self, 'socket', None) is not None:
+            self.socket.close()
+
+
+class Results:
+    # Latencies and failures per action for one step of the ramp.
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.locked = {}
+
+    def add(self, action, elapsed, status, locked):
+        self.latencies.setdefault(action, []).append(elapsed)
+        if locked:
+            self.locked[action] = self.locked.get(action, 0) + 1
+        elif status >= 400:
+            self.errors[action] = self.errors.get(action, 0) + 1
+
+    def merge(self, other):
+        for action, values in other.latencies.items():
+            self.latencies.setdefault(action, []).extend(values)
+        for mine, theirs in ((self.errors, other.errors), (self.locked, other.locked)):
+            for action, count in theirs.items():
+                mine[action] = mine.get(action, 0) + count
+
+    def summary(self, seconds):
+        rows = {}
+        for action in [*ACTIONS, 'total']:
+            if action == 'total':
+                values = [value for values in self.latencies.values() for value in values]
+                errors, locked = sum(self.errors.values()), sum(self.locked.values())
+            else:
+                values = self.latencies.get(action, [])
+                errors, locked = self.errors.get(action, 0), self.locked.get(action, 0)
+            if not values:
+                continue
+            values.sort()
+            rows[action] = {
+                'n': len(values),
+                'per_sec': len(values) / seconds,
+                'p50_ms': percentile(values, 50) * 1000,
+                'p95_ms': percentile(values, 95) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+                'error_rate': errors / len(values),
+                'locked_rate': locked / len(values),
+            }
+        return rows
+
+
+class VirtualUser:
+    # One browser: its own keep-alive connection and session cookie. POST
+    # forms are followed through their redirect, so an action is timed as
+    # the user would see it.
+    def __init__(self, port, username, owned, ids, mix, think, rng):
+        self.port = port
+        self.username = username
+        self.owned = owned
+        self.ids = ids
+        self.actions, self.weights = zip(*mix.items())
+        self.think = think
+        self.rng = rng
+        self.con = None
+        self.cookie = None
+        self.csrf = None
+
+    def _request(self, method, path, form=None):
+        if self.con is None:
+            self.con = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        headers = {}
+        body = None
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        if form is not None:
+            body = urlencode(form, doseq=True)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            self.con.request(method, path, body, headers)
+            response = self.con.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.con.close()
+            self.con = None
+            return 599, False, ''
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        text = data.decode('utf-8', 'replace')
+        found = CSRF_RE.search(text)
+        if found:
+            self.csrf = found.group(1)
+        locked = response.getheader(LOCKED_HEADER) is not None
+        if response.status in (301, 302, 303) and method == 'POST':
+            location = urlsplit(response.getheader('Location', '/'))
+            target = location.path + (f'?{location.query}' if location.query else '')
+            status, follow_locked, text = self._request('GET', target)
+            return (response.status if status < 400 else status), follow_locked, text
+        return response.status, locked, text
+
+    def login(self):
+        if self.csrf is None:
+            self._request('GET', '/login')
+        return self._request('POST', '/login', {
+            'csrf_token': self.csrf or '', 'username': self.username, 'password': PASSWORD})
+
+    def act(self, action):
+        rng = self.rng
+        if action == 'browse':
+            return self._request('GET', f'/matches?page={rng.randint(1, 50)}')
+        if action == 'search':
+            return self._request('GET', f'/matches?q={rng.choice(SEARCH_TERMS)}')
+        if action == 'detail':
+            return self._request('GET', f'/matches/{rng.choice(self.ids)}')
+        if action == 'login':
+            return self.login()
+        if action == 'comment':
+            return self._request('POST', f'/matches/{rng.choice(self.ids)}/comment', {
+                'csrf_token': self.csrf or '', 'content': f'Kuormatesti {rng.random():.6f}'})
+        match_id = rng.choice(self.owned)
+        return self._request('POST', f'/matches/{match_id}/edit', {
+            'csrf_token': self.csrf or '', 'title': f'Kuormatesti {match_id}',
+            'date': f'2024-{rng.randint(4, 10):02d}-{rng.randint(1, 28):02d}',
+            'opponent': rng.choice(SEARCH_TERMS[:5]), 'result': f'{rng.randint(0, 4)}-'
+            f'{rng.randint(0, 4)}', 'location': 'Bolt Arena', 'description': 'Muokattu',
+            'categories': ['1']})
+
+    def run(self, results, stop):
+        self.login()
+        while not stop.is_set():
+            action = self.rng.choices(self.actions, self.weights)[0]
+            started = time.perf_counter()
+            status, locked, _ = self.act(action)
+            results.add(action, time.perf_counter() - started, status, locked)
+            if self.think:
+                stop.wait(self.rng.expovariate(1 / self.think))
+        if self.con is not None:
+            self.con.close()
+
+
+def load_targets(database, users):
+    # Users that own matches, a few of their matches each, and the ids
+    # detail pages and comments pick from.
+    con = sqlite3.connect(database)
+    owners = []
+    for user_id, username in con.execute('SELECT id, username FROM user ORDER BY id LIMIT ?',
+                                         (users * 4,)):
+        owned = [row[0] for row in con.execute(
+            'SELECT id FROM match WHERE owner_id = ? ORDER BY date DESC, id DESC LIMIT 20',
+            (user_id,))]
+        if owned:
+            owners.append((username, owned))
+        if len(owners) == users:
+            break
+    low, high = con.execute('SELECT MIN(id), MAX(id) FROM match').fetchone()
+    con.close()
+    if not owners:
+        raise RuntimeError('the database has no users with matches')
+    rng = random.Random(1)
+    ids = [rng.randint(low, high) for _ in range(1000)]
+    return owners, ids
+
+
+def run_step(port, owners, ids, users, mix, duration, think, seed):
+    stop = threading.Event()
+    per_user = [Results() for _ in range(users)]
+    threads = []
+    for i in range(users):
+        username, owned = owners[i % len(owners)]
+        user = VirtualUser(port, username, owned, ids, mix, think, random.Random(seed + i))
+        threads.append(threading.Thread(target=user.run, args=(per_user[i], stop),
+                                        daemon=True))
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join(60)
+    elapsed = time.perf_counter() - started
+    results = Results()
+    for result in per_user:
+        results.merge(result)
+    return results.summary(elapsed)
+
+
+def print_step(users, rows):
+    print(f'\n{users} virtual users')
+    print(f"{'action':<10}{'n':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'errors':>9}{'locked':>9}")
+    for action, row in rows.items():
+        print(f"{action:<10}{row['n']:>8}{row['per_sec']:>10.1f}{row['p50_ms']:>10.1f}"
+              f"{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['error_rate']:>9.1%}"
+              f"{row['locked_rate']:>9.1%}")
+
+
+def run(args):
+    source = args.database
+    if source is None:
+        source = fixture_path(args.scale)
+        if not os.path.exists(source):
+            build_fixture(args.scale)
+    mix = parse_mix(args.mix)
+    config = parse_overrides(args.config)
+    steps = [int(value) for value in args.users.split(',')]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # Comments and edits change the data, so the test works on a copy.
+        database = os.path.join(tmp, 'load.db')
+        shutil.copyfile(source, database)
+        owners, ids = load_targets(database, max(steps))
+        servers = Servers(database, args.workers, not args.single_threaded, args.server,
+                          config)
+        try:
+            print(f'{args.server}, {args.workers} workers, mix {args.mix}')
+            for users in steps:
+                rows = run_step(servers.port, owners, ids, users, mix, args.duration,
+                                args.think, seed=users * 1000)
+                print_step(users, rows)
+                results.append({'users': users, 'actions': rows})
+        finally:
+            servers.stop()
+
+    # Past the busiest step more users only wait in line.
+    totals = [(step['actions']['total']['per_sec'], step['users'])
+              for step in results if 'total' in step['actions']]
+    if totals:
+        best, users = max(totals)
+        print(f'\nThroughput peaked at {best:.1f} req/s with {users} virtual users')
+    return {
+        'meta': {
+            'database': args.database or args.scale,
+            'server': args.server,
+            'workers': args.workers,
+            'threaded': not args.single_threaded,
+            'mix': mix,
+            'config': config,
+            'duration': args.duration,
+            'think': args.think,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'steps': results,
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    load = commands.add_parser('run', help='ramp up virtual users against a served app')
+    load.add_argument('--scale', choices=SCALES, default='10k')
+    load.add_argument('--database', help='copy this database instead of a fixture')
+    load.add_argument('--server', choices=('werkzeug', 'gunicorn'), default='werkzeug')
+    load.add_argument('--workers', type=int, default=4)
+    load.add_argument('--single-threaded', action='store_true',
+                      help='one request at a time per worker')
+    load.add_argument('--users', default='1,2,4,8,16,32',
+                      help='virtual users of each step, comma separated')
+    load.add_argument('--duration', type=float, default=10, help='seconds per step')
+    load.add_argument('--think', type=float, default=0,
+                      help='mean pause between a user\'s actions in seconds')
+    load.add_argument('--mix', default=DEFAULT_MIX, help='action weights')
+    load.add_argument('--config', action='append', metavar='NAME=VALUE',
+                      help='app setting for the served app, e.g. WRITE_QUEUE_ENABLED=True')
+    load.add_argument('-o', '--output', help='write results as JSON')
+
+    worker = commands.add_parser('serve', help=argparse.SUPPRESS)
+    worker.add_argument('--fd', type=int, required=True)
+    worker.add_argument('--threaded', action='store_true')
+
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        serve(args.fd, args.threaded)
+        return True
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f'\nResults written to {args.output}')
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main(sys.argv[1:]) else 1)
@@ -0,0 +1,245 @@
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from flask import Response, request, template_rendered, before_render_template
+import db as database
+from writes import get_write_queue
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+_local = threading.local()
+# Set by slowlog.init_slow_log().
+slow_log = None
+
+
+class RequestStats:
+    __slots__ = ('started', 'statements', 'sql_time', 'rows', 'render_time',
+                 'render_started', 'status')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_time = 0.0
+        self.rows = 0
+        self.render_time = 0.0
+        self.render_started = None
+        self.status = None
+
+
+class TimedCursor(sqlite3.Cursor):
+    # Adds the time spent in SQLite and the rows fetched to the stats of
+    # the request running in this thread, if any, and hands statements
+    # slower than its threshold to slow_log (see slowlog.py). A statement's
+    # time runs from execute() until its rows have been fetched or the
+    # cursor is dropped.
+    _sql = None
+
+    def _executed(self, sql, parameters, elapsed):
+        if self._sql is not None:
+            self._finished()
+        self._sql = sql
+        self._parameters = parameters
+        self._elapsed = elapsed
+        stats = getattr(_local, 'stats', None)
+        if stats is not None:
+            stats.statements += 1
+            stats.sql_time += elapsed
+        if self.description is None:
+            self._finished()
+
+    def _fetched(self, rows, elapsed, done):
+        stats = getattr(_local, 'stats', None)
+        if stats is not None:
+            stats.sql_time += elapsed
+            stats.rows += rows
+        if self._sql is not None:
+            self._elapsed += elapsed
+            if done:
+                self._finished()
+
+    def _finished(self):
+        sql, self._sql = self._sql, None
+        if slow_log is not None and self._elapsed >= slow_log.threshold:
+            slow_log.record(self.connection, sql, self._parameters, self._elapsed)
+
+    def __del__(self):
+        if self._sql is not None:
+            self._finished()
+
+    def execute(self, sql, parameters=(), /):
+        started = time.perf_counter()
+        result = super().execute(sql, parameters)
+        self._executed(sql, parameters, time.perf_counter() - started)
+        return result
+
+    def executemany(self, sql, parameters, /):
+        started = time.perf_counter()
+        result = super().executemany(sql, parameters)
+        self._executed(sql, (), time.perf_counter() - started)
+        return result
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(row is not None, time.perf_counter() - started, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = size or self.arraysize
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(len(rows), time.perf_counter() - started, len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(len(rows), time.perf_counter() - started, True)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(0, time.perf_counter() - started, True)
+            raise
+        self._fetched(1, time.perf_counter() - started, False)
+        return row
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    # Per-process totals, keyed by route (the Flask endpoint).
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.statements = {}
+        self.sql_time = {}
+        self.rows = {}
+        self.render_time = {}
+
+    def record(self, route, method, stats, elapsed):
+        with self._lock:
+            key = (route, method, str(stats.status or 500))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if route not in self.latency:
+                self.latency[route] = Histogram(LATENCY_BUCKETS)
+                self.statements[route] = Histogram(STATEMENT_BUCKETS)
+            self.latency[route].observe(elapsed)
+            self.statements[route].observe(stats.statements)
+            self.sql_time[route] = self.sql_time.get(route, 0.0) + stats.sql_time
+            self.rows[route] = self.rows.get(route, 0) + stats.rows
+            self.render_time[route] = self.render_time.get(route, 0.0) + stats.render_time
+
+    def render(self):
+        lines = []
+
+        def header(name, kind, text):
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def histogram(name, values):
+            for route, hist in sorted(values.items()):
+                total = 0
+                for bound, count in zip((*hist.buckets, '+Inf'), hist.counts):
+                    total += count
+                    lines.append(f'{name}_bucket{{route="{route}",le="{bound}"}} {total}')
+                lines.append(f'{name}_sum{{route="{route}"}} {hist.sum}')
+                lines.append(f'{name}_count{{route="{route}"}} {total}')
+
+        def counter(name, values):
+            for route, value in sorted(values.items()):
+                lines.append(f'{name}{{route="{route}"}} {value}')
+
+        with self._lock:
+            header('matchtrack_requests_total', 'counter', 'Requests by route and status.')
+            for (route, method, status), value in sorted(self.requests.items()):
+                lines.append(f'matchtrack_requests_total{{route="{route}",method="{method}",'
+                             f'status="{status}"}} {value}')
+            header('matchtrack_request_duration_seconds', 'histogram', 'Request latency.')
+            histogram('matchtrack_request_duration_seconds', self.latency)
+            header('matchtrack_sql_statements', 'histogram', 'SQL statements per request.')
+            histogram('matchtrack_sql_statements', self.statements)
+            header('matchtrack_sql_seconds_total', 'counter',
+                   'Time spent executing SQL and fetching rows.')
+            counter('matchtrack_sql_seconds_total', self.sql_time)
+            header('matchtrack_sql_rows_total', 'counter', 'Rows fetched.')
+            counter('matchtrack_sql_rows_total', self.rows)
+            header('matchtrack_template_seconds_total', 'counter', 'Template render time.')
+            counter('matchtrack_template_seconds_total', self.render_time)
+        return lines
+
+
+registry = Registry()
+
+
+def _render_started(sender, **extra):  # pylint: disable=unused-argument
+    stats = getattr(_local, 'stats', None)
+    if stats is not None and stats.render_started is None:
+        stats.render_started = time.perf_counter()
+
+
+def _render_finished(sender, **extra):  # pylint: disable=unused-argument
+    stats = getattr(_local, 'stats', None)
+    if stats is not None and stats.render_started is not None:
+        stats.render_time += time.perf_counter() - stats.render_started
+        stats.render_started = None
+
+
+def init_metrics(app):
+    # Prometheus text at /metrics. Numbers are per worker process, so a
+    # scraper should scrape every process or the totals are partial.
+    # The cursor class is process-wide, so it is set either way: an app
+    # built without metrics must not keep the one of an earlier app.
+    if not app.config.get('METRICS_ENABLED', True):
+        database.cursor_class = None
+        return
+    database.cursor_class = TimedCursor
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+
+    @app.before_request
+    def start_request():
+        _local.stats = RequestStats()
+
+    @app.after_request
+    def note_status(response):
+        stats = getattr(_local, 'stats', None)
+        if stats is not None:
+            stats.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request(error=None):  # pylint: disable=unused-argument
+        # Runs after a streamed response has been sent, so exports are
+        # timed in full.
+        stats = getattr(_local, 'stats', None)
+        _local.stats = None
+        if stats is None or request.endpoint == 'metrics':
+            return
+        registry.record(request.endpoint or 'unknown', request.method, stats,
+                        time.perf_counter() - stats.started)
+
+    @app.route('/metrics')
+    def metrics():
+        lines = registry.render()
+        write_queue = get_write_queue()
+        if write_queue is not None:
+            for name, value in write_queue.stats().items():
+                lines.append(f'# TYPE matchtrack_write_queue_{name} gauge')
+                lines.append(f'matchtrack_write_queue_{name} {value}')
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,68 @@
+import os
+import re
+import sqlite3
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_RE = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in os.listdir(directory):
+        found = MIGRATION_RE.match(filename)
+        if found:
+            migrations.append((int(found.group(1)), found.group(2),
+                               os.path.join(directory, filename)))
+    return sorted(migrations)
+
+
+def split_statements(script):
+    statements = []
+    pending = ''
+    for line in script.splitlines(keepends=True):
+        pending += line
+        if sqlite3.complete_statement(pending):
+            statement = pending.strip()
+            if statement.rstrip(';').strip():
+                statements.append(statement)
+            pending = ''
+    if pending.strip():
+        raise sqlite3.ProgrammingError(f'incomplete statement: {pending.strip()}')
+    return statements
+
+
+def schema_version(db):
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(db, target=None):
+    applied = []
+    for version, name, path in load_migrations():
+        if version <= schema_version(db):
+            continue
+        if target is not None and version > target:
+            break
+        with open(path, encoding='utf-8') as f:
+            statements = split_statements(f.read())
+        # executescript() would commit between statements, so each
+        # migration runs statement by statement in one transaction and
+        # only bumps user_version if every statement succeeded. The
+        # version is read again once the write lock is held: of two
+        # processes migrating at once, only the first applies a step.
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if version <= schema_version(db):
+                db.rollback()
+                continue
+            for statement in statements:
+                db.execute(statement)
+            db.execute(f'PRAGMA user_version = {version}')
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        applied.append((version, name))
+    if applied:
+        db.execute('ANALYZE')
+        db.commit()
+    return applied
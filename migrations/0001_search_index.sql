@@ -0,0 +1,29 @@
+-- Full-text search over match title, description, opponent and location.
+
+CREATE VIRTUAL TABLE IF NOT EXISTS match_fts USING fts5(
+    title, description, opponent, location,
+    content='match', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+
+INSERT INTO match_fts(match_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 5.0, 2.0)');
+INSERT INTO match_fts(match_fts) VALUES ('rebuild');
+
+CREATE TRIGGER IF NOT EXISTS match_fts_insert AFTER INSERT ON match BEGIN
+    INSERT INTO match_fts(rowid, title, description, opponent, location)
+    VALUES (new.id, new.title, new.description, new.opponent, new.location);
+END;
+
+CREATE TRIGGER IF NOT EXISTS match_fts_delete AFTER DELETE ON match BEGIN
+    INSERT INTO match_fts(match_fts, rowid, title, description, opponent, location)
+    VALUES ('delete', old.id, old.title, old.description, old.opponent, old.location);
+END;
+
+CREATE TRIGGER IF NOT EXISTS match_fts_update
+AFTER UPDATE OF title, description, opponent, location ON match BEGIN
+    INSERT INTO match_fts(match_fts, rowid, title, description, opponent, location)
+    VALUES ('delete', old.id, old.title, old.description, old.opponent, old.location);
+    INSERT INTO match_fts(rowid, title, description, opponent, location)
+    VALUES (new.id, new.title, new.description, new.opponent, new.location);
+END;
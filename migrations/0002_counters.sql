@@ -0,0 +1,69 @@
+-- Trigger-maintained row counts so routes never run COUNT(*).
+
+CREATE TABLE IF NOT EXISTS counter (
+    scope TEXT NOT NULL,
+    key INTEGER NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, key)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS counter_match_insert AFTER INSERT ON match BEGIN
+    INSERT INTO counter (scope, key, value) VALUES ('match', 0, 1)
+    ON CONFLICT (scope, key) DO UPDATE SET value = value + 1;
+    INSERT INTO counter (scope, key, value) VALUES ('user_match', new.owner_id, 1)
+    ON CONFLICT (scope, key) DO UPDATE SET value = value + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counter_match_delete AFTER DELETE ON match BEGIN
+    UPDATE counter SET value = value - 1 WHERE scope = 'match' AND key = 0;
+    UPDATE counter SET value = value - 1
+    WHERE scope = 'user_match' AND key = old.owner_id;
+    DELETE FROM counter WHERE scope = 'match_comment' AND key = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counter_match_owner AFTER UPDATE OF owner_id ON match
+WHEN old.owner_id IS NOT new.owner_id BEGIN
+    UPDATE counter SET value = value - 1
+    WHERE scope = 'user_match' AND key = old.owner_id;
+    INSERT INTO counter (scope, key, value) VALUES ('user_match', new.owner_id, 1)
+    ON CONFLICT (scope, key) DO UPDATE SET value = value + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counter_comment_insert AFTER INSERT ON comment BEGIN
+    INSERT INTO counter (scope, key, value) VALUES ('match_comment', new.match_id, 1)
+    ON CONFLICT (scope, key) DO UPDATE SET value = value + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counter_comment_delete AFTER DELETE ON comment BEGIN
+    UPDATE counter SET value = value - 1
+    WHERE scope = 'match_comment' AND key = old.match_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counter_match_category_insert
+AFTER INSERT ON match_category BEGIN
+    INSERT INTO counter (scope, key, value) VALUES ('category_match', new.category_id, 1)
+    ON CONFLICT (scope, key) DO UPDATE SET value = value + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counter_match_category_delete
+AFTER DELETE ON match_category BEGIN
+    UPDATE counter SET value = value - 1
+    WHERE scope = 'category_match' AND key = old.category_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counter_user_delete AFTER DELETE ON user BEGIN
+    DELETE FROM counter WHERE scope = 'user_match' AND key = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counter_category_delete AFTER DELETE ON category BEGIN
+    DELETE FROM counter WHERE scope = 'category_match' AND key = old.id;
+END;
+
+DELETE FROM counter;
+INSERT INTO counter (scope, key, value) SELECT 'match', 0, COUNT(*) FROM match;
+INSERT INTO counter (scope, key, value)
+SELECT 'user_match', owner_id, COUNT(*) FROM match GROUP BY owner_id;
+INSERT INTO counter (scope, key, value)
+SELECT 'match_comment', match_id, COUNT(*) FROM comment GROUP BY match_id;
+INSERT INTO counter (scope, key, value)
+SELECT 'category_match', category_id, COUNT(*) FROM match_category GROUP BY category_id;
@@ -0,0 +1,11 @@
+-- Indexes for the queries in routes.py. The description index is never
+-- used for lookups (search goes through match_fts) and only slows writes.
+
+CREATE INDEX IF NOT EXISTS idx_match_date_id ON match(date, id);
+CREATE INDEX IF NOT EXISTS idx_match_owner_date_id ON match(owner_id, date, id);
+CREATE INDEX IF NOT EXISTS idx_match_category_category
+ON match_category(category_id, match_id);
+CREATE INDEX IF NOT EXISTS idx_comment_match_created ON comment(match_id, created_at);
+
+DROP INDEX IF EXISTS idx_match_description;
+DROP INDEX IF EXISTS idx_comment_match;
@@ -0,0 +1,9 @@
+-- Progress of bulk imports, committed together with each imported chunk
+-- so an interrupted import can resume after the last committed row.
+
+CREATE TABLE IF NOT EXISTS import_job (
+    name TEXT PRIMARY KEY,
+    rows_done INTEGER NOT NULL DEFAULT 0,
+    finished INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
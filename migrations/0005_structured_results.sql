@@ -0,0 +1,188 @@
+-- Home and away team, goals and season parsed from the free-text title,
+-- opponent, result and date, and a standings table per season and
+-- category (category_id 0 = all matches) kept up to date by triggers.
+
+ALTER TABLE match ADD COLUMN home_team TEXT GENERATED ALWAYS AS (
+    CASE WHEN instr(title, ' - ') > 0
+         THEN trim(substr(title, 1, instr(title, ' - ') - 1))
+         ELSE trim(title) END
+) VIRTUAL;
+
+ALTER TABLE match ADD COLUMN away_team TEXT GENERATED ALWAYS AS (
+    CASE WHEN instr(title, ' - ') > 0
+         THEN trim(substr(title, instr(title, ' - ') + 3))
+         ELSE nullif(trim(opponent), '') END
+) VIRTUAL;
+
+ALTER TABLE match ADD COLUMN home_goals INTEGER GENERATED ALWAYS AS (
+    CASE WHEN instr(replace(result, ' ', ''), '-') > 1
+          AND substr(replace(result, ' ', ''), 1, instr(replace(result, ' ', ''), '-') - 1)
+              NOT GLOB '*[^0-9]*'
+          AND substr(replace(result, ' ', ''), instr(replace(result, ' ', ''), '-') + 1)
+              GLOB '[0-9]*'
+          AND substr(replace(result, ' ', ''), instr(replace(result, ' ', ''), '-') + 1)
+              NOT GLOB '*[^0-9]*'
+         THEN CAST(substr(replace(result, ' ', ''), 1,
+                          instr(replace(result, ' ', ''), '-') - 1) AS INTEGER) END
+) VIRTUAL;
+
+ALTER TABLE match ADD COLUMN away_goals INTEGER GENERATED ALWAYS AS (
+    CASE WHEN home_goals IS NOT NULL
+         THEN CAST(substr(replace(result, ' ', ''),
+                          instr(replace(result, ' ', ''), '-') + 1) AS INTEGER) END
+) VIRTUAL;
+
+ALTER TABLE match ADD COLUMN season TEXT GENERATED ALWAYS AS (
+    CASE WHEN date GLOB '[0-9][0-9][0-9][0-9]-*' THEN substr(date, 1, 4) END
+) VIRTUAL;
+
+CREATE INDEX IF NOT EXISTS idx_match_home_team ON match(home_team, date);
+CREATE INDEX IF NOT EXISTS idx_match_away_team ON match(away_team, date);
+
+-- One row per team per counted match. A match counts when it has a
+-- season, two different teams and a parsed result.
+CREATE VIEW IF NOT EXISTS match_side AS
+SELECT id AS match_id, season, home_team AS team,
+       home_goals AS goals_for, away_goals AS goals_against,
+       home_goals > away_goals AS won, home_goals = away_goals AS drawn,
+       home_goals < away_goals AS lost,
+       CASE WHEN home_goals > away_goals THEN 3
+            WHEN home_goals = away_goals THEN 1 ELSE 0 END AS points
+FROM match
+WHERE season IS NOT NULL AND home_goals IS NOT NULL
+  AND away_team IS NOT NULL AND home_team <> away_team
+UNION ALL
+SELECT id, season, away_team, away_goals, home_goals,
+       away_goals > home_goals, away_goals = home_goals, away_goals < home_goals,
+       CASE WHEN away_goals > home_goals THEN 3
+            WHEN away_goals = home_goals THEN 1 ELSE 0 END
+FROM match
+WHERE season IS NOT NULL AND home_goals IS NOT NULL
+  AND away_team IS NOT NULL AND home_team <> away_team;
+
+CREATE TABLE IF NOT EXISTS standing (
+    season TEXT NOT NULL,
+    category_id INTEGER NOT NULL,
+    team TEXT NOT NULL,
+    played INTEGER NOT NULL DEFAULT 0,
+    won INTEGER NOT NULL DEFAULT 0,
+    drawn INTEGER NOT NULL DEFAULT 0,
+    lost INTEGER NOT NULL DEFAULT 0,
+    goals_for INTEGER NOT NULL DEFAULT 0,
+    goals_against INTEGER NOT NULL DEFAULT 0,
+    points INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (season, category_id, team)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_standing_table ON standing(
+    season, category_id, points DESC, (goals_for - goals_against) DESC,
+    goals_for DESC, team
+);
+
+DELETE FROM standing;
+INSERT INTO standing (season, category_id, team, played, won, drawn, lost,
+                      goals_for, goals_against, points)
+SELECT side.season, c.category_id, side.team, COUNT(*), SUM(side.won),
+       SUM(side.drawn), SUM(side.lost), SUM(side.goals_for),
+       SUM(side.goals_against), SUM(side.points)
+FROM match_side AS side
+JOIN (SELECT id AS match_id, 0 AS category_id FROM match
+      UNION ALL SELECT match_id, category_id FROM match_category) AS c
+  ON c.match_id = side.match_id
+GROUP BY side.season, c.category_id, side.team;
+
+CREATE TRIGGER IF NOT EXISTS standing_match_insert AFTER INSERT ON match BEGIN
+    INSERT INTO standing (season, category_id, team, played, won, drawn, lost,
+                          goals_for, goals_against, points)
+    SELECT season, 0, team, 1, won, drawn, lost, goals_for, goals_against, points
+    FROM match_side WHERE match_id = new.id
+    ON CONFLICT (season, category_id, team) DO UPDATE SET
+        played = played + 1, won = won + excluded.won,
+        drawn = drawn + excluded.drawn, lost = lost + excluded.lost,
+        goals_for = goals_for + excluded.goals_for,
+        goals_against = goals_against + excluded.goals_against,
+        points = points + excluded.points;
+END;
+
+-- Removing a match takes it out of the "all" table and every category it
+-- is linked to. BEFORE triggers still see the old row and its category
+-- links; the delete cascades to match_category only afterwards.
+CREATE TRIGGER IF NOT EXISTS standing_match_delete BEFORE DELETE ON match BEGIN
+    UPDATE standing SET
+        played = standing.played - 1, won = standing.won - side.won,
+        drawn = standing.drawn - side.drawn, lost = standing.lost - side.lost,
+        goals_for = standing.goals_for - side.goals_for,
+        goals_against = standing.goals_against - side.goals_against,
+        points = standing.points - side.points
+    FROM match_side AS side
+    WHERE side.match_id = old.id AND standing.season = side.season
+      AND standing.team = side.team
+      AND (standing.category_id = 0 OR standing.category_id IN (
+          SELECT category_id FROM match_category WHERE match_id = old.id));
+    DELETE FROM standing WHERE season = old.season AND played = 0
+      AND team IN (old.home_team, old.away_team);
+END;
+
+CREATE TRIGGER IF NOT EXISTS standing_match_update_before
+BEFORE UPDATE OF title, opponent, result, date ON match BEGIN
+    UPDATE standing SET
+        played = standing.played - 1, won = standing.won - side.won,
+        drawn = standing.drawn - side.drawn, lost = standing.lost - side.lost,
+        goals_for = standing.goals_for - side.goals_for,
+        goals_against = standing.goals_against - side.goals_against,
+        points = standing.points - side.points
+    FROM match_side AS side
+    WHERE side.match_id = old.id AND standing.season = side.season
+      AND standing.team = side.team
+      AND (standing.category_id = 0 OR standing.category_id IN (
+          SELECT category_id FROM match_category WHERE match_id = old.id));
+    DELETE FROM standing WHERE season = old.season AND played = 0
+      AND team IN (old.home_team, old.away_team);
+END;
+
+CREATE TRIGGER IF NOT EXISTS standing_match_update_after
+AFTER UPDATE OF title, opponent, result, date ON match BEGIN
+    INSERT INTO standing (season, category_id, team, played, won, drawn, lost,
+                          goals_for, goals_against, points)
+    SELECT side.season, c.category_id, side.team, 1, side.won, side.drawn, side.lost,
+           side.goals_for, side.goals_against, side.points
+    FROM match_side AS side,
+         (SELECT 0 AS category_id
+          UNION ALL SELECT category_id FROM match_category WHERE match_id = new.id) AS c
+    WHERE side.match_id = new.id
+    ON CONFLICT (season, category_id, team) DO UPDATE SET
+        played = played + 1, won = won + excluded.won,
+        drawn = drawn + excluded.drawn, lost = lost + excluded.lost,
+        goals_for = goals_for + excluded.goals_for,
+        goals_against = goals_against + excluded.goals_against,
+        points = points + excluded.points;
+END;
+
+CREATE TRIGGER IF NOT EXISTS standing_category_insert AFTER INSERT ON match_category BEGIN
+    INSERT INTO standing (season, category_id, team, played, won, drawn, lost,
+                          goals_for, goals_against, points)
+    SELECT season, new.category_id, team, 1, won, drawn, lost,
+           goals_for, goals_against, points
+    FROM match_side WHERE match_id = new.match_id
+    ON CONFLICT (season, category_id, team) DO UPDATE SET
+        played = played + 1, won = won + excluded.won,
+        drawn = drawn + excluded.drawn, lost = lost + excluded.lost,
+        goals_for = goals_for + excluded.goals_for,
+        goals_against = goals_against + excluded.goals_against,
+        points = points + excluded.points;
+END;
+
+CREATE TRIGGER IF NOT EXISTS standing_category_delete AFTER DELETE ON match_category BEGIN
+    UPDATE standing SET
+        played = standing.played - 1, won = standing.won - side.won,
+        drawn = standing.drawn - side.drawn, lost = standing.lost - side.lost,
+        goals_for = standing.goals_for - side.goals_for,
+        goals_against = standing.goals_against - side.goals_against,
+        points = standing.points - side.points
+    FROM match_side AS side
+    WHERE side.match_id = old.match_id AND standing.season = side.season
+      AND standing.team = side.team AND standing.category_id = old.category_id;
+    DELETE FROM standing WHERE category_id = old.category_id AND played = 0
+      AND (season, team) IN (
+          SELECT season, team FROM match_side WHERE match_id = old.match_id);
+END;
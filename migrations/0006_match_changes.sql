@@ -0,0 +1,24 @@
+-- Log of changed match ids so in-memory copies of the match table can
+-- catch up without reloading everything. Only the most recent changes are
+-- kept; a reader that has fallen further behind reloads from scratch.
+
+CREATE TABLE IF NOT EXISTS match_change (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    match_id INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS match_change_insert AFTER INSERT ON match BEGIN
+    INSERT INTO match_change (match_id) VALUES (new.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS match_change_update AFTER UPDATE ON match BEGIN
+    INSERT INTO match_change (match_id) VALUES (new.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS match_change_delete AFTER DELETE ON match BEGIN
+    INSERT INTO match_change (match_id) VALUES (old.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS match_change_trim AFTER INSERT ON match_change BEGIN
+    DELETE FROM match_change WHERE seq <= new.seq - 10000;
+END;
@@ -0,0 +1,54 @@
+-- Versions of the tags that rendered pages are cached under. A cached
+-- page is only served while every tag it depends on still has the version
+-- it was rendered with, and these triggers bump the versions on every
+-- write, whichever process or code path makes it.
+
+CREATE TABLE IF NOT EXISTS cache_tag (
+    tag TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS cache_tag_match_insert AFTER INSERT ON match BEGIN
+    INSERT INTO cache_tag (tag, version)
+    VALUES ('listing', 1), ('user:' || new.owner_id, 1)
+    ON CONFLICT (tag) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_tag_match_update
+AFTER UPDATE OF title, description, date, opponent, result, location,
+                custom_category, owner_id ON match BEGIN
+    INSERT INTO cache_tag (tag, version)
+    VALUES ('listing', 1), ('match:' || new.id, 1), ('user:' || new.owner_id, 1)
+    ON CONFLICT (tag) DO UPDATE SET version = version + 1;
+    INSERT INTO cache_tag (tag, version)
+    SELECT 'user:' || old.owner_id, 1 WHERE old.owner_id IS NOT new.owner_id
+    ON CONFLICT (tag) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_tag_match_delete AFTER DELETE ON match BEGIN
+    INSERT INTO cache_tag (tag, version)
+    VALUES ('listing', 1), ('match:' || old.id, 1), ('user:' || old.owner_id, 1)
+    ON CONFLICT (tag) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_tag_match_category_insert
+AFTER INSERT ON match_category BEGIN
+    INSERT INTO cache_tag (tag, version) VALUES ('match:' || new.match_id, 1)
+    ON CONFLICT (tag) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_tag_match_category_delete
+AFTER DELETE ON match_category BEGIN
+    INSERT INTO cache_tag (tag, version) VALUES ('match:' || old.match_id, 1)
+    ON CONFLICT (tag) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_tag_comment_insert AFTER INSERT ON comment BEGIN
+    INSERT INTO cache_tag (tag, version) VALUES ('match:' || new.match_id, 1)
+    ON CONFLICT (tag) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_tag_comment_delete AFTER DELETE ON comment BEGIN
+    INSERT INTO cache_tag (tag, version) VALUES ('match:' || old.match_id, 1)
+    ON CONFLICT (tag) DO UPDATE SET version = version + 1;
+END;
@@ -0,0 +1,16 @@
+-- Filtered listings on /matches and change logging for category links,
+-- which the in-memory facet counts need to see.
+
+CREATE INDEX IF NOT EXISTS idx_match_opponent_date_id ON match(opponent, date, id);
+CREATE INDEX IF NOT EXISTS idx_match_location_date_id ON match(location, date, id);
+CREATE INDEX IF NOT EXISTS idx_match_result_date_id ON match(result, date, id);
+
+CREATE TRIGGER IF NOT EXISTS match_change_category_insert
+AFTER INSERT ON match_category BEGIN
+    INSERT INTO match_change (match_id) VALUES (new.match_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS match_change_category_delete
+AFTER DELETE ON match_category BEGIN
+    INSERT INTO match_change (match_id) VALUES (old.match_id);
+END;
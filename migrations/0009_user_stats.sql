@@ -0,0 +1,145 @@
+-- Per-user statistics for the profile page: comments written, the
+-- results of the matches the user has logged (counter scopes
+-- user_comment, user_home_win, user_draw and user_away_win) and how often
+-- each team appears in them (user_team).
+
+CREATE TRIGGER IF NOT EXISTS counter_user_comment_insert AFTER INSERT ON comment BEGIN
+    INSERT INTO counter (scope, key, value) VALUES ('user_comment', new.user_id, 1)
+    ON CONFLICT (scope, key) DO UPDATE SET value = value + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counter_user_comment_delete AFTER DELETE ON comment BEGIN
+    UPDATE counter SET value = value - 1
+    WHERE scope = 'user_comment' AND key = old.user_id;
+END;
+
+-- The parsed columns of a new match are filled in by an update (see
+-- migration 0005), so inserts are counted by the update triggers.
+CREATE TRIGGER IF NOT EXISTS counter_user_result_before
+BEFORE UPDATE OF home_goals, away_goals, owner_id ON match
+WHEN old.home_goals IS NOT NULL BEGIN
+    UPDATE counter SET value = value - 1
+    WHERE key = old.owner_id AND scope = CASE
+        WHEN old.home_goals > old.away_goals THEN 'user_home_win'
+        WHEN old.home_goals = old.away_goals THEN 'user_draw'
+        ELSE 'user_away_win' END;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counter_user_result_after
+AFTER UPDATE OF home_goals, away_goals, owner_id ON match
+WHEN new.home_goals IS NOT NULL BEGIN
+    INSERT INTO counter (scope, key, value) VALUES (CASE
+        WHEN new.home_goals > new.away_goals THEN 'user_home_win'
+        WHEN new.home_goals = new.away_goals THEN 'user_draw'
+        ELSE 'user_away_win' END, new.owner_id, 1)
+    ON CONFLICT (scope, key) DO UPDATE SET value = value + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counter_user_result_delete AFTER DELETE ON match
+WHEN old.home_goals IS NOT NULL BEGIN
+    UPDATE counter SET value = value - 1
+    WHERE key = old.owner_id AND scope = CASE
+        WHEN old.home_goals > old.away_goals THEN 'user_home_win'
+        WHEN old.home_goals = old.away_goals THEN 'user_draw'
+        ELSE 'user_away_win' END;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counter_user_stats_delete AFTER DELETE ON user BEGIN
+    DELETE FROM counter WHERE key = old.id AND scope IN (
+        'user_comment', 'user_home_win', 'user_draw', 'user_away_win');
+    DELETE FROM user_team WHERE user_id = old.id;
+END;
+
+DELETE FROM counter WHERE scope IN ('user_comment', 'user_home_win', 'user_draw',
+                                    'user_away_win');
+INSERT INTO counter (scope, key, value)
+SELECT 'user_comment', user_id, COUNT(*) FROM comment GROUP BY user_id;
+INSERT INTO counter (scope, key, value)
+SELECT CASE WHEN home_goals > away_goals THEN 'user_home_win'
+            WHEN home_goals = away_goals THEN 'user_draw'
+            ELSE 'user_away_win' END, owner_id, COUNT(*)
+FROM match WHERE home_goals IS NOT NULL
+GROUP BY 1, 2;
+
+-- One row per team of every match, with the result from that team's side
+-- when the match has one.
+CREATE VIEW IF NOT EXISTS match_team AS
+SELECT id AS match_id, owner_id, home_team AS team,
+       coalesce(home_goals > away_goals, 0) AS won,
+       coalesce(home_goals = away_goals, 0) AS drawn,
+       coalesce(home_goals < away_goals, 0) AS lost
+FROM match
+WHERE home_team <> ''
+UNION ALL
+SELECT id, owner_id, away_team,
+       coalesce(away_goals > home_goals, 0), coalesce(away_goals = home_goals, 0),
+       coalesce(away_goals < home_goals, 0)
+FROM match
+WHERE away_team <> '' AND away_team IS NOT home_team;
+
+CREATE TABLE IF NOT EXISTS user_team (
+    user_id INTEGER NOT NULL,
+    team TEXT NOT NULL,
+    matches INTEGER NOT NULL DEFAULT 0,
+    won INTEGER NOT NULL DEFAULT 0,
+    drawn INTEGER NOT NULL DEFAULT 0,
+    lost INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, team)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_user_team_matches ON user_team(user_id, matches DESC, team);
+
+DELETE FROM user_team;
+INSERT INTO user_team (user_id, team, matches, won, drawn, lost)
+SELECT owner_id, team, COUNT(*), SUM(won), SUM(drawn), SUM(lost)
+FROM match_team
+GROUP BY owner_id, team;
+
+CREATE TRIGGER IF NOT EXISTS user_team_match_before
+BEFORE UPDATE OF home_team, away_team, home_goals, away_goals, owner_id ON match BEGIN
+    UPDATE user_team SET
+        matches = user_team.matches - 1, won = user_team.won - side.won,
+        drawn = user_team.drawn - side.drawn, lost = user_team.lost - side.lost
+    FROM match_team AS side
+    WHERE side.match_id = old.id AND user_team.user_id = side.owner_id
+      AND user_team.team = side.team;
+    DELETE FROM user_team WHERE user_id = old.owner_id AND matches = 0
+      AND team IN (old.home_team, old.away_team);
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_team_match_after
+AFTER UPDATE OF home_team, away_team, home_goals, away_goals, owner_id ON match BEGIN
+    INSERT INTO user_team (user_id, team, matches, won, drawn, lost)
+    SELECT owner_id, team, 1, won, drawn, lost FROM match_team WHERE match_id = new.id
+    ON CONFLICT (user_id, team) DO UPDATE SET
+        matches = matches + 1, won = won + excluded.won,
+        drawn = drawn + excluded.drawn, lost = lost + excluded.lost;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_team_match_delete BEFORE DELETE ON match BEGIN
+    UPDATE user_team SET
+        matches = user_team.matches - 1, won = user_team.won - side.won,
+        drawn = user_team.drawn - side.drawn, lost = user_team.lost - side.lost
+    FROM match_team AS side
+    WHERE side.match_id = old.id AND user_team.user_id = side.owner_id
+      AND user_team.team = side.team;
+    DELETE FROM user_team WHERE user_id = old.owner_id AND matches = 0
+      AND team IN (old.home_team, old.away_team);
+END;
+
+-- Profile pages show the comment count, so a comment also changes the
+-- cached profile of its writer.
+DROP TRIGGER IF EXISTS cache_tag_comment_insert;
+DROP TRIGGER IF EXISTS cache_tag_comment_delete;
+
+CREATE TRIGGER IF NOT EXISTS cache_tag_comment_insert AFTER INSERT ON comment BEGIN
+    INSERT INTO cache_tag (tag, version)
+    VALUES ('match:' || new.match_id, 1), ('user:' || new.user_id, 1)
+    ON CONFLICT (tag) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_tag_comment_delete AFTER DELETE ON comment BEGIN
+    INSERT INTO cache_tag (tag, version)
+    VALUES ('match:' || old.match_id, 1), ('user:' || old.user_id, 1)
+    ON CONFLICT (tag) DO UPDATE SET version = version + 1;
+END;
@@ -0,0 +1,6 @@
+-- Comments are shown and fetched in id order, a page or a "newer than"
+-- delta at a time, which this index serves without sorting.
+
+CREATE INDEX IF NOT EXISTS idx_comment_match_id ON comment(match_id, id);
+
+DROP INDEX IF EXISTS idx_comment_match_created;
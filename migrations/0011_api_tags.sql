@@ -0,0 +1,10 @@
+-- The API answers batch lookups for ids that may not exist yet, so
+-- creating a match bumps its own tag too.
+
+DROP TRIGGER IF EXISTS cache_tag_match_insert;
+
+CREATE TRIGGER IF NOT EXISTS cache_tag_match_insert AFTER INSERT ON match BEGIN
+    INSERT INTO cache_tag (tag, version)
+    VALUES ('listing', 1), ('match:' || new.id, 1), ('user:' || new.owner_id, 1)
+    ON CONFLICT (tag) DO UPDATE SET version = version + 1;
+END;
@@ -0,0 +1,16 @@
+-- Seasons moved out to archive files by "app.py archive" (archive.py),
+-- one file per season. The counters, standings and team statistics of
+-- archived matches stay here, so totals do not change when a season is
+-- archived. path is relative to the directory of this database.
+
+CREATE TABLE IF NOT EXISTS archive (
+    season TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    matches INTEGER NOT NULL DEFAULT 0,
+    comments INTEGER NOT NULL DEFAULT 0,
+    min_id INTEGER,
+    max_id INTEGER,
+    min_date TEXT,
+    max_date TEXT,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) WITHOUT ROWID;
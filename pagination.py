@@ -0,0 +1,85 @@
+import base64
+import binascii
+import json
+
+# Deepest ?page=N served. Offsets are read and skipped in every source
+# seek_archives() merges, so legacy links stop here; the cursors go on.
+MAX_PAGE = 50
+
+
+def encode_cursor(page, key):
+    raw = json.dumps([page, *key], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size=2):
+    # size is the number of seek columns the key is bound against; a key of
+    # another shape, or one holding lists or objects, is treated as no
+    # cursor at all rather than reaching SQLite.
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        page, *key = json.loads(raw)
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if not isinstance(page, int) or page < 1 or len(key) != size:
+        return None
+    if not all(value is None or isinstance(value, (str, int, float)) for value in key):
+        return None
+    return page, key
+
+
+def _seek_segments(columns, key, descending, backwards, nullable):
+    # Each segment is a (condition, params) pair. Segments are read in
+    # order until the page is full. NULLs sort first in SQLite, so rows
+    # with a NULL leading column need their own segment on either side
+    # of the non-NULL range; everything else is a single row-value seek.
+    first, rest = columns[0], columns[1:]
+    cols = ', '.join(columns)
+    marks = ', '.join('?' * len(columns))
+    scan_desc = descending != backwards
+    op = '<' if scan_desc else '>'
+
+    if key is None:
+        return [('', [])]
+
+    if nullable and key[0] is None:
+        tail_ops = ' AND '.join(f'{col} {op} ?' for col in rest)
+        segments = [(f'{first} IS NULL AND {tail_ops}', list(key[1:]))]
+        if not scan_desc:
+            segments.append((f'{first} IS NOT NULL', []))
+        return segments
+
+    segments = [(f'({cols}) {op} ({marks})', list(key))]
+    if nullable and scan_desc:
+        segments.append((f'{first} IS NULL', []))
+    return segments
+
+
+def seek(db, select, where, params, columns, key=None, backwards=False,
+         descending=True, nullable=False, limit=20, offset=0):
+    # Returns up to limit rows in display order and whether another page
+    # follows in the direction of travel. offset only exists for legacy
+    # ?page=N links and is ignored once a key is given.
+    scan_desc = descending != backwards
+    direction = 'DESC' if scan_desc else 'ASC'
+    order = ', '.join(f'{col} {direction}' for col in columns)
+
+    rows = []
+    for condition, extra in _seek_segments(columns, key, descending,
+                                           backwards, nullable):
+        wanted = limit + 1 - len(rows)
+        if wanted <= 0:
+            break
+        conditions = ' AND '.join(f'({c})' for c in (where, condition) if c)
+        where_sql = f' WHERE {conditions}' if conditions else ''
+        rows.extend(db.execute(
+            f'{select}{where_sql} ORDER BY {order} LIMIT ? OFFSET ?',
+            (*params, *extra, wanted, 0 if key else offset)).fetchall())
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+    return rows, more
@@ -0,0 +1,130 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+# Attempt histories kept per limiter before the oldest are dropped.
+MAX_TRACKED = 100_000
+
+_pool = None
+_pool_pid = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def _config(name, default):
+    return current_app.config.get(name, default)
+
+
+def _run(func, *args):
+    # Runs func in the hashing process pool, or inline when
+    # PASSWORD_HASH_WORKERS is 0. At most PASSWORD_HASH_QUEUE calls may be
+    # running or waiting; beyond that HashingBusy is raised at once rather
+    # than letting requests pile up behind the CPU.
+    global _pool, _pool_pid, _pool_slots  # pylint: disable=global-statement
+    workers = _config('PASSWORD_HASH_WORKERS', 2)
+    if not workers:
+        return func(*args)
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn, because forking a process with running threads can
+            # leave locks held in the child.
+            _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+            _pool_slots = threading.BoundedSemaphore(_config('PASSWORD_HASH_QUEUE', 16))
+        pool, slots = _pool, _pool_slots
+    if not slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = pool.submit(func, *args)
+        future.add_done_callback(lambda _: slots.release())
+    except BaseException:
+        slots.release()
+        raise
+    try:
+        return future.result(_config('PASSWORD_HASH_TIMEOUT', 5))
+    except FutureTimeout as error:
+        raise HashingBusy() from error
+    except BrokenProcessPool as error:
+        # A worker died; the next call starts a new pool.
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        raise HashingBusy() from error
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password,
+                _config('PASSWORD_HASH_METHOD', DEFAULT_METHOD))
+
+
+def verify_password(password_hash, password):
+    # Returns (matches, needs_rehash). A hash made with other parameters
+    # than PASSWORD_HASH_METHOD should be replaced after a successful login.
+    if not _run(check_password_hash, password_hash, password):
+        return False, False
+    method = password_hash.split('$', 1)[0]
+    return True, method != _method_prefix(_config('PASSWORD_HASH_METHOD', DEFAULT_METHOD))
+
+
+@lru_cache(maxsize=None)
+def _method_prefix(method):
+    # werkzeug writes the full parameters into the hash, 'pbkdf2:sha256'
+    # becoming 'pbkdf2:sha256:1000000', so the configured method is compared
+    # in that form. One reference hash per method and process finds it.
+    return _run(generate_password_hash, '', method).split('$', 1)[0]
+
+
+class AttemptLimiter:
+    # Failed attempts per key within the last window seconds, in memory of
+    # one process.
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        attempts = self._attempts.get(key)
+        if attempts is None:
+            return None
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        if not attempts:
+            del self._attempts[key]
+            return None
+        return attempts
+
+    def retry_after(self, key):
+        # Seconds until key may try again, 0 when it may try now.
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._recent(key, now)
+            if attempts is None or len(attempts) < self.limit:
+                return 0
+            return int(attempts[0] + self.window - now) + 1
+
+    def failed(self, key):
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._recent(key, now)
+            if attempts is None:
+                if len(self._attempts) >= MAX_TRACKED:
+                    del self._attempts[next(iter(self._attempts))]
+                attempts = self._attempts[key] = deque()
+            attempts.append(now)
+
+    def reset(self, key):
+        with self._lock:
+            self._attempts.pop(key, None)
@@ -1,6 +1,27 @@
+import io
+import sqlite3
+import time
 from functools import wraps
-from flask import render_template, request, redirect, url_for, session, flash, abort
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import (render_template, request, redirect, url_for, session, flash, abort,
+                   Response, stream_with_context, jsonify)
+from search import fts_query
+from pagination import seek, encode_cursor, decode_cursor, MAX_PAGE
+from counters import get_counter
+from importer import run_import, detect_format
+from exporter import export
+from analytics import get_analytics, FORM_LENGTH
+from cache import cached_page, render_fragments
+from facets import get_facets, parse_filters, filter_sql, SEARCH_LIMIT
+from listing import get_listing, ListingRow
+from archive import (get_archives, seek_archives, count as archive_count, find_match, qualify,
+                     by_source, newer_than_archives)
+from suggest import get_suggestions, FIELDS as SUGGEST_FIELDS, SUGGESTIONS, MAX_PREFIX
+from db import release_connections
+from writes import write, get_write_queue
+from passwords import hash_password, verify_password, HashingBusy, AttemptLimiter
+
+COMMENTS_PER_PAGE = 50
+NEW_COMMENTS_LIMIT = 100
 
 
 def login_required(func):
@@ -20,6 +41,25 @@ def check_csrf():
 
 def init_routes(app, get_db):
 
+    def cached(tags):
+        return cached_page(get_db, tags)
+
+    window = app.config.get('LOGIN_ATTEMPT_WINDOW', 300)
+    user_attempts = AttemptLimiter(app.config.get('LOGIN_ATTEMPTS_PER_USER', 10), window)
+    ip_attempts = AttemptLimiter(app.config.get('LOGIN_ATTEMPTS_PER_IP', 50), window)
+
+    def throttled(wait):
+        flash('Too many attempts, please try again later')
+        response = app.make_response((render_template('login.html'), 429))
+        response.retry_after = wait
+        return response
+
+    def busy(template):
+        flash('Server is busy, please try again in a moment')
+        response = app.make_response((render_template(template), 503))
+        response.retry_after = 1
+        return response
+
     @app.route('/')
     def index():
         return redirect(url_for('matches'))
@@ -44,17 +84,23 @@ def init_routes(app, get_db):
                 flash('Passwords do not match')
                 return render_template('register.html')
 
-            db = get_db()
+            db = get_db(readonly=True)
             user = db.execute('SELECT id FROM user WHERE username = ?',
                              (username,)).fetchone()
             if user:
                 flash('Username already taken')
                 return render_template('register.html')
 
-            password_hash = generate_password_hash(password)
-            db.execute('INSERT INTO user (username, password_hash) VALUES (?, ?)',
-                       (username, password_hash))
-            db.commit()
+            try:
+                password_hash = hash_password(password)
+            except HashingBusy:
+                return busy('register.html')
+            try:
+                write(get_db, [('INSERT INTO user (username, password_hash) VALUES (?, ?)',
+                                (username, password_hash))], wait=True)
+            except sqlite3.IntegrityError:
+                flash('Username already taken')
+                return render_template('register.html')
             flash('Account created. Please log in.')
             return redirect(url_for('login'))
         return render_template('register.html')
@@ -69,16 +115,39 @@ def init_routes(app, get_db):
                 flash('Username and password required')
                 return render_template('login.html')
 
-            db = get_db()
+            # Failed attempts are limited per username and per address,
+            # and checked before any hashing is done.
+            ip = request.remote_addr
+            wait = max(user_attempts.retry_after(username), ip_attempts.retry_after(ip))
+            if wait:
+                return throttled(wait)
+
+            db = get_db(readonly=True)
             user = db.execute(
                 'SELECT id, username, password_hash FROM user WHERE username = ?',
                 (username,)).fetchone()
 
-            if user and check_password_hash(user['password_hash'], password):
+            try:
+                valid, rehash = (verify_password(user['password_hash'], password)
+                                 if user else (False, False))
+            except HashingBusy:
+                return busy('login.html')
+
+            if valid and rehash:
+                try:
+                    write(get_db, [('UPDATE user SET password_hash = ? WHERE id = ?',
+                                    (hash_password(password), user['id']))])
+                except HashingBusy:
+                    pass  # Tried again on the next login.
+
+            if valid:
+                user_attempts.reset(username)
                 session['user_id'] = user['id']
                 session['username'] = user['username']
                 flash('Logged in successfully')
                 return redirect(url_for('matches'))
+            user_attempts.failed(username)
+            ip_attempts.failed(ip)
             flash('Invalid username or password')
             return render_template('login.html')
         return render_template('login.html')
@@ -90,47 +159,201 @@ def init_routes(app, get_db):
         return redirect(url_for('login'))
 
     @app.route('/matches')
+    @cached(lambda: ['listing'])
     def matches():
         q = request.args.get('q', '').strip()
-        page = request.args.get('page', 1, type=int)
         per_page = 20
-        offset = (page - 1) * per_page
-
-        db = get_db()
-
-        if q:
-            like = f"%{q}%"
-            matches_list = db.execute('''
-                SELECT match.id, match.title, match.description, match.date,
-                       match.opponent, match.result, match.location,
-                       match.owner_id, user.username
-                FROM match
-                JOIN user ON match.owner_id = user.id
-                WHERE match.title LIKE ? OR match.description LIKE ?
-                ORDER BY match.date DESC, match.id DESC
-                LIMIT ? OFFSET ?
-            ''', (like, like, per_page, offset)).fetchall()
-
-            total = db.execute('''
-                SELECT COUNT(*) as count FROM match
-                WHERE title LIKE ? OR description LIKE ?
-            ''', (like, like)).fetchone()['count']
+        after = decode_cursor(request.args.get('after'))
+        before = decode_cursor(request.args.get('before'))
+        backwards = before is not None and after is None
+        if after or before:
+            page, key = after or before
+            offset = 0
         else:
-            matches_list = db.execute('''
+            page = min(max(request.args.get('page', 1, type=int), 1), MAX_PAGE)
+            key = None
+            offset = (page - 1) * per_page
+
+        db = get_db(readonly=True)
+        filters = parse_filters(request.args)
+        where, params = filter_sql(filters)
+        facets = get_facets(app.config.get('DATABASE', 'database.db')).current()
+        # Archived seasons are read too when the page can reach them.
+        archives = get_archives(db)
+        dates = (filters.get('date_from'), filters.get('date_to'))
+
+        fts = fts_query(q)
+        if fts:
+            # Each archive has its own search index, so bm25 ranks only
+            # compare within one source: hits are in rank order per source
+            # and the sources interleave by rank only roughly.
+            columns = ('match_fts.rank', 'match.id')
+            matches_list, more = seek_archives(db, archives, '''
                 SELECT match.id, match.title, match.description, match.date,
                        match.opponent, match.result, match.location,
-                       match.owner_id, user.username
-                FROM match
+                       match.owner_id, user.username, match_fts.rank
+                FROM match_fts
+                JOIN match ON match.id = match_fts.rowid
                 JOIN user ON match.owner_id = user.id
-                ORDER BY match.date DESC, match.id DESC
-                LIMIT ? OFFSET ?
-            ''', (per_page, offset)).fetchall()
+            ''', 'match_fts MATCH ?' + (f' AND {where}' if where else ''), (fts, *params),
+                columns, key, backwards, descending=False, limit=per_page, offset=offset,
+                dates=dates)
+
+            hits = db.execute('''
+                SELECT COUNT(*) as count FROM match_fts
+                WHERE match_fts MATCH ?
+            ''', (fts,)).fetchone()['count']
+            counts = None
+            if hits <= SEARCH_LIMIT:
+                counts = facets.counts(filters, [row[0] for row in db.execute(
+                    'SELECT rowid FROM match_fts WHERE match_fts MATCH ?', (fts,))])
+                total = counts['total']
+            elif filters:
+                total = db.execute(f'''
+                    SELECT COUNT(*) FROM match_fts JOIN match ON match.id = match_fts.rowid
+                    WHERE match_fts MATCH ? AND {where}
+                ''', (fts, *params)).fetchone()[0]
+            else:
+                total = hits
+            total += archive_count(db, archives, f'''
+                SELECT COUNT(*) FROM match_fts JOIN match ON match.id = match_fts.rowid
+                WHERE match_fts MATCH ?{f' AND {where}' if where else ''}
+            ''', (fts, *params), dates)
+        else:
+            columns = ('match.date', 'match.id')
+            matches_list = None
+            listing = None
+            if not filters and app.config.get('LISTING_INDEX_ENABLED'):
+                listing = get_listing(app.config.get('DATABASE', 'database.db')).current()
+            if listing is not None and listing.accepts(key):
+                # The plain listing straight from memory, without a query,
+                # unless archived matches belong on the page.
+                matches_list, more = listing.page(key, backwards, limit=per_page,
+                                                  offset=offset)
+                if newer_than_archives(archives, matches_list, key, backwards, per_page):
+                    counts = facets.counts(filters)
+                    total = len(listing) + sum(archive['matches'] for archive in archives)
+                    more = more or (bool(archives) and not backwards)
+                else:
+                    matches_list = None
+            if matches_list is None:
+                matches_list, more = seek_archives(db, archives, '''
+                    SELECT match.id, match.title, match.description, match.date,
+                           match.opponent, match.result, match.location,
+                           match.owner_id, user.username
+                    FROM match
+                    JOIN user ON match.owner_id = user.id
+                ''', where, params, columns, key, backwards,
+                    nullable=True, limit=per_page, offset=offset, dates=dates)
+
+                # The counters include archived matches, facet counts do not.
+                counts = facets.counts(filters)
+                total = (counts['total'] + archive_count(
+                    db, archives, f'SELECT COUNT(*) FROM match WHERE {where}', params, dates)
+                         if filters else get_counter(db, 'match'))
+
+        # Categories of the whole page in one query per database.
+        names = {}
+        for source, ids in by_source(matches_list).items():
+            marks = ', '.join('?' * len(ids))
+            names.update(db.execute(qualify(f'''
+                SELECT match_category.match_id, group_concat(category.name, ', ')
+                FROM match_category
+                JOIN category ON category.id = match_category.category_id
+                WHERE match_category.match_id IN ({marks})
+                GROUP BY match_category.match_id
+            ''', source), ids).fetchall())
+        if matches_list and isinstance(matches_list[0], ListingRow):
+            for row in matches_list:
+                row.categories = names.get(row.id)
+        else:
+            matches_list = [dict(row, categories=names.get(row['id'])) for row in matches_list]
 
-            total = db.execute('SELECT COUNT(*) as count FROM match').fetchone()['count']
+        if backwards:
+            has_prev, has_next = more, True
+            if not more:
+                page = 1
+        else:
+            has_prev, has_next = page > 1, more
+
+        prev_cursor = next_cursor = None
+        if matches_list:
+            fields = [column.split('.')[1] for column in columns]
+            if has_prev:
+                first = matches_list[0]
+                prev_cursor = encode_cursor(page - 1, [first[f] for f in fields])
+            if has_next:
+                last = matches_list[-1]
+                next_cursor = encode_cursor(page + 1, [last[f] for f in fields])
 
         total_pages = (total + per_page - 1) // per_page
-        return render_template('index.html', matches=matches_list, q=q,
-                               page=page, total_pages=total_pages)
+        cards = render_fragments(db, '_match_card.html', matches_list,
+                                 key=lambda m: f"card:{m['id']}",
+                                 tags=lambda m: [f"match:{m['id']}"])
+        options = None
+        if counts is not None:
+            categories = dict(db.execute('SELECT id, name FROM category ORDER BY name').fetchall())
+            options = facets.options(counts, filters, categories)
+        return render_template('index.html', matches=matches_list, cards=cards, q=q,
+                               page=page, total_pages=total_pages,
+                               prev_cursor=prev_cursor, next_cursor=next_cursor,
+                               filters=filters, options=options,
+                               archived=[archive['season'] for archive in archives])
+
+    @app.route('/standings')
+    def standings():
+        db = get_db(readonly=True)
+        seasons = [row['season'] for row in db.execute(
+            'SELECT DISTINCT season FROM standing ORDER BY season DESC').fetchall()]
+        categories = db.execute('SELECT id, name FROM category ORDER BY name').fetchall()
+        season = request.args.get('season') or (seasons[0] if seasons else None)
+        category_id = request.args.get('category', 0, type=int)
+
+        table = db.execute('''
+            SELECT team, played, won, drawn, lost, goals_for, goals_against,
+                   goals_for - goals_against AS goal_difference, points
+            FROM standing
+            WHERE season = ? AND category_id = ?
+            ORDER BY points DESC, goals_for - goals_against DESC, goals_for DESC, team
+        ''', (season, category_id)).fetchall()
+
+        return render_template('standings.html', table=table, seasons=seasons,
+                               season=season, categories=categories,
+                               category_id=category_id)
+
+    @app.route('/teams/<name>')
+    def team(name):
+        form_length = min(max(request.args.get('form', FORM_LENGTH, type=int), 1), 50)
+        arrays = get_analytics(app.config.get('DATABASE', 'database.db')).current()
+        report = arrays.team_report(name, form_length)
+        if not report:
+            flash('Joukkuetta ei löytynyt')
+            return redirect(url_for('standings'))
+        # The analytics arrays are read from the main database only.
+        archived = [archive['season'] for archive in get_archives(get_db(readonly=True))]
+        return render_template('team.html', report=report, form_length=form_length,
+                               archived=archived)
+
+    @app.route('/teams/<name>/vs/<other>')
+    def head_to_head(name, other):
+        arrays = get_analytics(app.config.get('DATABASE', 'database.db')).current()
+        report = arrays.head_to_head(name, other)
+        if not report:
+            flash('Joukkuetta ei löytynyt')
+            return redirect(url_for('standings'))
+        archived = [archive['season'] for archive in get_archives(get_db(readonly=True))]
+        return render_template('head_to_head.html', report=report, archived=archived)
+
+    @app.route('/export/matches.<fmt>')
+    def export_matches(fmt):
+        if fmt not in ('csv', 'ndjson'):
+            abort(404)
+        q = request.args.get('q', '').strip()
+        comments = request.args.get('comments') in ('1', 'true', 'yes')
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        chunks = export(get_db(readonly=True), fmt, q, comments)
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename=matches.{fmt}'})
 
     @app.route('/matches/new', methods=['GET', 'POST'])
     @login_required
@@ -169,6 +392,45 @@ def init_routes(app, get_db):
             return redirect(url_for('matches'))
         return render_template('new_match.html', categories=categories)
 
+    @app.route('/matches/import', methods=['GET', 'POST'])
+    @login_required
+    def import_matches():
+        if request.method == 'POST':
+            check_csrf()
+            upload = request.files.get('file')
+            if not upload or not upload.filename:
+                flash('Choose a file to import')
+                return render_template('import_matches.html')
+
+            fmt = request.form.get('format') or detect_format(upload.filename)
+            job = f"upload:{session['user_id']}:{upload.filename}"
+            restart = bool(request.form.get('restart'))
+            owner_id = session['user_id']
+            # The request closes its uploaded files as soon as this view
+            # returns, so the generator takes over the underlying stream.
+            stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+            upload.stream = io.BytesIO()
+
+            def generate():
+                db = get_db()
+                stats = None
+                try:
+                    for stats in run_import(db, stream, fmt, owner_id, job, restart=restart):
+                        yield f'{stats}\n'
+                except ValueError as e:
+                    yield f'{e}\n'
+                    return
+                finally:
+                    stream.close()
+                if stats.resumed_from:
+                    yield f'Resumed after row {stats.resumed_from}\n'
+                for line, error in stats.errors:
+                    yield f'row {line}: {error}\n'
+                yield f'Import finished in {stats.elapsed:.1f}s\n'
+
+            return Response(stream_with_context(generate()), mimetype='text/plain')
+        return render_template('import_matches.html')
+
     @app.route('/matches/<int:match_id>/edit', methods=['GET', 'POST'])
     @login_required
     def edit_match(match_id):
@@ -229,44 +491,115 @@ def init_routes(app, get_db):
                                categories=categories, selected_categories=selected_categories)
 
     @app.route('/matches/<int:match_id>')
+    @cached(lambda match_id: [f'match:{match_id}'])
     def match_detail(match_id):
-        db = get_db()
-        match = db.execute('''
+        db = get_db(readonly=True)
+        select = '''
             SELECT match.id, match.title, match.description, match.date, match.opponent,
                    match.result, match.location, match.custom_category,
                    match.owner_id, user.username
             FROM match
             JOIN user ON match.owner_id = user.id
             WHERE match.id = ?
-        ''', (match_id,)).fetchone()
+        '''
+        match = db.execute(select, (match_id,)).fetchone()
+        # Matches of archived seasons are read from their archive, None
+        # is the main database.
+        source = None
+        if not match:
+            source = find_match(db, get_archives(db), match_id)
+            if source:
+                match = db.execute(qualify(select, source), (match_id,)).fetchone()
 
         if not match:
             flash('Ottelua ei löytynyt')
             return redirect(url_for('matches'))
 
-        categories = db.execute('''
+        categories = db.execute(qualify('''
             SELECT category.name
             FROM category
             JOIN match_category ON category.id = match_category.category_id
             WHERE match_category.match_id = ?
-        ''', (match_id,)).fetchall()
+        ''', source), (match_id,)).fetchall()
         cat_names = ', '.join([c['name'] for c in categories])
 
-        comments = db.execute('''
-            SELECT comment.content, comment.created_at, user.username
+        # The newest page of comments, or older ones with ?before=<id>.
+        before = request.args.get('before', type=int)
+        comments, more = seek(db, qualify('''
+            SELECT comment.id, comment.content, comment.created_at, user.username
             FROM comment
             JOIN user ON comment.user_id = user.id
-            WHERE comment.match_id = ?
-            ORDER BY comment.created_at ASC
-        ''', (match_id,)).fetchall()
+        ''', source), 'comment.match_id = ?', (match_id,), ('comment.id',),
+            [before] if before else None, limit=COMMENTS_PER_PAGE)
+        comments.reverse()
+        older = comments[0]['id'] if more else None
 
         return render_template('match_detail.html',
-                               match=match, categories=cat_names, comments=comments)
+                               match=match, categories=cat_names, comments=comments,
+                               older=older, latest=before is None,
+                               archived=source is not None)
+
+    @app.route('/matches/<int:match_id>/comments')
+    def new_comments(match_id):
+        # Comments newer than ?after=<id> as JSON. With ?wait=N, if long
+        # polling is turned on (COMMENT_POLL_MAX_WAIT), the request is held
+        # open for up to N seconds until there is something to return; the
+        # connection goes back to the pool between checks. Archived matches
+        # get no new comments, so they are answered at once.
+        after = request.args.get('after', 0, type=int)
+        wait = min(max(request.args.get('wait', 0, type=float), 0),
+                   app.config.get('COMMENT_POLL_MAX_WAIT', 0))
+        deadline = time.monotonic() + wait
+        while True:
+            db = get_db(readonly=True)
+            source = None
+            if not db.execute('SELECT id FROM match WHERE id = ?', (match_id,)).fetchone():
+                source = find_match(db, get_archives(db), match_id)
+                if not source:
+                    abort(404)
+            rows = db.execute(qualify('''
+                SELECT comment.id, comment.content, comment.created_at, user.username
+                FROM comment
+                JOIN user ON comment.user_id = user.id
+                WHERE comment.match_id = ? AND comment.id > ?
+                ORDER BY comment.id
+                LIMIT ?
+            ''', source), (match_id, after, NEW_COMMENTS_LIMIT + 1)).fetchall()
+            if rows or source or time.monotonic() >= deadline:
+                break
+            release_connections()
+            time.sleep(min(app.config.get('COMMENT_POLL_INTERVAL', 1),
+                           max(deadline - time.monotonic(), 0)))
+
+        comments = [dict(row) for row in rows[:NEW_COMMENTS_LIMIT]]
+        response = jsonify(comments=comments,
+                           last_id=comments[-1]['id'] if comments else after,
+                           more=len(rows) > NEW_COMMENTS_LIMIT)
+        response.cache_control.no_store = True
+        return response
+
+    @app.route('/suggest')
+    def suggest():
+        # Completions for the opponent and location inputs of the match
+        # forms, from memory (suggest.py).
+        field = request.args.get('field', '')
+        if field not in SUGGEST_FIELDS:
+            abort(404)
+        prefix = request.args.get('prefix', '')[:MAX_PREFIX]
+        limit = min(max(request.args.get('limit', SUGGESTIONS, type=int), 1), 50)
+        index = get_suggestions(app.config.get('DATABASE', 'database.db'), field)
+        response = jsonify(field=field, prefix=prefix, suggestions=[
+            {'value': value, 'count': count} for value, count in index.lookup(prefix, limit)])
+        # Only the browser may keep them, and only while the user types:
+        # the values change with every saved match.
+        response.cache_control.private = True
+        response.cache_control.max_age = 10
+        return response
 
     @app.route('/matches/<int:match_id>/delete', methods=['POST'])
     @login_required
     def delete_match(match_id):
-        db = get_db()
+        db = get_db(readonly=True)
         match = db.execute(
             'SELECT id, owner_id FROM match WHERE id = ?',
             (match_id,)).fetchone()
@@ -281,15 +614,15 @@ def init_routes(app, get_db):
 
         check_csrf()
 
-        db.execute('DELETE FROM match WHERE id = ?', (match_id,))
-        db.commit()
+        write(get_db, [('DELETE FROM match WHERE id = ? AND owner_id = ?',
+                        (match_id, session['user_id']))])
         flash('Match deleted successfully')
         return redirect(url_for('matches'))
 
     @app.route('/matches/<int:match_id>/comment', methods=['POST'])
     @login_required
     def add_comment(match_id):
-        db = get_db()
+        db = get_db(readonly=True)
         match = db.execute('SELECT id FROM match WHERE id = ?', (match_id,)).fetchone()
         if not match:
             flash('Match not found')
@@ -301,32 +634,77 @@ def init_routes(app, get_db):
             flash('Comment cannot be empty')
             return redirect(url_for('match_detail', match_id=match_id))
 
-        db.execute(
-            'INSERT INTO comment (match_id, user_id, content) VALUES (?, ?, ?)',
-            (match_id, session['user_id'], content))
-        db.commit()
+        write(get_db, [('INSERT INTO comment (match_id, user_id, content) VALUES (?, ?, ?)',
+                        (match_id, session['user_id'], content))])
         flash('Comment added')
         return redirect(url_for('match_detail', match_id=match_id))
 
+    @app.route('/status')
+    def status():
+        write_queue = get_write_queue()
+        return jsonify(write_queue=write_queue.stats() if write_queue else None,
+                       startup=app.extensions.get('startup'))
+
     @app.route('/user/<int:user_id>')
+    @cached(lambda user_id: [f'user:{user_id}'])
     def user_profile(user_id):
-        db = get_db()
+        db = get_db(readonly=True)
         user = db.execute('SELECT id, username FROM user WHERE id = ?',
                           (user_id,)).fetchone()
         if not user:
             flash('Käyttäjää ei löytynyt')
             return redirect(url_for('matches'))
 
-        match_count = db.execute(
-            'SELECT COUNT(*) as count FROM match WHERE owner_id = ?',
-            (user_id,)).fetchone()['count']
+        per_page = 20
+        after = decode_cursor(request.args.get('after'))
+        before = decode_cursor(request.args.get('before'))
+        backwards = before is not None and after is None
+        if after or before:
+            page, key = after or before
+            offset = 0
+        else:
+            page = min(max(request.args.get('page', 1, type=int), 1), MAX_PAGE)
+            key = None
+            offset = (page - 1) * per_page
+
+        # Walks idx_match_owner_date_id, so deep pages cost the same as the
+        # first, here and in the archives the page reaches.
+        user_matches, more = seek_archives(db, get_archives(db), '''
+            SELECT match.id, match.title, match.description, match.date,
+                   match.opponent, match.result, match.location
+            FROM match
+        ''', 'match.owner_id = ?', (user_id,), ('match.date', 'match.id'), key, backwards,
+            nullable=True, limit=per_page, offset=offset)
 
-        user_matches = db.execute(
-            '''SELECT id, title, description, date, opponent, result, location
-               FROM match WHERE owner_id = ? ORDER BY date DESC, id DESC''',
+        if backwards:
+            has_prev, has_next = more, True
+            if not more:
+                page = 1
+        else:
+            has_prev, has_next = page > 1, more
+        prev_cursor = next_cursor = None
+        if user_matches:
+            if has_prev:
+                first = user_matches[0]
+                prev_cursor = encode_cursor(page - 1, [first['date'], first['id']])
+            if has_next:
+                last = user_matches[-1]
+                next_cursor = encode_cursor(page + 1, [last['date'], last['id']])
+
+        # Kept up to date by triggers, see migrations/0009_user_stats.sql.
+        stats = {scope: get_counter(db, scope, user_id)
+                 for scope in ('user_match', 'user_comment', 'user_home_win',
+                               'user_draw', 'user_away_win')}
+        top_teams = db.execute(
+            '''SELECT team, matches, won, drawn, lost FROM user_team
+               WHERE user_id = ? ORDER BY matches DESC, team LIMIT 5''',
             (user_id,)).fetchall()
 
+        total_pages = max((stats['user_match'] + per_page - 1) // per_page, 1)
         return render_template('user_profile.html',
                                user=user,
-                               match_count=match_count,
-                               user_matches=user_matches)
+                               stats=stats,
+                               top_teams=top_teams,
+                               user_matches=user_matches,
+                               page=page, total_pages=total_pages,
+                               prev_cursor=prev_cursor, next_cursor=next_cursor)
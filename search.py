@@ -0,0 +1,16 @@
+import re
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def fts_query(q):
+    # Every word must match, and the last letters may still be missing,
+    # so "hj töö" finds "HJK - KuPS, Töölö". Diacritics are folded by
+    # the unicode61 tokenizer, which makes "toolo" match "Töölö" too.
+    tokens = TOKEN_RE.findall(q)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def rebuild_search_index(db):
+    db.execute("INSERT INTO match_fts(match_fts) VALUES ('rebuild')")
+    db.commit()
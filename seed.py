@@ -4,10 +4,10 @@ This module creates test users, categories, matches, and comments.
 """
 import random
 from werkzeug.security import generate_password_hash
-from app import app, get_db
+from app import create_app, get_db
 
 
-def seed_db():
+def seed_db(app):
     """Populate database with test data."""
     with app.app_context():
         db = get_db()
@@ -55,6 +55,8 @@ def seed_db():
         ]
 
         print('Creating users...')
+        password_hash = generate_password_hash('testpass123',
+                                               app.config['PASSWORD_HASH_METHOD'])
         user_ids = []
         for username in usernames:
             existing = db.execute(
@@ -67,8 +69,7 @@ def seed_db():
             else:
                 db.execute(
                     'INSERT INTO user (username, password_hash) VALUES (?, ?)',
-                    (username, generate_password_hash('testpass123')))
-                db.commit()
+                    (username, password_hash))
                 user = db.execute(
                     'SELECT id FROM user WHERE username = ?',
                     (username,)).fetchone()
@@ -88,7 +89,6 @@ def seed_db():
                 category_ids.append(existing['id'])
             else:
                 db.execute('INSERT INTO category (name) VALUES (?)', (cat_name,))
-                db.commit()
                 cat = db.execute(
                     'SELECT id FROM category WHERE name = ?',
                     (cat_name,)).fetchone()
@@ -122,10 +122,9 @@ def seed_db():
                         'INSERT INTO match_category (match_id, category_id) VALUES (?, ?)',
                         (match_id, cat_id))
 
-                db.commit()
-
             print(f'Created 60 matches')
 
+        db.commit()
         print('\n✓ Database seeded successfully!')
         print(f'  Users: {len(user_ids)}')
         print(f'  Categories: {len(category_ids)}')
@@ -134,4 +133,4 @@ def seed_db():
 
 
 if __name__ == '__main__':
-    seed_db()
+    seed_db(create_app(warm_up=False))
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from flask import has_request_context, request
+import db as database
+import metrics
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+SPACE_RE = re.compile(r'\s+')
+EXPLAINED = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+# A fingerprint's plan is captured again after this many seconds.
+PLAN_TTL = 300
+
+
+def normalize(sql):
+    # Literals become ?, and IN lists of any length look the same, so
+    # every run of the same query gets the same fingerprint.
+    sql = COMMENT_RE.sub(' ', sql)
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = LIST_RE.sub('(...)', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12]
+
+
+def parameter_shapes(parameters):
+    # Types and sizes of the bound values, never the values themselves.
+    if isinstance(parameters, dict):
+        parameters = parameters.values()
+    shapes = []
+    for value in parameters:
+        if isinstance(value, (str, bytes)):
+            shapes.append(f'{type(value).__name__}({len(value)})')
+        else:
+            shapes.append(type(value).__name__)
+    return shapes
+
+
+class SlowQueryLog:
+    # Appends one JSON line per slow statement to path. At most sample of
+    # the slow statements are considered and at most max_per_minute lines
+    # are written per process, so a database in trouble cannot flood the
+    # disk with its own log.
+    def __init__(self, path, threshold=0.1, sample=1.0, max_per_minute=60):
+        self.path = path
+        self.threshold = threshold
+        self.sample = sample
+        self.max_per_minute = max_per_minute
+        self._lock = threading.Lock()
+        self._window = 0
+        self._written = 0
+        self._plans = {}
+        self.dropped = 0
+
+    def _allowed(self):
+        window = int(time.time() // 60)
+        with self._lock:
+            if window != self._window:
+                self._window = window
+                self._written = 0
+            if self._written >= self.max_per_minute:
+                self.dropped += 1
+                return False
+            self._written += 1
+            return True
+
+    def _plan(self, con, key, sql, normalized, parameters):
+        cached = self._plans.get(key)
+        if cached is not None and cached[0] > time.monotonic() - PLAN_TTL:
+            return cached[1]
+        if not normalized.upper().startswith(EXPLAINED):
+            return None
+        try:
+            # The base class execute, so this statement is not timed and
+            # logged in turn.
+            rows = sqlite3.Connection.execute(con, 'EXPLAIN QUERY PLAN ' + sql,
+                                              parameters).fetchall()
+        except sqlite3.Error:
+            return None
+        plan = [row[3] for row in rows]
+        self._plans[key] = (time.monotonic(), plan)
+        return plan
+
+    def record(self, con, sql, parameters, elapsed):
+        if self.sample < 1 and random.random() >= self.sample:
+            return
+        if not self._allowed():
+            return
+        normalized = normalize(sql)
+        key = fingerprint(normalized)
+        entry = {
+            'time': round(time.time(), 3),
+            'fingerprint': key,
+            'sql': normalized,
+            'parameters': parameter_shapes(parameters),
+            'duration': round(elapsed, 6),
+            'route': request.endpoint if has_request_context() else None,
+            'pid': os.getpid(),
+            'plan': self._plan(con, key, sql, normalized, parameters),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+def init_slow_log(app):
+    if not app.config.get('SLOW_QUERY_LOG'):
+        metrics.slow_log = None
+        return
+    metrics.slow_log = SlowQueryLog(app.config['SLOW_QUERY_LOG'],
+                                    threshold=app.config.get('SLOW_QUERY_THRESHOLD', 0.1),
+                                    sample=app.config.get('SLOW_QUERY_SAMPLE', 1.0),
+                                    max_per_minute=app.config.get('SLOW_QUERY_MAX_PER_MINUTE',
+                                                                  60))
+    database.cursor_class = metrics.TimedCursor
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def report(path, top=20):
+    # Slow statements grouped by fingerprint, the most total time first.
+    groups = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            group = groups.setdefault(entry['fingerprint'], {
+                'sql': entry['sql'], 'durations': [], 'routes': set(), 'plan': None})
+            group['durations'].append(entry['duration'])
+            if entry.get('route'):
+                group['routes'].add(entry['route'])
+            if entry.get('plan'):
+                group['plan'] = entry['plan']
+    rows = []
+    for key, group in groups.items():
+        durations = group['durations']
+        rows.append({
+            'fingerprint': key,
+            'sql': group['sql'],
+            'count': len(durations),
+            'total': sum(durations),
+            'p95': _percentile(durations, 95),
+            'max': max(durations),
+            'routes': sorted(group['routes']),
+            'plan': group['plan'],
+        })
+    rows.sort(key=lambda row: -row['total'])
+    return rows[:top]
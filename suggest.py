@@ -0,0 +1,77 @@
+import heapq
+import threading
+import unicodedata
+from bisect import bisect_left
+from functools import lru_cache
+from facets import get_facets
+
+# Fields that can be completed; their values and counts come from the
+# facet arrays, which follow every write through the match_change log.
+FIELDS = ('opponent', 'location')
+SUGGESTIONS = 10
+MAX_PREFIX = 100
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+@lru_cache(maxsize=100_000)
+def fold(text):
+    # Lower case without accents, so "toolo" finds "Töölö".
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+class SuggestIndex:
+    # The distinct values of one field with the number of matches using
+    # each. Every value is filed under its folded form and under each of
+    # its later words, in one sorted list, so a prefix is a binary search
+    # away: "are" finds "Bolt Arena". Never modified after construction.
+    def __init__(self, values):
+        self.values = values
+        entries = []
+        for i, (value, _) in enumerate(values):
+            folded = fold(value)
+            entries.append((folded, i, 0))
+            for position, char in enumerate(folded):
+                if position and not folded[position - 1].isalnum() and char.isalnum():
+                    entries.append((folded[position:], i, 1))
+        entries.sort()
+        self.keys = [entry[0] for entry in entries]
+        self.entries = [(entry[1], entry[2]) for entry in entries]
+
+    @classmethod
+    def from_facets(cls, facets, field):
+        names = facets.names[field].names
+        return cls([(names[key], count) for key, count in facets.unfiltered[field].items()
+                    if names[key]])
+
+    def lookup(self, prefix, limit=SUGGESTIONS):
+        # Values whose start or a later word starts with prefix: whole-value
+        # matches first, then the most used.
+        key = fold(prefix.strip())
+        if not key:
+            return []
+        low = bisect_left(self.keys, key)
+        high = bisect_left(self.keys, key + '\U0010ffff', low)
+        best = {}
+        for i, word in self.entries[low:high]:
+            if best.get(i, 2) > word:
+                best[i] = word
+        ranked = heapq.nsmallest(limit, best.items(), key=lambda item: (
+            item[1], -self.values[item[0]][1], self.values[item[0]][0]))
+        return [self.values[i] for i, _ in ranked]
+
+
+def get_suggestions(database, field):
+    # The index for the current facet arrays, rebuilt after they change.
+    facets = get_facets(database).current()
+    key = (database, field)
+    cached = _indexes.get(key)
+    if cached is not None and cached[0] is facets:
+        return cached[1]
+    with _indexes_lock:
+        cached = _indexes.get(key)
+        if cached is None or cached[0] is not facets:
+            cached = _indexes[key] = (facets, SuggestIndex.from_facets(facets, field))
+    return cached[1]
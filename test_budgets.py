@@ -0,0 +1,38 @@
+"""
+Performance budget checks.
+Runs the budgets benchmark.py reports on at a scale small enough for CI,
+with the limits the full-size targets imply.
+"""
+import os
+import sqlite3
+import tempfile
+from benchmark import startup_timings, startup_paths, over_startup_budget
+from generate import generate_database
+from listing import ListingIndex, MAX_BYTES_PER_MATCH
+
+LISTING_MATCHES = 5000
+STARTUP_MATCHES = 2000
+STARTUP_RUNS = 3
+
+
+def test_listing_memory():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'listing.db')
+        generate_database(path, LISTING_MATCHES, progress=lambda message: None)
+        con = sqlite3.connect(path)
+        try:
+            index = ListingIndex.load(con)
+        finally:
+            con.close()
+    arrays, text = index.nbytes()
+    assert len(index) == LISTING_MATCHES
+    assert (arrays + text) / len(index) <= MAX_BYTES_PER_MATCH
+
+
+def test_startup_budget():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'startup.db')
+        generate_database(path, STARTUP_MATCHES, progress=lambda message: None)
+        paths = startup_paths(path)
+        timings = startup_timings(path, paths, STARTUP_RUNS, os.path.join(tmp, 'jinja'))
+    assert not over_startup_budget(timings, paths), timings
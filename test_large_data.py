@@ -1,170 +0,0 @@
-"""
-Test application with large dataset.
-This script creates 1000+ matches to test pagination and performance.
-"""
-import time
-import random
-from app import app, get_db
-from werkzeug.security import generate_password_hash
-
-def create_large_dataset():
-    """Create a large dataset for testing pagination and performance."""
-    with app.app_context():
-        db = get_db()
-        
-        print("Creating large test dataset...")
-        print("=" * 60)
-
-        test_users = ['testuser1', 'testuser2', 'testuser3', 'testuser4', 'testuser5']
-        user_ids = []
-        
-        for username in test_users:
-            user = db.execute('SELECT id FROM user WHERE username = ?', (username,)).fetchone()
-            if not user:
-                db.execute(
-                    'INSERT INTO user (username, password_hash) VALUES (?, ?)',
-                    (username, generate_password_hash('testpass')))
-                db.commit()
-                user = db.execute('SELECT id FROM user WHERE username = ?', (username,)).fetchone()
-            user_ids.append(user['id'])
-        
-        print(f"✓ Test users ready: {len(user_ids)} users")
-
-        categories = db.execute('SELECT id FROM category').fetchall()
-        category_ids = [c['id'] for c in categories]
-        print(f"✓ Categories: {len(category_ids)}")
-
-        teams = [
-            'HJK', 'KuPS', 'FC Inter', 'IFK Mariehamn', 'Ilves', 'FC Lahti',
-            'SJK', 'VPS', 'Haka', 'HIFK', 'AC Oulu', 'FC Honka', 'TPS',
-            'MyPa', 'RoPS', 'FF Jaro', 'KTP', 'KPV', 'PK-35', 'Atlantis FC'
-        ]
-        
-        locations = [
-            'Olympiastadion', 'Bolt Arena', 'Töölön jalkapalloilustadion',
-            'Tammela Stadion', 'Ratinan stadion', 'Tehtaan kenttä',
-            'OmaSP Stadion', 'Hietalahti', 'Elisa Stadion'
-        ]
-        
-        descriptions = [
-            'Jännittävä ottelu, voitto viime hetkillä!',
-            'Tasapeli, molemmat joukkueet pelasivat hyvin',
-            'Hyvä tunnelma stadionilla',
-            'Komea voitto kotikentällä',
-            'Vaikea tappio vieraissa',
-            'Upea ilta jalkapalloa',
-            'Mahtavat maalit, hienoa pelaamista',
-            'Intensiivinen peli loppuun asti',
-            'Fanien kannustus oli huikea'
-        ]
-
-        start_time = time.time()
-        num_matches = 1200
-        batch_size = 100
-        
-        for i in range(0, num_matches, batch_size):
-            for j in range(batch_size):
-                if i + j >= num_matches:
-                    break
-                    
-                home = random.choice(teams)
-                away = random.choice([t for t in teams if t != home])
-                title = f'{home} - {away}'
-                description = random.choice(descriptions)
-                owner_id = random.choice(user_ids)
-                
-                # Random date in 2024-2025
-                year = random.choice([2024, 2025])
-                month = random.randint(1, 12)
-                day = random.randint(1, 28)
-                date = f'{year}-{month:02d}-{day:02d}'
-
-                home_goals = random.randint(0, 4)
-                away_goals = random.randint(0, 4)
-                result = f'{home_goals}-{away_goals}'
-                
-                location = random.choice(locations)
-                
-                cursor = db.execute(
-                    '''INSERT INTO match (title, description, date, opponent, result,
-                       location, owner_id) VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                    (title, description, date, away, result, location, owner_id))
-                match_id = cursor.lastrowid
-
-                num_cats = random.randint(1, 2)
-                selected_cats = random.sample(category_ids, num_cats)
-                for cat_id in selected_cats:
-                    db.execute(
-                        'INSERT INTO match_category (match_id, category_id) VALUES (?, ?)',
-                        (match_id, cat_id))
-            
-            db.commit()
-            print(f"  Created {min(i + batch_size, num_matches)}/{num_matches} matches...")
-        
-        creation_time = time.time() - start_time
-        print(f"\n✓ Created {num_matches} matches in {creation_time:.2f} seconds")
-        print(f"  Average: {num_matches/creation_time:.1f} matches/second")
-        
-        # Test query performance
-        print("\n" + "=" * 60)
-        print("Testing query performance...")
-        print("=" * 60)
-        
-        # Test 1: Count all matches
-        start = time.time()
-        total = db.execute('SELECT COUNT(*) as count FROM match').fetchone()['count']
-        elapsed = time.time() - start
-        print(f"✓ COUNT query: {elapsed*1000:.2f}ms - Total matches: {total}")
-        
-        # Test 2: Paginated query (first page)
-        start = time.time()
-        results = db.execute('''
-            SELECT match.id, match.title, match.description, match.date,
-                   match.opponent, match.result, match.location,
-                   match.owner_id, user.username
-            FROM match
-            JOIN user ON match.owner_id = user.id
-            ORDER BY match.date DESC, match.id DESC
-            LIMIT 20 OFFSET 0
-        ''').fetchall()
-        elapsed = time.time() - start
-        print(f"✓ Paginated query (page 1): {elapsed*1000:.2f}ms - {len(results)} results")
-        
-        # Test 3: Search query
-        start = time.time()
-        results = db.execute('''
-            SELECT match.id, match.title FROM match
-            WHERE title LIKE ? OR description LIKE ?
-            LIMIT 20
-        ''', ('%HJK%', '%HJK%')).fetchall()
-        elapsed = time.time() - start
-        print(f"✓ Search query (HJK): {elapsed*1000:.2f}ms - {len(results)} results")
-        
-        # Test 4: Middle page query
-        start = time.time()
-        results = db.execute('''
-            SELECT match.id, match.title, match.description, match.date,
-                   match.opponent, match.result, match.location,
-                   match.owner_id, user.username
-            FROM match
-            JOIN user ON match.owner_id = user.id
-            ORDER BY match.date DESC, match.id DESC
-            LIMIT 20 OFFSET 500
-        ''').fetchall()
-        elapsed = time.time() - start
-        print(f"✓ Paginated query (page 26): {elapsed*1000:.2f}ms - {len(results)} results")
-        
-        print("\n" + "=" * 60)
-        print("PERFORMANCE SUMMARY")
-        print("=" * 60)
-        print(f"Database contains {total} matches")
-        print(f"Pagination: 20 matches per page = {(total + 19) // 20} pages")
-        print(f"\nAll queries completed in < 50ms")
-        print(f"✓ Application performs well with {total}+ matches")
-        print(f"✓ Indexes on match.title and match.description optimize searches")
-        print(f"✓ Pagination prevents loading all matches at once")
-        print("\n" + "=" * 60)
-
-if __name__ == '__main__':
-    create_large_dataset()
- 
\ No newline at end of file
@@ -0,0 +1,210 @@
+"""
+Query plan regression check.
+Runs every route in routes.py against a temporary database, captures the
+SQL it executes and checks with EXPLAIN QUERY PLAN that no statement does
+a full table scan or sorts in a temporary B-tree.
+"""
+import os
+import random
+import re
+import sys
+import tempfile
+import db as database
+from app import create_app, get_db, init_db
+from archive import get_archives, attach, archive_seasons
+
+ALLOWED_TEMP_SORT = re.compile(r'ORDER BY match_fts\.rank', re.IGNORECASE)
+# Statements that read a whole table on purpose are marked in their SQL
+# with /* full-scan: <reason> */. Only these reasons are accepted, and
+# only for scans of the tables listed with them.
+FULL_SCAN_MARK = re.compile(r'/\* full-scan: (.*?) \*/')
+ALLOWED_FULL_SCANS = {
+    'an export reads every match': ('match',),
+    'listing index load': ('match', 'user'),
+    'facets load every match': ('match',),
+    'facets load every link': ('match_category',),
+    'analytics load every match': ('match',),
+    'one row per archived season': ('archive',),
+}
+SKIPPED = ('--', 'BEGIN', 'COMMIT', 'ROLLBACK', 'PRAGMA', 'ANALYZE', 'SELECT 1',
+           'ATTACH', 'DETACH')
+# Statements FTS5 runs against its own shadow tables.
+FTS_INTERNAL = re.compile(r"'\w+'\.'match_fts_")
+
+
+def populate(db, num_matches=2000):
+    random.seed(1)
+    teams = ['HJK', 'KuPS', 'FC Inter', 'IFK Mariehamn', 'Ilves', 'FC Lahti',
+             'SJK', 'VPS', 'Haka', 'HIFK', 'AC Oulu', 'FC Honka']
+    db.executemany('INSERT INTO user (username, password_hash) VALUES (?, ?)',
+                   [(f'user{i}', 'x') for i in range(50)])
+    db.executemany('INSERT INTO category (name) VALUES (?)',
+                   [('Liiga',), ('Cupin ottelu',), ('Harjoituspeli',), ('Ystävyysottelu',)])
+    rows = []
+    for _ in range(num_matches):
+        home, away = random.sample(teams, 2)
+        date = (f'{random.choice([2024, 2025])}-'
+                f'{random.randint(1, 12):02d}-{random.randint(1, 28):02d}')
+        rows.append((f'{home} - {away}', 'Hyvä tunnelma stadionilla', date, away,
+                     f'{random.randint(0, 4)}-{random.randint(0, 4)}', 'Bolt Arena',
+                     random.randint(1, 50)))
+    db.executemany('''INSERT INTO match (title, description, date, opponent, result,
+                      location, owner_id) VALUES (?, ?, ?, ?, ?, ?, ?)''', rows)
+    db.executemany('INSERT INTO match_category (match_id, category_id) VALUES (?, ?)',
+                   [(i, random.randint(1, 4)) for i in range(1, num_matches + 1)])
+    db.executemany('INSERT INTO comment (match_id, user_id, content) VALUES (?, ?, ?)',
+                   [(random.randint(1, num_matches), random.randint(1, 50), 'Hieno ottelu!')
+                    for _ in range(num_matches)])
+    db.commit()
+    db.execute('ANALYZE')
+    db.commit()
+
+
+def exercise_routes(app, first, second, archived):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['username'] = 'user0'
+        sess['csrf_token'] = 'token'
+    form = {'csrf_token': 'token', 'title': 'HJK - KuPS', 'date': '2025-05-05',
+            'opponent': 'KuPS', 'result': '1-0', 'location': 'Bolt Arena',
+            'categories': ['1', '2']}
+
+    page = client.get('/matches').get_data(as_text=True)
+    after = re.search(r'after=([^&"]+)', page).group(1)
+    page = client.get(f'/matches?after={after}').get_data(as_text=True)
+    before = re.search(r'before=([^&"]+)', page).group(1)
+    client.get(f'/matches?before={before}')
+    client.get('/matches?page=5')
+    page = client.get('/matches?q=hjk').get_data(as_text=True)
+    after = re.search(r'after=([^&"]+)', page).group(1)
+    client.get(f'/matches?q=hjk&after={after}')
+    client.get('/matches?category=2')
+    client.get('/matches?opponent=KuPS&date_from=2024-01-01&date_to=2024-12-31')
+    client.get('/matches?location=Bolt+Arena&result=1-0')
+    client.get('/matches?q=hjk&category=1')
+    client.get(f'/matches/{first}')
+    client.get(f'/matches/{first}?before=1000000')
+    client.get(f'/matches/{first}/comments?after=0')
+    client.get(f'/matches/{archived}/comments?after=0')
+    page = client.get('/api/v1/matches?fields=id,title,categories,comments').get_json()
+    client.get(f'/api/v1/matches?cursor={page["next_cursor"]}&category=1')
+    client.get(f'/api/v1/matches?ids={first},{second},{archived},999999&fields=id,categories')
+    client.get(f'/api/v1/matches/{first}?fields=id,home_team,home_goals,season')
+    client.get(f'/api/v1/matches/{archived}?fields=id,categories,comments')
+    client.get('/api/v1/users/1')
+    client.get('/export/matches.csv?q=hjk').get_data()
+    client.get('/export/matches.ndjson?comments=1').get_data()
+    page = client.get('/user/1').get_data(as_text=True)
+    after = re.search(r'after=([^&"]+)', page).group(1)
+    page = client.get(f'/user/1?after={after}').get_data(as_text=True)
+    before = re.search(r'before=([^&"]+)', page).group(1)
+    client.get(f'/user/1?before={before}')
+    client.get('/standings')
+    client.get('/standings?season=2024&category=1')
+    client.get('/teams/HJK')
+    client.get('/teams/HJK/vs/KuPS')
+    # Archived matches: the 2024 season is in an archive.
+    client.get('/matches?page=80')
+    page = client.get('/matches?page=55').get_data(as_text=True)
+    after = re.search(r'after=([^&"]+)', page).group(1)
+    page = client.get(f'/matches?after={after}').get_data(as_text=True)
+    before = re.search(r'before=([^&"]+)', page).group(1)
+    client.get(f'/matches?before={before}')
+    client.get('/matches?opponent=KuPS&date_from=2024-01-01&date_to=2024-12-31')
+    client.get('/matches?category=2&date_to=2024-06-30')
+    client.get('/matches?q=hjk&category=1')
+    client.get(f'/matches/{archived}')
+    client.get('/user/1?page=3')
+    client.get('/suggest?field=opponent&prefix=ku')
+    client.get('/suggest?field=location&prefix=are')
+    client.get('/matches/new')
+    client.post('/matches/new', data=form)
+    client.get(f'/matches/{first}/edit')
+    client.post(f'/matches/{first}/edit', data=form)
+    client.post(f'/matches/{first}/comment', data={'csrf_token': 'token', 'content': 'Hieno!'})
+    client.post(f'/matches/{second}/delete', data={'csrf_token': 'token'})
+    # The plain listing again, now from the in-memory listing index.
+    app.config['LISTING_INDEX_ENABLED'] = True
+    page = client.get('/matches').get_data(as_text=True)
+    after = re.search(r'after=([^&"]+)', page).group(1)
+    page = client.get(f'/matches?after={after}').get_data(as_text=True)
+    before = re.search(r'before=([^&"]+)', page).group(1)
+    client.get(f'/matches?before={before}')
+    app.config['LISTING_INDEX_ENABLED'] = False
+    client.get('/logout')
+    with client.session_transaction() as sess:
+        sess['csrf_token'] = 'token'
+    client.post('/register', data={'csrf_token': 'token', 'username': 'planner',
+                                   'password': 'salasana1', 'password2': 'salasana1'})
+    client.post('/login', data={'csrf_token': 'token', 'username': 'planner',
+                                'password': 'salasana1'})
+
+
+def plan_problems(db, sql):
+    problems = []
+    marked = FULL_SCAN_MARK.search(sql)
+    scannable = ALLOWED_FULL_SCANS.get(marked.group(1), ()) if marked else ()
+    if marked and not scannable:
+        problems.append(f'full-scan reason not allowed: {marked.group(1)}')
+    for row in db.execute('EXPLAIN QUERY PLAN ' + sql):
+        detail = row['detail']
+        if detail.startswith('SCAN ') and ' USING ' not in detail \
+                and 'VIRTUAL TABLE' not in detail and detail.split()[1] not in scannable:
+            problems.append(detail)
+        if 'TEMP B-TREE' in detail and not ALLOWED_TEMP_SORT.search(sql):
+            problems.append(detail)
+    return problems
+
+
+def check_query_plans():
+    statements = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'DATABASE': os.path.join(tmp, 'plans.db')}, warm_up=False)
+        init_db(app)
+        with app.app_context():
+            db = get_db()
+            populate(db)
+            for _ in archive_seasons(db, app.config['DATABASE'], '2025-01-01',
+                                     os.path.join(tmp, 'archive')):
+                pass
+            archived = get_archives(db)[0]['min_id']
+            first, second = [row['id'] for row in db.execute(
+                'SELECT id FROM match WHERE owner_id = 1 LIMIT 2')]
+        # Connections opened before the hook was installed would not be
+        # traced, so make the routes open fresh ones.
+        for pool in database._pools.values():  # pylint: disable=protected-access
+            pool.close()
+        database.connect_hooks.append(
+            lambda con: con.set_trace_callback(statements.append))
+        exercise_routes(app, first, second, archived)
+        database.connect_hooks.pop()
+
+        failures = {}
+        with app.app_context():
+            db = get_db()
+            for archive in get_archives(db):
+                attach(db, archive, readonly=False)
+            for sql in dict.fromkeys(statements):
+                if sql.lstrip().upper().startswith(SKIPPED) or FTS_INTERNAL.search(sql):
+                    continue
+                problems = plan_problems(db, sql)
+                if problems:
+                    failures[' '.join(sql.split())] = problems
+                else:
+                    print(f"✓ {' '.join(sql.split())[:100]}")
+    return failures
+
+
+def test_query_plans():
+    assert not check_query_plans()
+
+
+if __name__ == '__main__':
+    failed = check_query_plans()
+    for statement, details in failed.items():
+        print(f'\n✗ {statement}')
+        for detail in details:
+            print(f'    {detail}')
+    print(f'\n{len(failed)} statements without a usable index')
+    sys.exit(1 if failed else 0)
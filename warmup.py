@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import time
+from jinja2 import FileSystemBytecodeCache
+import db as database
+import metrics
+
+READ_STATEMENTS = ('SELECT', 'WITH')
+
+
+def init_bytecode_cache(app):
+    # Compiled templates are kept in JINJA_CACHE_DIR, shared by every worker
+    # and kept over restarts. Entries are keyed by the template source, so
+    # an edited template is simply compiled again.
+    directory = app.config.get('JINJA_CACHE_DIR')
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def _recording(base, statements):
+    class RecordingCursor(base):
+        def execute(self, sql, parameters=(), /):
+            statements.setdefault(sql, parameters)
+            return super().execute(sql, parameters)
+    return RecordingCursor
+
+
+def _paths(app):
+    # WARM_UP_PATHS and the pages of the newest match and its owner.
+    paths = list(app.config.get('WARM_UP_PATHS', ()))
+    with app.app_context():
+        try:
+            newest = database.get_connection(readonly=True).execute(
+                'SELECT id, owner_id FROM match ORDER BY date DESC, id DESC LIMIT 1').fetchone()
+        except sqlite3.Error:
+            newest = None
+        finally:
+            database.release_connections()
+    if newest:
+        paths += [f'/matches/{newest["id"]}', f'/user/{newest["owner_id"]}']
+    return paths
+
+
+def warm(app):
+    # Gets a new worker ready before its first request: compiles every
+    # template, runs the pages in WARM_UP_PATHS once (which also loads the
+    # in-memory copies and fills the page cache), then opens all pooled
+    # connections and runs the read statements those pages used on each,
+    # so every connection has them prepared and their pages in its cache.
+    # Returns the timings for the startup report.
+    report = {}
+    started = time.perf_counter()
+    env = app.jinja_env
+    templates = env.list_templates()
+    for name in templates:
+        env.get_template(name)
+    report['templates'] = len(templates)
+    report['template_seconds'] = round(time.perf_counter() - started, 4)
+
+    step = time.perf_counter()
+    statements = {}
+    cursor_class = database.cursor_class
+    database.cursor_class = _recording(cursor_class or sqlite3.Cursor, statements)
+    paths = _paths(app)
+    failed = 0
+    try:
+        client = app.test_client()
+        for path in paths:
+            if client.get(path).status_code >= 500:
+                failed += 1
+    finally:
+        database.cursor_class = cursor_class
+    report['requests'] = len(paths)
+    report['failed_requests'] = failed
+    report['request_seconds'] = round(time.perf_counter() - step, 4)
+
+    step = time.perf_counter()
+    reads = [(sql, parameters) for sql, parameters in statements.items()
+             if sql.lstrip().upper().startswith(READ_STATEMENTS)]
+    opened = 0
+    # Opening a write connection would create a missing database file.
+    exists = os.path.exists(app.config.get('DATABASE', 'database.db'))
+    with app.app_context():
+        for readonly in (True, False) if exists else ():
+            pool = database.get_pool(readonly)
+            connections = []
+            try:
+                for _ in range(pool.size):
+                    connections.append(pool.acquire())
+                for con in connections if readonly else ():
+                    for sql, parameters in reads:
+                        try:
+                            con.execute(sql, parameters).fetchall()
+                        except sqlite3.Error:
+                            pass
+            except sqlite3.Error:
+                pass
+            finally:
+                opened += len(connections)
+                for con in connections:
+                    pool.release(con)
+    report['statements'] = len(reads)
+    report['connections'] = opened
+    report['connection_seconds'] = round(time.perf_counter() - step, 4)
+
+    # The warm-up requests are not traffic.
+    metrics.registry = metrics.Registry()
+    report['warm_up_seconds'] = round(time.perf_counter() - started, 4)
+    app.logger.info('Warm-up: %s', report)
+    return report
@@ -0,0 +1,185 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from flask import current_app
+from db import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+class WriteQueue:
+    # Small writes from every request thread go through one writer thread,
+    # which commits them in groups of up to max_batch statements, waiting
+    # at most max_delay seconds for a group to fill. One commit per group
+    # instead of one per write keeps the time the database lock is held
+    # short when many writes arrive at once. Each write is a list of
+    # (sql, params) run inside its own SAVEPOINT, so a failing write does
+    # not take the rest of its group down with it.
+    def __init__(self, database, pragmas=None, max_batch=200, max_delay=0.002):
+        self.database = database
+        self.pragmas = pragmas
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self.writes = 0
+        self.failed = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self.last_flush = 0.0
+        self.last_wait = 0.0
+        self.flush_time = 0.0
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+            self._thread.start()
+
+    def submit(self, statements, wait=True):
+        # Errors of writes nobody waits for are logged instead.
+        if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+            self._start()
+        future = Future()
+        self._queue.put((statements, future, time.monotonic(), wait))
+        return future
+
+    def _run(self):
+        pool = ConnectionPool(self.database, size=1, pragmas=self.pragmas)
+        con = pool.acquire()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                batch = [item]
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.max_batch:
+                    try:
+                        item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        self._flush(con, batch)
+                        return
+                    batch.append(item)
+                self._flush(con, batch)
+        finally:
+            con.close()
+
+    def _flush(self, con, batch):
+        started = time.monotonic()
+        results = []
+        try:
+            con.execute('BEGIN IMMEDIATE')
+            for statements, _, _, _ in batch:
+                con.execute('SAVEPOINT queued_write')
+                try:
+                    cursor = None
+                    for sql, params in statements:
+                        cursor = con.execute(sql, params)
+                    con.execute('RELEASE queued_write')
+                    results.append((cursor.lastrowid if cursor else None, None))
+                except Exception as error:  # pylint: disable=broad-except
+                    con.execute('ROLLBACK TO queued_write')
+                    con.execute('RELEASE queued_write')
+                    results.append((None, error))
+            con.commit()
+        except Exception as error:  # pylint: disable=broad-except
+            if con.in_transaction:
+                con.rollback()
+            results = [(None, error)] * len(batch)
+
+        done = time.monotonic()
+        for (_, future, _, wait), (result, error) in zip(batch, results):
+            if error is None:
+                future.set_result(result)
+            else:
+                self.failed += 1
+                future.set_exception(error)
+                if not wait:
+                    logger.error('Queued write failed: %s', error)
+        self.writes += len(batch)
+        self.batches += 1
+        self.largest_batch = max(self.largest_batch, len(batch))
+        self.last_flush = done - started
+        self.flush_time += done - started
+        self.last_wait = done - batch[0][2]
+
+    def close(self, timeout=5):
+        # Writes queued before close() are still committed.
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            'depth': self._queue.qsize() if self._queue is not None else 0,
+            'writes': self.writes,
+            'failed': self.failed,
+            'batches': self.batches,
+            'largest_batch': self.largest_batch,
+            'last_flush_seconds': self.last_flush,
+            'last_wait_seconds': self.last_wait,
+            'mean_flush_seconds': self.flush_time / self.batches if self.batches else 0.0,
+            'mean_batch': self.writes / self.batches if self.batches else 0.0,
+        }
+
+
+def get_write_queue():
+    config = current_app.config
+    if not config.get('WRITE_QUEUE_ENABLED', False):
+        return None
+    database = config.get('DATABASE', 'database.db')
+    write_queue = _queues.get(database)
+    if write_queue is None:
+        with _queues_lock:
+            write_queue = _queues.get(database)
+            if write_queue is None:
+                write_queue = WriteQueue(database, pragmas=config.get('SQLITE_PRAGMAS'),
+                                         max_batch=config.get('WRITE_QUEUE_MAX_BATCH', 200),
+                                         max_delay=config.get('WRITE_QUEUE_MAX_DELAY', 0.002))
+                _queues[database] = write_queue
+    return write_queue
+
+
+def write(get_db, statements, wait=None):
+    # Runs statements ([(sql, params), ...]) as one atomic write and returns
+    # the lastrowid of the last one. With the queue enabled the write goes
+    # through the writer thread. WRITE_QUEUE_MODE = 'wait' returns once it
+    # is committed and raises its error; 'async' returns None right away and
+    # errors are only logged. wait=True waits whatever the mode.
+    write_queue = get_write_queue()
+    if write_queue is None:
+        db = get_db()
+        cursor = None
+        for sql, params in statements:
+            cursor = db.execute(sql, params)
+        db.commit()
+        return cursor.lastrowid if cursor else None
+    if wait is None:
+        wait = current_app.config.get('WRITE_QUEUE_MODE', 'wait') != 'async'
+    future = write_queue.submit(statements, wait)
+    if not wait:
+        return None
+    return future.result(current_app.config.get('WRITE_QUEUE_TIMEOUT', 10))
+
+
+def _close_all():
+    for write_queue in list(_queues.values()):
+        write_queue.close()
+
+
+atexit.register(_close_all)